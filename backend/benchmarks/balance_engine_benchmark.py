@@ -0,0 +1,117 @@
+"""Compare the ledger and columnar balance engines on a synthetic dataset.
+
+Run from backend/:
+
+    python benchmarks/balance_engine_benchmark.py --expenses 200000 --runs 5
+
+Both engines answer the same calls (group balances, user balances, all
+user totals) and their results are checked to be identical. The report also
+times the aggregation step on its own: the same split legs summed by a
+per-row Python loop and by columnar_services.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from datagen import generate, parse_range
+
+
+def median_seconds(fn, runs: int):
+    samples = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 3), result
+
+
+def python_pairwise(rows) -> list[tuple[int, int, int]]:
+    # The row-at-a-time aggregation the columnar engine replaces.
+    sums = defaultdict(lambda: defaultdict(int))
+    for debtor, creditor, cents in rows:
+        sums[debtor][creditor] += cents
+    return [
+        (debtor, creditor, cents)
+        for debtor in sorted(sums)
+        for creditor, cents in sorted(sums[debtor].items())
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="empty database to seed (default: a throwaway SQLite file)")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--members", type=parse_range, default=(2, 12), help="members per group, N or MIN-MAX")
+    parser.add_argument("--expenses", type=int, default=200000)
+    parser.add_argument("--calls", type=int, default=20, help="groups and users sampled per run")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["SQLALCHEMY_DATABASE_URL"] = (
+            args.database_url or f"sqlite:///{os.path.join(tmp, 'engines.db')}"
+        )
+        from database import engine, SessionLocal
+        from migrations import upgrade
+        from services import balance_services, columnar_services
+
+        upgrade(engine)
+        dataset = generate(
+            engine, args.users, args.groups, args.members, args.expenses, seed=args.seed
+        )
+
+        rnd = random.Random(args.seed)
+        group_ids = rnd.sample(range(1, args.groups + 1), min(args.calls, args.groups))
+        user_ids = rnd.sample(range(1, args.users + 1), min(args.calls, args.users))
+
+        calls = {
+            "group_balances": lambda session: [
+                balance_services.calculate_group_balances(session, g) for g in group_ids
+            ],
+            "user_balances": lambda session: [
+                balance_services.calculate_user_balances(session, u) for u in user_ids
+            ],
+            "all_user_totals": lambda session: balance_services.calculate_all_user_totals(session),
+        }
+
+        report = {"dataset": dataset, "runs": args.runs, "calls_per_run": args.calls, "engines": {}}
+        results = {}
+        with SessionLocal() as session:
+            for name in balance_services.BALANCE_ENGINES:
+                balance_services.BALANCE_ENGINE = name
+                report["engines"][name] = {}
+                for call, fn in calls.items():
+                    ms, results[(name, call)] = median_seconds(lambda: fn(session), args.runs)
+                    report["engines"][name][f"{call}_ms"] = ms
+
+            report["identical"] = {
+                call: results[("ledger", call)] == results[("columnar", call)] for call in calls
+            }
+
+            rows = session.execute(columnar_services.split_legs_query()).all()
+        engine.dispose()
+
+    python_ms, python_pairs = median_seconds(lambda: python_pairwise(rows), args.runs)
+    columnar_ms, columnar_pairs = median_seconds(lambda: columnar_services.pairwise_debts(rows), args.runs)
+    report["aggregation_only"] = {
+        "legs": len(rows),
+        "python_loop_ms": python_ms,
+        "columnar_ms": columnar_ms,
+        "identical": python_pairs == columnar_pairs,
+    }
+
+    print(json.dumps(report, indent=2))
+    return 0 if all(report["identical"].values()) and report["aggregation_only"]["identical"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
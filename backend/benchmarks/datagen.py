@@ -0,0 +1,194 @@
+"""Fill a database with synthetic users, groups, memberships and expenses.
+
+Run from backend/:
+
+    python benchmarks/datagen.py --users 2000 --groups 500 --members 2-8 --expenses 50000
+
+Rows are written with multi-row INSERTs through the models, split shares
+are allocated the same way the API allocates them, expenses are spread
+evenly over the last HISTORY_DAYS days in id order, and the balances ledger
+is rebuilt at the end. The target database should be empty; it is migrated
+first if needed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+INSERT_BATCH_SIZE = 5000
+HISTORY_DAYS = 365
+PERCENTAGE_CHOICES = [
+    [50, 50],
+    [60, 40],
+    [70, 30],
+    [50, 25, 25],
+    [40, 30, 30],
+    [25, 25, 25, 25],
+    [40, 20, 20, 20],
+]
+
+
+def parse_range(value: str) -> tuple[int, int]:
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+def _insert_batched(connection, model, rows: list[dict]) -> None:
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        connection.execute(insert(model), rows[start:start + INSERT_BATCH_SIZE])
+
+
+def _expense_rows(
+    rnd, expense_id: int, group_id: int, member_ids: list[int], percentage_ratio: float, created_at: datetime
+):
+    from models import SplitTypeEnum
+    from services.money_services import allocate_cents
+
+    paid_by = rnd.choice(member_ids)
+    amount_cents = rnd.randint(100, 50000)
+
+    shapes = [p for p in PERCENTAGE_CHOICES if len(p) <= len(member_ids)]
+    if rnd.random() < percentage_ratio and shapes:
+        percentages = rnd.choice(shapes)
+        participants = rnd.sample(member_ids, len(percentages))
+        split_type = SplitTypeEnum.percentage
+    else:
+        percentages = [None] * len(member_ids)
+        participants = member_ids
+        split_type = SplitTypeEnum.equal
+
+    weights = [1] * len(participants) if split_type == SplitTypeEnum.equal else percentages
+    shares = allocate_cents(amount_cents, weights)
+
+    expense = {
+        "id": expense_id,
+        "group_id": group_id,
+        "description": f"expense {expense_id}",
+        "amount_cents": amount_cents,
+        "paid_by": paid_by,
+        "split_type": split_type,
+        "created_at": created_at,
+    }
+    splits = [
+        {
+            "expense_id": expense_id,
+            "user_id": user_id,
+            "percentage": percentage,
+            "amount_owed_cents": 0 if user_id == paid_by else share,
+        }
+        for user_id, percentage, share in zip(participants, percentages, shares)
+    ]
+    return expense, splits
+
+
+def generate(
+    engine,
+    users: int,
+    groups: int,
+    members: tuple[int, int],
+    expenses: int,
+    percentage_ratio: float = 0.3,
+    seed: int = 7,
+) -> dict:
+    from models import Expense, Group, GroupMember, Split, User
+    from database import SessionLocal
+    from services.ledger_services import rebuild_balances
+
+    rnd = random.Random(seed)
+    low, high = members
+    if high > users:
+        raise ValueError("A group cannot have more members than there are users")
+
+    group_members = {
+        group_id: sorted(rnd.sample(range(1, users + 1), rnd.randint(low, high)))
+        for group_id in range(1, groups + 1)
+    }
+
+    expense_rows = []
+    split_rows = []
+    history_start = datetime.now(timezone.utc) - timedelta(days=HISTORY_DAYS)
+    step = timedelta(days=HISTORY_DAYS) / max(expenses, 1)
+    for expense_id in range(1, expenses + 1):
+        group_id = rnd.randint(1, groups)
+        expense, splits = _expense_rows(
+            rnd, expense_id, group_id, group_members[group_id], percentage_ratio,
+            history_start + step * expense_id,
+        )
+        expense_rows.append(expense)
+        split_rows.extend(splits)
+
+    with engine.begin() as connection:
+        _insert_batched(connection, User, [{"id": i, "name": f"user {i}"} for i in range(1, users + 1)])
+        _insert_batched(connection, Group, [{"id": i, "name": f"group {i}"} for i in range(1, groups + 1)])
+        _insert_batched(
+            connection,
+            GroupMember,
+            [{"group_id": g, "user_id": u} for g, ids in group_members.items() for u in ids],
+        )
+        _insert_batched(connection, Expense, expense_rows)
+        _insert_batched(connection, Split, split_rows)
+
+    # Explicit ids leave PostgreSQL sequences behind; move them past the data
+    # so rows created through the API don't collide.
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy import text
+
+        with engine.begin() as connection:
+            for table in ("users", "groups", "expenses", "splits"):
+                connection.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+                    )
+                )
+
+    with SessionLocal(bind=engine) as session:
+        ledger_rows = rebuild_balances(session)
+
+    return {
+        "users": users,
+        "groups": groups,
+        "memberships": sum(len(ids) for ids in group_members.values()),
+        "expenses": expenses,
+        "splits": len(split_rows),
+        "ledger_rows": ledger_rows,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="database to fill (default: SQLALCHEMY_DATABASE_URL)")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--members", type=parse_range, default=(2, 8), help="members per group, N or MIN-MAX")
+    parser.add_argument("--expenses", type=int, default=50000)
+    parser.add_argument("--percentage-ratio", type=float, default=0.3, help="share of percentage splits")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["SQLALCHEMY_DATABASE_URL"] = args.database_url
+    from database import engine
+    from migrations import upgrade
+
+    upgrade(engine)
+    started = time.perf_counter()
+    counts = generate(
+        engine, args.users, args.groups, args.members, args.expenses, args.percentage_ratio, args.seed
+    )
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(counts, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
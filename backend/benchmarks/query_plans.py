@@ -0,0 +1,143 @@
+"""Check the query plans of the hot read paths against a seeded database.
+
+Run from backend/:
+
+    python benchmarks/query_plans.py
+    python benchmarks/query_plans.py --database-url postgresql://... --verbose
+
+Seeds a throwaway database (or the one given, which should be empty), runs
+EXPLAIN on the queries behind the balance, expense and group endpoints, and
+exits non-zero if any of them falls back to a full scan of a large table.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from datagen import generate, parse_range
+
+# Tables that grow with usage; a sequential scan over any of them on a
+# lookup path is a regression.
+HOT_TABLES = ("expenses", "splits", "group_members", "balances", "balance_checkpoint_rows")
+
+
+def hot_queries(group_id: int, user_id: int, expense_ids: list[int]) -> dict:
+    from sqlalchemy import select
+    from models import Expense, GroupMember, Split
+    from services.expense_services import expense_rows_query, split_rows_query
+    from services.group_services import _group_totals_query, _members_query
+    from services.columnar_services import split_legs_batch_query
+    from services.ledger_services import batch_pairs_query, group_ledger_query, pairwise_debts_query
+    from services.snapshot_services import history_start_query, windowed_pairs_query
+    from utils import keyset_page
+
+    as_of = datetime.now(timezone.utc) - timedelta(days=7)
+    return {
+        "group expenses page": keyset_page(
+            expense_rows_query().where(Expense.group_id == group_id), Expense.id, expense_ids[0], 50
+        ),
+        "splits for expenses": split_rows_query(expense_ids),
+        "members of groups": _members_query([group_id, group_id + 1]),
+        "group totals": _group_totals_query([group_id]),
+        "group balances": pairwise_debts_query(group_id=group_id),
+        "user balances": pairwise_debts_query(user_id=user_id),
+        "group ledger cache load": group_ledger_query(group_id),
+        "balance query batch": batch_pairs_query([group_id, group_id + 1], [user_id, user_id + 1]),
+        "columnar balance query batch": split_legs_batch_query(
+            [group_id, group_id + 1], [user_id, user_id + 1]
+        ),
+        "group balances as of": windowed_pairs_query(
+            group_id=group_id, as_of=as_of, checkpoint=(1, as_of - timedelta(days=7))
+        ),
+        "user balances as of": windowed_pairs_query(
+            user_id=user_id, as_of=as_of, checkpoint=(1, as_of - timedelta(days=7))
+        ),
+        "group balances since": windowed_pairs_query(group_id=group_id, since=as_of),
+        "expense history start": history_start_query(),
+        "groups of user": select(GroupMember.group_id).where(GroupMember.user_id == user_id),
+        "expenses paid by user": select(Expense.id).where(Expense.paid_by == user_id),
+        "splits of user": select(Split.expense_id).where(Split.user_id == user_id),
+    }
+
+
+def explain(connection, statement) -> tuple[list[str], list[str]]:
+    # Returns the plan as text lines and the hot tables it scans in full.
+    from sqlalchemy import text
+
+    dialect = connection.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == "sqlite":
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        lines = [row[-1] for row in rows]
+        scans = [
+            table
+            for line in lines
+            for table in HOT_TABLES
+            if line.startswith(f"SCAN {table}") and "INDEX" not in line
+        ]
+        return lines, scans
+
+    if dialect.name == "postgresql":
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, scans = [], []
+
+        def walk(node, depth):
+            relation = node.get("Relation Name")
+            lines.append("  " * depth + node["Node Type"] + (f" on {relation}" if relation else ""))
+            if node["Node Type"] == "Seq Scan" and relation in HOT_TABLES:
+                scans.append(relation)
+            for child in node.get("Plans", []):
+                walk(child, depth + 1)
+
+        walk(plan[0]["Plan"], 0)
+        return lines, scans
+
+    raise SystemExit(f"EXPLAIN parsing is not implemented for {dialect.name}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="empty database to seed (default: a throwaway SQLite file)")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--members", type=parse_range, default=(2, 8), help="members per group, N or MIN-MAX")
+    parser.add_argument("--expenses", type=int, default=50000)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["SQLALCHEMY_DATABASE_URL"] = (
+            args.database_url or f"sqlite:///{os.path.join(tmp, 'plans.db')}"
+        )
+        from sqlalchemy import text
+        from database import engine
+        from migrations import upgrade
+
+        upgrade(engine)
+        generate(engine, args.users, args.groups, args.members, args.expenses)
+
+        failures = 0
+        with engine.connect() as connection:
+            connection.execute(text("ANALYZE"))
+            expense_ids = list(range(1, 51))
+            for name, statement in hot_queries(1, 1, expense_ids).items():
+                lines, scans = explain(connection, statement)
+                status = "FULL SCAN " + ", ".join(sorted(set(scans))) if scans else "ok"
+                print(f"{name}: {status}")
+                if args.verbose or scans:
+                    for line in lines:
+                        print(f"    {line}")
+                failures += bool(scans)
+        engine.dispose()
+
+    print(f"{failures} queries with full scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
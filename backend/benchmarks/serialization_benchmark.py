@@ -0,0 +1,203 @@
+"""Compare ORM-object and column-row serialization on large listings.
+
+Run from backend/:
+
+    python benchmarks/serialization_benchmark.py --expenses 200000 --runs 5
+
+Builds the group listing (every group) and the expense listing of the
+busiest group two ways and checks that the response bodies match:
+
+- orm: full ORM objects with their relationships eager-loaded, turned into
+  dicts, then encoded the way FastAPI does for these routes without a
+  response class (response_model validation for groups, jsonable_encoder
+  and json.dumps for expenses);
+- rows: the services' column-only queries mapped straight to dicts and
+  encoded by FastJSONResponse.
+
+Reports median CPU and wall time per listing, peak Python allocation while
+building it, and the body size, plus the NDJSON stream size before and
+after.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import orjson
+
+from datagen import generate, parse_range
+
+
+def measure(fn, runs: int) -> tuple[dict, bytes]:
+    cpu, wall = [], []
+    body = b""
+    for _ in range(runs):
+        gc.collect()
+        started_cpu, started_wall = time.process_time(), time.perf_counter()
+        body = fn()
+        cpu.append(time.process_time() - started_cpu)
+        wall.append(time.perf_counter() - started_wall)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "cpu_ms": round(statistics.median(cpu) * 1000, 3),
+        "wall_ms": round(statistics.median(wall) * 1000, 3),
+        "peak_alloc_bytes": peak,
+        "body_bytes": len(body),
+    }, body
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", help="empty database to seed (default: a throwaway SQLite file)")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=5000)
+    parser.add_argument("--members", type=parse_range, default=(2, 12), help="members per group, N or MIN-MAX")
+    parser.add_argument("--expenses", type=int, default=200000)
+    parser.add_argument("--busy-share", type=float, default=0.1, help="share of expenses in the busiest group")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["SQLALCHEMY_DATABASE_URL"] = (
+            args.database_url or f"sqlite:///{os.path.join(tmp, 'serialization.db')}"
+        )
+        from fastapi.encoders import jsonable_encoder
+        from pydantic import TypeAdapter
+        from sqlalchemy import func, select, update
+        from sqlalchemy.orm import selectinload
+        from database import engine, SessionLocal
+        from migrations import upgrade
+        from models import Expense, Group, GroupMember
+        from routes.group_router import GroupResponse
+        from services.expense_services import get_expenses_for_group, iter_expenses_for_group
+        from services.group_services import _group_totals, get_all_groups
+        from services.money_services import from_cents
+        from utils import FastJSONResponse, as_utc
+
+        upgrade(engine)
+        dataset = generate(
+            engine, args.users, args.groups, args.members, args.expenses, seed=args.seed
+        )
+        with engine.begin() as connection:
+            # One large group, so the expense listing is big enough to matter.
+            connection.execute(
+                update(Expense)
+                .where(Expense.id % round(1 / args.busy_share) == 0)
+                .values(group_id=1)
+            )
+            busy_group, busy_expenses = connection.execute(
+                select(Expense.group_id, func.count())
+                .group_by(Expense.group_id)
+                .order_by(func.count().desc())
+                .limit(1)
+            ).one()
+        dataset["busy_group_expenses"] = busy_expenses
+
+        groups_adapter = TypeAdapter(list[GroupResponse])
+
+        def starlette_json(content) -> bytes:
+            # starlette.responses.JSONResponse.render
+            return json.dumps(
+                content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+            ).encode("utf-8")
+
+        def orm_groups(session) -> bytes:
+            groups = (
+                session.query(Group)
+                .options(selectinload(Group.members).joinedload(GroupMember.user))
+                .order_by(Group.id)
+                .all()
+            )
+            totals = _group_totals(session, [group.id for group in groups])
+            items = [
+                {
+                    "id": group.id,
+                    "name": group.name,
+                    "users": [{"id": gm.user.id, "name": gm.user.name} for gm in group.members],
+                    "total_expenses": totals.get(group.id, 0.0),
+                }
+                for group in groups
+            ]
+            return groups_adapter.dump_json(groups_adapter.validate_python(items, from_attributes=True))
+
+        def orm_expenses(session) -> bytes:
+            expenses = (
+                session.query(Expense)
+                .options(selectinload(Expense.splits))
+                .filter(Expense.group_id == busy_group)
+                .order_by(Expense.id)
+                .all()
+            )
+            items = [
+                {
+                    "id": e.id,
+                    "description": e.description,
+                    "amount": from_cents(e.amount_cents),
+                    "currency": e.currency,
+                    "paid_by": e.paid_by,
+                    "split_type": e.split_type.value,
+                    "created_at": as_utc(e.created_at).isoformat(),
+                    "splits": [
+                        {
+                            "user_id": s.user_id,
+                            "amount_owed": from_cents(s.amount_owed_cents),
+                            "percentage": s.percentage,
+                        }
+                        for s in e.splits
+                    ],
+                }
+                for e in expenses
+            ]
+            return starlette_json(jsonable_encoder(items))
+
+        listings = {
+            "groups": {
+                "orm": orm_groups,
+                "rows": lambda session: FastJSONResponse(get_all_groups(session)).body,
+            },
+            "expenses": {
+                "orm": orm_expenses,
+                "rows": lambda session: FastJSONResponse(
+                    get_expenses_for_group(session, busy_group)
+                ).body,
+            },
+        }
+
+        report = {"dataset": dataset, "runs": args.runs, "listings": {}, "identical": {}}
+        for listing, paths in listings.items():
+            report["listings"][listing] = {}
+            bodies = {}
+            for path, fn in paths.items():
+                def run():
+                    # A fresh session each run, so nothing comes from the identity map.
+                    with SessionLocal() as session:
+                        return fn(session)
+
+                report["listings"][listing][path], bodies[path] = measure(run, args.runs)
+            report["identical"][listing] = json.loads(bodies["orm"]) == json.loads(bodies["rows"])
+
+        with SessionLocal() as session:
+            items = list(iter_expenses_for_group(session, busy_group))
+        report["expense_stream_bytes"] = {
+            "json.dumps": sum(len(json.dumps(item)) + 1 for item in items),
+            "orjson": sum(len(orjson.dumps(item)) + 1 for item in items),
+        }
+        engine.dispose()
+
+    print(json.dumps(report, indent=2))
+    return 0 if all(report["identical"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Measure cold-start time of the API: a fresh interpreter importing main.
+
+Run from backend/:
+
+    python benchmarks/startup_benchmark.py --runs 5
+
+Each run uses a new subprocess so import caches don't carry over. The
+agent is measured both enabled (lazy) and disabled.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = (
+    "import time, sys\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = time.perf_counter() - start\n"
+    "heavy = sorted({'.'.join(m.split('.')[:2]) for m in sys.modules\n"
+    "                if m.startswith(('llama_index.', 'google.generativeai', 'google.genai'))})\n"
+    "print(elapsed, ','.join(heavy))\n"
+)
+
+
+def measure(env: dict, runs: int) -> dict:
+    samples = []
+    wall = []
+    heavy = ""
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", PROBE],
+            cwd=BACKEND_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        wall.append(time.perf_counter() - started)
+        import_time, _, heavy = out.stdout.strip().splitlines()[-1].partition(" ")
+        samples.append(float(import_time))
+    return {
+        "import_main_median_s": round(statistics.median(samples), 4),
+        "process_wall_median_s": round(statistics.median(wall), 4),
+        "heavy_modules_loaded": heavy.split(",") if heavy else [],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--database-url",
+        help="database to start against (default: a throwaway SQLite file)",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        base_env = {**os.environ, "SQLALCHEMY_DATABASE_URL": url}
+        # Workers expect a migrated database, so that step is not timed.
+        subprocess.run(
+            [sys.executable, "-W", "ignore", "migrations.py"],
+            cwd=BACKEND_DIR,
+            env=base_env,
+            capture_output=True,
+            check=True,
+        )
+
+        report = {
+            "agent_enabled": measure({**base_env, "AGENT_ENABLED": "true"}, args.runs),
+            "agent_disabled": measure({**base_env, "AGENT_ENABLED": "false"}, args.runs),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""A scripted function-calling LLM for benchmarking the agent routes offline.
+
+Each turn, it looks up a group by name, then fetches that group's balances,
+then answers. This exercises the tools, the session memory and the
+streaming path the same way Gemini would, with no network calls.
+"""
+from typing import Any, Sequence
+
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    CompletionResponse,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+from llama_index.core.llms.llm import ToolSelection
+
+ANSWER = "Here are the balances for that group, based on the tool results above."
+
+
+def _word_deltas(text: str) -> list[str]:
+    # Streams text a word at a time, the way a real model sends tokens.
+    words = text.split(" ")
+    return words[:1] + [" " + word for word in words[1:]]
+
+
+class StubLLM(FunctionCallingLLM):
+    group_name: str = "group 1"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(is_function_calling_model=True, context_window=32000)
+
+    def _script(self, messages: Sequence[ChatMessage]) -> ChatResponse:
+        # The step is the number of tool results since the last user message.
+        step = 0
+        for message in reversed(messages):
+            if message.role == MessageRole.USER:
+                break
+            if message.role == MessageRole.TOOL:
+                step += 1
+
+        if step == 0:
+            calls = [("find_group_by_name", {"name": self.group_name})]
+        elif step == 1:
+            calls = [("calculate_group_balances", {"group_id": self._group_id(messages)})]
+        else:
+            return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=ANSWER))
+
+        return ChatResponse(
+            message=ChatMessage(
+                role=MessageRole.ASSISTANT,
+                content="",
+                additional_kwargs={"tool_calls": calls},
+            )
+        )
+
+    @staticmethod
+    def _group_id(messages: Sequence[ChatMessage]) -> int:
+        # The first "id" in the most recent tool result.
+        content = str(messages[-1].content)
+        _, _, rest = content.partition("'id': ")
+        digits = rest.split(",", 1)[0].strip()
+        return int(digits) if digits.isdigit() else 1
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._script(messages)
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._script(messages)
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        response = self._script(messages)
+
+        def gen():
+            if not response.message.content:
+                yield response
+                return
+            text = ""
+            for delta in _word_deltas(response.message.content):
+                text += delta
+                yield ChatResponse(
+                    message=ChatMessage(role=MessageRole.ASSISTANT, content=text),
+                    delta=delta,
+                )
+
+        return gen()
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        responses = self.stream_chat(messages, **kwargs)
+
+        async def gen():
+            for response in responses:
+                yield response
+
+        return gen()
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=ANSWER)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=ANSWER)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        def gen():
+            text = ""
+            for delta in _word_deltas(ANSWER):
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        responses = self.stream_complete(prompt, formatted, **kwargs)
+
+        async def gen():
+            for response in responses:
+                yield response
+
+        return gen()
+
+    def _prepare_chat_with_tools(self, tools, user_msg=None, chat_history=None, **kwargs: Any) -> dict:
+        messages = list(chat_history or [])
+        if user_msg:
+            if isinstance(user_msg, str):
+                user_msg = ChatMessage(role=MessageRole.USER, content=user_msg)
+            messages.append(user_msg)
+        return {"messages": messages, "tools": tools}
+
+    def get_tool_calls_from_response(
+        self, response: ChatResponse, error_on_no_tool_call: bool = True, **kwargs: Any
+    ) -> list[ToolSelection]:
+        calls = response.message.additional_kwargs.get("tool_calls", [])
+        if not calls and error_on_no_tool_call:
+            raise ValueError("Expected at least one tool call")
+        return [
+            ToolSelection(tool_id=f"call_{i}", tool_name=name, tool_kwargs=arguments)
+            for i, (name, arguments) in enumerate(calls)
+        ]
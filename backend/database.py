@@ -1,20 +1,99 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
+from instrumentation import instrument_engine, instrument_orm
 
 
 load_dotenv()
 URL_DATABASE=os.getenv("SQLALCHEMY_DATABASE_URL")
 
-engine = create_engine(URL_DATABASE)
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def dialect_insert(dialect_name: str):
+    # insert() with ON CONFLICT support, for the dialects the app runs on.
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"No upsert support for {dialect_name}")
+    return insert
+
+
+def env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_options(url: str) -> dict:
+    # Pool sizing only applies to server databases; SQLite picks its own pool.
+    options = {"pool_pre_ping": env_flag("DB_POOL_PRE_PING", True)}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        )
+    return options
+
+
+def async_database_url(url: str) -> str:
+    override = os.getenv("SQLALCHEMY_ASYNC_DATABASE_URL")
+    if override:
+        return override
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver configured for {parsed.drivername}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+engine = create_engine(URL_DATABASE, **pool_options(URL_DATABASE))
 SessionLocal = sessionmaker(autocommit=False,autoflush=False,bind=engine)
 Base = declarative_base()
+instrument_engine(engine)
+instrument_orm(Base)
+
+# The async engine is built on first use, so scripts that only need the
+# sync engine never import an async driver.
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+def get_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(
+            async_database_url(URL_DATABASE), **pool_options(URL_DATABASE)
+        )
+        instrument_engine(_async_engine.sync_engine)
+        _AsyncSessionLocal = async_sessionmaker(
+            _async_engine, autoflush=False, expire_on_commit=False
+        )
+    return _async_engine
+
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    get_async_engine()
+    async with _AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,315 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+
+
+# The sampling profiler is off unless a latency threshold is set.
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv("PROFILE_SLOW_REQUESTS_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+PROFILE_MAX_SAMPLES = 20000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds", "rows", "thread_ids")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.thread_ids = {threading.get_ident()}
+
+
+# Set for the duration of each request. Sync handlers run in worker threads
+# with a copy of the context, which still points at the same stats object.
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _statement_finished(conn) -> None:
+    # conn.info lives as long as the pooled connection, so every start
+    # pushed above is popped here, whether the statement succeeded or not.
+    pending = conn.info.get("query_started")
+    if not pending:
+        return
+    started = pending.pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += time.perf_counter() - started
+        stats.thread_ids.add(threading.get_ident())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _statement_finished(conn)
+
+
+def _handle_error(exception_context):
+    if exception_context.connection is not None:
+        _statement_finished(exception_context.connection)
+
+
+def _on_load(target, context):
+    stats = current_request.get()
+    if stats is not None:
+        stats.rows += 1
+        stats.thread_ids.add(threading.get_ident())
+
+
+def instrument_engine(engine) -> None:
+    # Accepts a sync Engine; for an AsyncEngine pass its .sync_engine.
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def instrument_orm(base) -> None:
+    # Counts ORM objects hydrated from result rows, across every model.
+    event.listen(base, "load", _on_load, propagate=True)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class RequestMetrics:
+    # Per-route aggregates, rendered in the Prometheus text format. Routes
+    # are labelled by their template (/groups/{group_id}), not the raw path.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = Counter()
+        self._latency = {}
+        self._statements = Counter()
+        self._db_seconds = Counter()
+        self._rows = Counter()
+        self.profiles_written = 0
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        key = (method, route)
+        with self._lock:
+            self._requests[(method, route, str(status))] += 1
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self._statements[key] += stats.statements
+            self._db_seconds[key] += stats.db_seconds
+            self._rows[key] += stats.rows
+
+    def render(self) -> str:
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def labels(method: str, route: str, **extra: str) -> str:
+            pairs = {"method": method, "route": route, **extra}
+            return ",".join(f'{key}="{_escape(value)}"' for key, value in pairs.items())
+
+        with self._lock:
+            header("http_requests_total", "counter", "Requests handled, by route and status.")
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f"http_requests_total{{{labels(method, route, status=status)}}} {count}")
+
+            header("http_request_duration_seconds", "histogram", "Time until the response headers were sent.")
+            for (method, route), histogram in sorted(self._latency.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(
+                        f"http_request_duration_seconds_bucket{{{labels(method, route, le=str(bound))}}} {count}"
+                    )
+                lines.append(
+                    f"http_request_duration_seconds_bucket{{{labels(method, route, le='+Inf')}}} {histogram.total}"
+                )
+                lines.append(f"http_request_duration_seconds_sum{{{labels(method, route)}}} {histogram.sum}")
+                lines.append(f"http_request_duration_seconds_count{{{labels(method, route)}}} {histogram.total}")
+
+            for name, help_text, values in (
+                ("db_statements_total", "SQL statements executed.", self._statements),
+                ("db_duration_seconds_total", "Time spent executing SQL.", self._db_seconds),
+                ("orm_rows_hydrated_total", "ORM objects loaded from result rows.", self._rows),
+            ):
+                header(name, "counter", help_text)
+                for (method, route), value in sorted(values.items()):
+                    lines.append(f"{name}{{{labels(method, route)}}} {value}")
+
+            header("slow_request_profiles_total", "counter", "Profiles written for slow requests.")
+            lines.append(f"slow_request_profiles_total {self.profiles_written}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_metrics = RequestMetrics()
+
+
+class SamplingProfiler:
+    # Samples the stack of every thread at a fixed interval while requests
+    # are in flight. A slow request keeps the samples taken during it on the
+    # threads it ran on (the event loop thread is shared, so overlapping
+    # requests can show up too) and writes them in the folded-stack format
+    # used by flamegraph.pl and speedscope.
+
+    def __init__(self, interval: float, output_dir: str):
+        self.interval = interval
+        self.output_dir = output_dir
+        self._samples = deque(maxlen=PROFILE_MAX_SAMPLES)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def request_started(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def request_finished(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._wake.clear()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._samples.append((now, thread_id, _fold(frame)))
+            time.sleep(self.interval)
+
+    def dump(self, started: float, finished: float, thread_ids: set[int], name: str) -> Optional[str]:
+        stacks = Counter(
+            stack
+            for at, thread_id, stack in list(self._samples)
+            if started <= at <= finished and thread_id in thread_ids
+        )
+        if not stacks:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        path = os.path.join(self.output_dir, f"{stamp}-{name}.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _server_timing(total: float, stats: RequestStats) -> str:
+    ms = lambda seconds: f"{seconds * 1000:.3f}"
+    return ", ".join(
+        [
+            f"total;dur={ms(total)}",
+            f'db;dur={ms(stats.db_seconds)};desc="{stats.statements} statements"',
+            f"app;dur={ms(max(total - stats.db_seconds, 0.0))}",
+            f'rows;desc="{stats.rows} hydrated"',
+        ]
+    )
+
+
+class InstrumentationMiddleware:
+    # Plain ASGI middleware rather than BaseHTTPMiddleware, so streaming
+    # responses pass through untouched. Timing covers everything up to the
+    # response headers: routing, the handler and serialization. Work done
+    # while a streaming body is sent still counts toward /metrics.
+
+    def __init__(self, app):
+        # database imports this module to hook its engines, so its helpers
+        # are only imported once the app is being built.
+        from database import env_flag
+
+        self.app = app
+        self.server_timing = env_flag("SERVER_TIMING_ENABLED", True)
+        self.profiler = (
+            SamplingProfiler(PROFILE_SAMPLE_INTERVAL_MS / 1000, PROFILE_OUTPUT_DIR)
+            if PROFILE_SLOW_REQUESTS_MS > 0
+            else None
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+        headers_sent_at = None
+
+        async def send_wrapper(message):
+            nonlocal status, headers_sent_at
+            if message["type"] == "http.response.start":
+                headers_sent_at = time.perf_counter()
+                status = message["status"]
+                if self.server_timing:
+                    timing = _server_timing(headers_sent_at - started, stats)
+                    message = {
+                        **message,
+                        "headers": [*message.get("headers", []), (b"server-timing", timing.encode())],
+                    }
+            await send(message)
+
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.request_started()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            current_request.reset(token)
+            if profiler is not None:
+                profiler.request_finished()
+
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            elapsed = (headers_sent_at or finished) - started
+            request_metrics.record(scope["method"], route_path, status, elapsed, stats)
+
+            if profiler is not None and (finished - started) * 1000 >= PROFILE_SLOW_REQUESTS_MS:
+                name = f"{scope['method']}{route_path}".replace("/", "_").replace("{", "").replace("}", "")
+                # Folding the samples and writing the file block, so they run
+                # in a worker thread rather than on the event loop.
+                if await run_in_threadpool(
+                    profiler.dump, started, finished, stats.thread_ids, f"{name}-{(finished - started) * 1000:.0f}ms"
+                ):
+                    request_metrics.profiles_written += 1
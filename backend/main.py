@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from database import engine
 import models
-from routes import user_router, group_router,expense_router,balance_router,agent_router
+from routes import user_router, group_router,expense_router,balance_router,agent_router,metrics_router,event_router
 from fastapi.middleware.cors import CORSMiddleware
+from migrations import pending_migrations
+from instrumentation import InstrumentationMiddleware
 
 
 app = FastAPI()
@@ -12,12 +14,26 @@ app.add_middleware(
     allow_credentials=False, 
     allow_methods=["*"],
     allow_headers=["*"],
+    # The frontend is served from another origin; browsers only let it read
+    # the response headers listed here.
+    expose_headers=["Server-Timing", "X-Next-Cursor", "Idempotent-Replayed", "X-Ledger-Version"],
 )
+# Outermost, so its timings cover the other middleware too.
+app.add_middleware(InstrumentationMiddleware)
 
-models.Base.metadata.create_all(bind=engine)
+# Migrations run once, as their own step before the workers start
+# (python migrations.py), never from each worker at import.
+pending = pending_migrations(engine)
+if pending:
+    raise RuntimeError(
+        f"{len(pending)} schema migrations pending (first: {pending[0][1]}); run python migrations.py"
+    )
 
 app.include_router(user_router.router)
 app.include_router(group_router.router)
 app.include_router(expense_router.router)
 app.include_router(balance_router.router)
-app.include_router(agent_router.router)
\ No newline at end of file
+app.include_router(metrics_router.router)
+app.include_router(event_router.router)
+if agent_router.AGENT_ENABLED:
+    app.include_router(agent_router.router)
\ No newline at end of file
@@ -0,0 +1,353 @@
+import argparse
+import sys
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Enum,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    UniqueConstraint,
+    bindparam,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.engine import Engine
+import models
+from database import engine, SessionLocal
+from services.ledger_services import ensure_balances_populated
+
+# Applied versions are recorded in schema_migrations. A new database is
+# created from the models and stamped with every version; an existing one
+# runs whatever it has not applied yet, in order. Migrations only use SQL
+# that SQLite and PostgreSQL both accept. Each step creates its tables from
+# the frozen definitions below, never from the models, so a later model
+# change can't alter what an earlier step creates.
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+# Tables as each step creates them. They share one MetaData so foreign keys
+# resolve; the users and groups here are the baseline ones, which later
+# steps alter.
+frozen_metadata = MetaData()
+
+# Step 1: the schema from before migrations existed, amounts as floats.
+Table(
+    "users",
+    frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False),
+)
+Table(
+    "groups",
+    frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False),
+)
+Table(
+    "group_members",
+    frozen_metadata,
+    Column("group_id", Integer, ForeignKey("groups.id"), primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+)
+Table(
+    "expenses",
+    frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("group_id", Integer, ForeignKey("groups.id")),
+    Column("description", String),
+    Column("amount", Float),
+    Column("paid_by", Integer, ForeignKey("users.id")),
+    Column("split_type", Enum("equal", "percentage", name="splittypeenum")),
+)
+Table(
+    "splits",
+    frozen_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("expense_id", Integer, ForeignKey("expenses.id")),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("percentage", Float, nullable=True),
+    Column("amount_owed", Float, nullable=False),
+)
+BASELINE_TABLES = ["users", "groups", "group_members", "expenses", "splits"]
+
+# Step 4.
+Table(
+    "idempotency_keys",
+    frozen_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("key", String(255), nullable=False),
+    Column("scope", String, nullable=False),
+    Column("fingerprint", String(64), nullable=False),
+    Column("response", Text, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    UniqueConstraint("key", "scope", name="uq_idempotency_keys_key_scope"),
+    Index("ix_idempotency_keys_expires_at", "expires_at"),
+)
+
+# Step 5.
+Table(
+    "balance_checkpoints",
+    frozen_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("as_of", DateTime(timezone=True), nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Index("ix_balance_checkpoints_as_of", "as_of", unique=True),
+)
+Table(
+    "balance_checkpoint_rows",
+    frozen_metadata,
+    Column("checkpoint_id", Integer, ForeignKey("balance_checkpoints.id"), primary_key=True),
+    Column("group_id", Integer, ForeignKey("groups.id"), primary_key=True),
+    Column("debtor_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("creditor_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("amount_cents", BigInteger, nullable=False),
+    Index("ix_balance_checkpoint_rows_debtor_id", "checkpoint_id", "debtor_id"),
+    Index("ix_balance_checkpoint_rows_creditor_id", "checkpoint_id", "creditor_id"),
+)
+
+
+def _create_frozen(bind: Engine, names: list[str]) -> None:
+    # checkfirst: databases from before migrations existed already have
+    # some of these tables.
+    frozen_metadata.create_all(
+        bind=bind, tables=[frozen_metadata.tables[name] for name in names], checkfirst=True
+    )
+
+
+def _initial_schema(bind: Engine) -> None:
+    _create_frozen(bind, BASELINE_TABLES)
+
+
+# Float columns from before amounts were stored in cents, and their
+# replacements. Stored values were rounded to two decimals, so ROUND(x * 100)
+# recovers the cents exactly.
+MONEY_COLUMNS = [
+    ("expenses", "amount", "amount_cents"),
+    ("splits", "amount_owed", "amount_owed_cents"),
+]
+
+
+def _money_in_cents(bind: Engine) -> None:
+    columns = {column["name"] for column in inspect(bind).get_columns("expenses")}
+    if "amount_cents" in columns:
+        return
+
+    with bind.begin() as connection:
+        for table, old, new in MONEY_COLUMNS:
+            connection.execute(
+                text(f"ALTER TABLE {table} ADD COLUMN {new} BIGINT NOT NULL DEFAULT 0")
+            )
+            connection.execute(
+                text(f"UPDATE {table} SET {new} = CAST(ROUND(COALESCE({old}, 0) * 100) AS BIGINT)")
+            )
+            connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {old}"))
+
+        connection.execute(
+            text("ALTER TABLE expenses ADD COLUMN currency VARCHAR(3) NOT NULL DEFAULT 'USD'")
+        )
+        connection.execute(text("DROP TABLE IF EXISTS balances"))
+        # The ledger as this migration defines it, rather than the current
+        # Balance model, so later model changes don't alter what it does.
+        connection.execute(
+            text(
+                "CREATE TABLE balances ("
+                "group_id INTEGER NOT NULL REFERENCES groups (id), "
+                "debtor_id INTEGER NOT NULL REFERENCES users (id), "
+                "creditor_id INTEGER NOT NULL REFERENCES users (id), "
+                "amount_cents BIGINT NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (group_id, debtor_id, creditor_id))"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO balances (group_id, debtor_id, creditor_id, amount_cents) "
+                "SELECT expenses.group_id, splits.user_id, expenses.paid_by, SUM(splits.amount_owed_cents) "
+                "FROM splits JOIN expenses ON splits.expense_id = expenses.id "
+                "WHERE splits.user_id != expenses.paid_by "
+                "GROUP BY expenses.group_id, splits.user_id, expenses.paid_by"
+            )
+        )
+
+
+FOREIGN_KEY_INDEXES = [
+    ("ix_group_members_user_id_group_id", "group_members", "user_id, group_id"),
+    ("ix_expenses_group_id_id", "expenses", "group_id, id"),
+    ("ix_expenses_paid_by", "expenses", "paid_by"),
+    ("ix_splits_expense_id_user_id", "splits", "expense_id, user_id"),
+    ("ix_splits_user_id", "splits", "user_id"),
+    ("ix_balances_debtor_id", "balances", "debtor_id"),
+    ("ix_balances_creditor_id", "balances", "creditor_id"),
+]
+
+
+def _foreign_key_indexes(bind: Engine) -> None:
+    with bind.begin() as connection:
+        for name, table, columns in FOREIGN_KEY_INDEXES:
+            connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def _idempotency_keys(bind: Engine) -> None:
+    _create_frozen(bind, ["idempotency_keys"])
+
+
+def _expense_timestamps(bind: Engine) -> None:
+    # Existing expenses get the time of the migration: it is the earliest
+    # moment they are known to have existed.
+    columns = {column["name"] for column in inspect(bind).get_columns("expenses")}
+    if "created_at" not in columns:
+        with bind.begin() as connection:
+            connection.execute(text("ALTER TABLE expenses ADD COLUMN created_at TIMESTAMP WITH TIME ZONE"))
+            connection.execute(
+                text("UPDATE expenses SET created_at = :now").bindparams(
+                    bindparam("now", type_=DateTime(timezone=True))
+                ),
+                {"now": datetime.now(timezone.utc)},
+            )
+            connection.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_expenses_group_id_created_at ON expenses (group_id, created_at)")
+            )
+            connection.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_expenses_created_at ON expenses (created_at)")
+            )
+    _create_frozen(bind, ["balance_checkpoints", "balance_checkpoint_rows"])
+
+
+def _group_ledger_versions(bind: Engine) -> None:
+    columns = {column["name"] for column in inspect(bind).get_columns("groups")}
+    if "ledger_version" not in columns:
+        with bind.begin() as connection:
+            connection.execute(
+                text("ALTER TABLE groups ADD COLUMN ledger_version BIGINT NOT NULL DEFAULT 0")
+            )
+
+
+def _data_versions(bind: Engine) -> None:
+    with bind.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS data_versions ("
+                "name VARCHAR(32) NOT NULL PRIMARY KEY, "
+                "value BIGINT NOT NULL)"
+            )
+        )
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Engine], None]]] = [
+    (1, "initial schema", _initial_schema),
+    (2, "money in integer cents", _money_in_cents),
+    (3, "foreign key indexes", _foreign_key_indexes),
+    (4, "idempotency keys", _idempotency_keys),
+    (5, "expense timestamps and balance checkpoints", _expense_timestamps),
+    (6, "group ledger versions", _group_ledger_versions),
+    (7, "data versions", _data_versions),
+]
+
+
+def applied_versions(bind: Engine) -> set[int]:
+    if not inspect(bind).has_table(schema_migrations.name):
+        return set()
+    with bind.connect() as connection:
+        return set(connection.scalars(select(schema_migrations.c.version)))
+
+
+def pending_migrations(bind: Engine) -> list[tuple[int, str]]:
+    applied = applied_versions(bind)
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+
+def _record(bind: Engine, versions: list[tuple[int, str]]) -> None:
+    now = datetime.now(timezone.utc)
+    with bind.begin() as connection:
+        connection.execute(
+            schema_migrations.insert(),
+            [{"version": version, "name": name, "applied_at": now} for version, name in versions],
+        )
+
+
+# Arbitrary, fixed key for the PostgreSQL advisory lock held while migrating.
+MIGRATION_LOCK_KEY = 7264018355
+
+
+@contextmanager
+def migration_lock(bind: Engine) -> Iterator[None]:
+    # Serializes concurrent upgrades, e.g. several containers starting at
+    # once: the second waits, then finds nothing pending. SQLite has no
+    # advisory locks; run migrations there from a single process.
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    with bind.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def upgrade(bind: Engine) -> list[int]:
+    # Returns the versions that were applied.
+    with migration_lock(bind):
+        return _upgrade(bind)
+
+
+def _upgrade(bind: Engine) -> list[int]:
+    fresh = not inspect(bind).has_table(models.User.__tablename__)
+    migration_metadata.create_all(bind=bind)
+    pending = pending_migrations(bind)
+
+    if fresh:
+        models.Base.metadata.create_all(bind=bind)
+        _record(bind, pending)
+        return [version for version, _ in pending]
+
+    steps = {version: step for version, _, step in MIGRATIONS}
+    for version, name in pending:
+        steps[version](bind)
+        _record(bind, [(version, name)])
+    return [version for version, _ in pending]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bring the database schema up to date.")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="only list pending migrations",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        pending = pending_migrations(engine)
+        for version, name in pending:
+            print(f"pending {version}: {name}")
+        print(f"{len(pending)} pending migrations")
+        return 1 if pending else 0
+
+    applied = upgrade(engine)
+    print(f"applied {len(applied)} migrations")
+    with SessionLocal() as session:
+        ensure_balances_populated(session)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
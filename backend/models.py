@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Enum
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, Float, ForeignKey, Enum, Index, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
+from datetime import datetime, timezone
 
 class SplitTypeEnum(str,enum.Enum):
     equal = "equal"
@@ -22,12 +23,17 @@ class Group(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
+    # Bumped in the same transaction as every write to this group's ledger;
+    # cached ledgers are only served while it hasn't moved.
+    ledger_version = Column(BigInteger, nullable=False, default=0, server_default="0")
 
     members = relationship("GroupMember", back_populates="group")
     expenses = relationship("Expense", back_populates="group")
 
 class GroupMember(Base):
     __tablename__ = "group_members"
+    # The primary key leads with group_id; this serves lookups by user.
+    __table_args__ = (Index("ix_group_members_user_id_group_id", "user_id", "group_id"),)
 
     group_id = Column(Integer, ForeignKey("groups.id"), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
@@ -37,13 +43,25 @@ class GroupMember(Base):
 
 class Expense(Base):
     __tablename__ = "expenses"
+    # (group_id, id) serves both the group filter and the keyset order.
+    __table_args__ = (
+        Index("ix_expenses_group_id_id", "group_id", "id"),
+        Index("ix_expenses_paid_by", "paid_by"),
+        Index("ix_expenses_group_id_created_at", "group_id", "created_at"),
+        Index("ix_expenses_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"))
     description = Column(String)
-    amount = Column(Float)
+    # Money columns hold integer minor units (cents).
+    amount_cents = Column(BigInteger, nullable=False)
+    currency = Column(String(3), nullable=False, default="USD", server_default="USD")
     paid_by = Column(Integer, ForeignKey("users.id"))
     split_type = Column(Enum(SplitTypeEnum))
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc)
+    )
 
     group = relationship("Group", back_populates="expenses")
     payer = relationship("User", back_populates="paid_expenses")
@@ -51,12 +69,81 @@ class Expense(Base):
 
 class Split(Base):
     __tablename__ = "splits"
+    __table_args__ = (
+        Index("ix_splits_expense_id_user_id", "expense_id", "user_id"),
+        Index("ix_splits_user_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     expense_id = Column(Integer, ForeignKey("expenses.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
     percentage = Column(Float, nullable=True)
-    amount_owed = Column(Float, nullable=False)
+    amount_owed_cents = Column(BigInteger, nullable=False)
 
     expense = relationship("Expense", back_populates="splits")
     user = relationship("User", back_populates="splits")
+
+class Balance(Base):
+    __tablename__ = "balances"
+    # Per-user balance lookups match on either side of the pair.
+    __table_args__ = (
+        Index("ix_balances_debtor_id", "debtor_id"),
+        Index("ix_balances_creditor_id", "creditor_id"),
+    )
+
+    group_id = Column(Integer, ForeignKey("groups.id"), primary_key=True)
+    debtor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    creditor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    amount_cents = Column(BigInteger, nullable=False, default=0)
+
+class BalanceCheckpoint(Base):
+    # The ledger as it stood at as_of: one row per group and pair, summed
+    # over every expense created up to then.
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (Index("ix_balance_checkpoints_as_of", "as_of", unique=True),)
+
+    id = Column(Integer, primary_key=True)
+    as_of = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+class BalanceCheckpointRow(Base):
+    __tablename__ = "balance_checkpoint_rows"
+    __table_args__ = (
+        Index("ix_balance_checkpoint_rows_debtor_id", "checkpoint_id", "debtor_id"),
+        Index("ix_balance_checkpoint_rows_creditor_id", "checkpoint_id", "creditor_id"),
+    )
+
+    checkpoint_id = Column(Integer, ForeignKey("balance_checkpoints.id"), primary_key=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), primary_key=True)
+    debtor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    creditor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    amount_cents = Column(BigInteger, nullable=False)
+
+class DataVersion(Base):
+    # One counter per kind of rarely written data (users, groups), bumped
+    # by every transaction that writes it. Caches shared across requests
+    # tag entries with the counters they were computed at, so a write by
+    # any worker invalidates them. Expense writes are versioned per group
+    # by groups.ledger_version instead.
+    __tablename__ = "data_versions"
+
+    name = Column(String(32), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    # A key is unique per endpoint; the constraint is what makes concurrent
+    # retries of the same request safe.
+    __table_args__ = (
+        UniqueConstraint("key", "scope", name="uq_idempotency_keys_key_scope"),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(255), nullable=False)
+    scope = Column(String, nullable=False)
+    # sha256 of the request body, to refuse a key reused for another request.
+    fingerprint = Column(String(64), nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
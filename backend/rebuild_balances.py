@@ -0,0 +1,39 @@
+import argparse
+import sys
+from database import engine, SessionLocal
+from migrations import upgrade
+from services.ledger_services import rebuild_balances, verify_balances
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Recompute the balances ledger from splits and report drift."
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="only report drift, do not rewrite the balances table",
+    )
+    args = parser.parse_args()
+
+    upgrade(engine)
+
+    with SessionLocal() as session:
+        drift = verify_balances(session)
+        for row in drift:
+            print(
+                f"group {row['group_id']}: {row['debtor_id']} -> {row['creditor_id']} "
+                f"stored={row['stored']:.2f} expected={row['expected']:.2f}"
+            )
+        print(f"{len(drift)} drifted ledger rows")
+
+        if args.check:
+            return 1 if drift else 0
+
+        count = rebuild_balances(session)
+        print(f"rebuilt {count} ledger rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
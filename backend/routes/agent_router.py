@@ -1,166 +1,155 @@
 import os
+import threading
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from llama_index.llms.gemini import Gemini
-from llama_index.core.agent import AgentRunner
-from llama_index.core.agent import FunctionCallingAgentWorker
-from llama_index.core.tools import FunctionTool
+from typing import Optional
+from pydantic import BaseModel, Field
 
-from services.user_services import get_all_users
 from services.group_services import get_all_groups
-from services.expense_services import get_expenses_for_group
-from services.balance_services import (
-    calculate_group_balances,
-    calculate_all_user_totals,
-    calculate_user_balances,
-)
-from database import get_db
-from utils import serialize_user
+from services.agent_tools import AgentToolContext, build_agent_tools
+from services.cache_services import agent_tool_cache
+from services.agent_sessions import agent_sessions, AGENT_MEMORY_TOKEN_LIMIT
+from services.agent_stream import sse_event, stream_agent_turn
+from database import get_db, env_flag
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# llama_index and the Gemini client are imported and built on the first
+# /agent/query call, so workers that only serve CRUD traffic start fast and
+# the API starts without GOOGLE_API_KEY. AGENT_ENABLED=false drops the
+# agent routes altogether.
+AGENT_ENABLED = env_flag("AGENT_ENABLED", True)
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-1.5-flash")
+
 router = APIRouter()
 
 
 class AgentQuery(BaseModel):
     query: str
-
-
-def get_all_users_tool_func() -> list[dict]:
-    db = next(get_db())
-    try:
-        users = get_all_users(db)
-        return [serialize_user(u) for u in users]
-    finally:
-        db.close()
-
-
-get_users_tool = FunctionTool.from_defaults(
-    fn=get_all_users_tool_func,
-    name="get_all_users",
-    description="Fetches all users from the database",
+    # Omit to start a new conversation; the response carries the ID to reuse.
+    session_id: Optional[str] = Field(None, max_length=64)
+
+
+SYSTEM_PROMPT = (
+    "You are a helpful agent that answers queries about users, groups, expenses, and balances using the provided tools.\n\n"
+    "Follow these general principles:\n"
+    "1. Understand the user’s intent clearly.\n"
+    "2. Break the query down into steps if needed.\n"
+    "3. Choose the correct tools and invoke them in the right order.\n"
+    "4. Resolve user-friendly names (like group or user names) to their internal IDs with `find_user_by_name` and `find_group_by_name`; they already do fuzzy, case-insensitive matching.\n"
+    "5. If names don’t match, suggest the other candidates those tools return.\n"
+    "6. If a follow-up query is made, recall relevant context and re-invoke tools if needed.\n"
+    "7. Always explain your reasoning briefly before giving the answer.\n\n"
+    "Use the following tools depending on the query type:\n\n"
+    "- Resolve a user name: Use `find_user_by_name`. Only call `get_all_users` when asked to list every user.\n"
+    "- Resolve a group name: Use `find_group_by_name`. Only call `get_all_groups` when asked to list groups or check memberships.\n"
+    "- Group expenses: Use `find_group_by_name` to find the group ID, then `get_expenses_per_group` with the ID.\n"
+    "- Group balances: Use `find_group_by_name` to get the ID, then call `calculate_group_balances`.\n"
+    "- Total balances for all users: Use `calculate_all_user_totals`.\n"
+    "- Individual user balance: Use `find_user_by_name` to find the ID, then use `calculate_user_balances`.\n"
+    "- Find which group a user belongs to: Use `find_user_by_name` for the ID, then `get_all_groups` and check each group’s members for that ID.\n\n"
+    "Examples:\n"
+    "- 'Show me expenses for the group called Alpha' → Call `find_group_by_name('Alpha')`, take the best match, then call `get_expenses_per_group(group_id)`.\n"
+    "- 'How much does Alice owe?' → Call `find_user_by_name('Alice')`, take the best match, then call `calculate_user_balances(user_id)`.\n"
+    "- 'List everyone’s totals' → Use `calculate_all_user_totals` directly.\n"
+    "- 'What groups is Creme in?' → Use `find_user_by_name('Creme')` for the ID, then `get_all_groups` and check membership lists for that ID.\n\n"
+    "When in doubt, search by name and pick the highest-scoring candidate. If something is unclear or missing, either clarify with the user or provide best-effort results."
 )
 
-get_groups_tool = FunctionTool.from_defaults(
-    fn=lambda: get_all_groups(next(get_db())),
-    name="get_all_groups",
-    description="Fetches all the groups from the database",
-)
+llm = None
+_init_lock = threading.Lock()
 
 
-def get_expenses_group_tool_func(group_id: int) -> list[dict]:
-    db = next(get_db())
-    try:
-        return get_expenses_for_group(db, group_id)
-    finally:
-        db.close()
+def get_llm():
+    global llm
+    with _init_lock:
+        if llm is None:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise HTTPException(status_code=503, detail="Agent is not configured: GOOGLE_API_KEY is missing")
 
+            from llama_index.llms.gemini import Gemini
 
-get_expenses_group_tool = FunctionTool.from_defaults(
-    fn=get_expenses_group_tool_func,
-    name="get_expenses_per_group",
-    description="Fetches all expenses for a group using its ID (integer).",
-)
+            llm = Gemini(model=GEMINI_MODEL, api_key=api_key)
+    return llm
 
 
-def group_balances_tool_func(group_id: int) -> list[dict]:
-    db = next(get_db())
-    try:
-        return calculate_group_balances(db, group_id)
-    finally:
-        db.close()
+def new_memory():
+    from llama_index.core.memory import ChatMemoryBuffer
 
+    # Token-bounded, so prompt size stays flat however long a conversation runs.
+    return ChatMemoryBuffer.from_defaults(llm=get_llm(), token_limit=AGENT_MEMORY_TOKEN_LIMIT)
 
-group_balances_tool = FunctionTool.from_defaults(
-    fn=group_balances_tool_func,
-    name="calculate_group_balances",
-    description="Calculates how much each user in a group owes or is owed, given the group ID.",
-)
 
+def build_agent(ctx: AgentToolContext, memory):
+    from llama_index.core.agent import AgentRunner, FunctionCallingAgentWorker
 
-def all_user_totals_tool_func() -> list[dict]:
-    db = next(get_db())
-    try:
-        return calculate_all_user_totals(db)
-    finally:
-        db.close()
-
-
-all_user_totals_tool = FunctionTool.from_defaults(
-    fn=all_user_totals_tool_func,
-    name="calculate_all_user_totals",
-    description="Returns each user's total owed and due amount across all groups.",
-)
-
-
-def user_balances_tool_func(user_id: int) -> dict:
-    db = next(get_db())
-    try:
-        return calculate_user_balances(db, user_id)
-    finally:
-        db.close()
-
-
-user_balances_tool = FunctionTool.from_defaults(
-    fn=user_balances_tool_func,
-    name="calculate_user_balances",
-    description="Given a user ID, shows who they owe and who owes them.",
-)
-
-llm = Gemini(model="models/gemini-1.5-flash", api_key=os.getenv("GOOGLE_API_KEY"))
-
-agent_worker = FunctionCallingAgentWorker.from_tools(
-    tools=[
-        get_users_tool,
-        get_groups_tool,
-        get_expenses_group_tool,
-        group_balances_tool,
-        all_user_totals_tool,
-        user_balances_tool,
-    ],
-    llm=llm,
-    system_prompt=(
-        "You are a helpful agent that answers queries about users, groups, expenses, and balances using the provided tools.\n\n"
-        "Follow these general principles:\n"
-        "1. Understand the user’s intent clearly.\n"
-        "2. Break the query down into steps if needed.\n"
-        "3. Choose the correct tools and invoke them in the right order.\n"
-        "4. Match user-friendly names (like group or user names) to their internal IDs using fuzzy, case-insensitive matching.\n"
-        "5. If names don’t match, suggest alternatives from the available data.\n"
-        "6. If a follow-up query is made, recall relevant context and re-invoke tools if needed.\n"
-        "7. Always explain your reasoning briefly before giving the answer.\n\n"
-        "Use the following tools depending on the query type:\n\n"
-        "- Get all users: Use `get_all_users` when you need to resolve user names to IDs or list users.\n"
-        "- Get all groups: Use `get_all_groups` to find group names, resolve group IDs, or check group memberships.\n"
-        "- Group expenses: Use `get_all_groups` to find the group ID, then `get_expenses_per_group` with the ID.\n"
-        "- Group balances: Use `get_all_groups` to get the ID, then call `calculate_group_balances`.\n"
-        "- Total balances for all users: Use `calculate_all_user_totals`.\n"
-        "- Individual user balance: Use `get_all_users` to find the ID, then use `calculate_user_balances`.\n"
-        "- Find which group a user belongs to: Use `get_all_groups` and check inside each group’s data for a match with the user (using `get_all_users` if needed).\n\n"
-        "Examples:\n"
-        "- 'Show me expenses for the group called Alpha' → Call `get_all_groups`, find 'Alpha', then call `get_expenses_per_group(group_id)`.\n"
-        "- 'How much does Alice owe?' → Call `get_all_users`, find 'Alice', then call `calculate_user_balances(user_id)`.\n"
-        "- 'List everyone’s totals' → Use `calculate_all_user_totals` directly.\n"
-        "- 'What groups is Creme in?' → Use `get_all_groups`, check membership lists for a match with user name 'Creme' (resolve via `get_all_users` if needed).\n\n"
-        "When in doubt, fetch supporting data (users or groups) and try to match based on content. If something is unclear or missing, either clarify with the user or provide best-effort results."
-    ),
-    verbose=True,
-)
-
-agent = AgentRunner(agent_worker)
+    # The tools are bound to this turn's DB session, so the worker is
+    # rebuilt per request; the conversation's memory carries over.
+    agent_worker = FunctionCallingAgentWorker.from_tools(
+        tools=build_agent_tools(ctx),
+        llm=get_llm(),
+        system_prompt=SYSTEM_PROMPT,
+        verbose=True,
+    )
+    return AgentRunner(agent_worker, memory=memory)
 
 
 @router.post("/agent/query")
 async def run_agent_endpoint(query: AgentQuery):
     try:
-        response = await agent.achat(query.query)
-        return {"response": str(response)}
+        # The first call imports llama_index and builds the client.
+        session = await run_in_threadpool(agent_sessions.get_or_create, query.session_id, new_memory)
+        async with session.lock:
+            with AgentToolContext() as ctx:
+                agent = await run_in_threadpool(build_agent, ctx, session.memory)
+                response = await agent.achat(query.query)
+        return {"response": str(response), "session_id": session.session_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent error: {str(e)}")
 
 
+@router.post("/agent/query/stream")
+async def stream_agent_endpoint(query: AgentQuery):
+    # Server-Sent Events: session, then tool_call_start / tool_call_end and
+    # token deltas as they happen, then done (or error).
+    session = await run_in_threadpool(agent_sessions.get_or_create, query.session_id, new_memory)
+
+    async def events():
+        yield sse_event("session", {"session_id": session.session_id})
+        async with session.lock:
+            with AgentToolContext() as ctx:
+                try:
+                    tools = await run_in_threadpool(build_agent_tools, ctx)
+                    async for event, data in stream_agent_turn(
+                        get_llm(), tools, session.memory, SYSTEM_PROMPT, query.query
+                    ):
+                        yield sse_event(event, data)
+                except Exception as e:
+                    yield sse_event("error", {"detail": f"Agent error: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/agent/cache/stats")
+def agent_cache_stats():
+    return agent_tool_cache.stats()
+
+
+@router.get("/agent/sessions/stats")
+def agent_session_stats():
+    return agent_sessions.stats()
+
+
 @router.get("/agent/test-group")
 def test_groups(db: Session = Depends(get_db)):
     return get_all_groups(db)
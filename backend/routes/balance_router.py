@@ -1,18 +1,93 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database import get_db
-from services.balance_services import calculate_group_balances, calculate_user_balances,calculate_all_user_totals
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from pydantic import BaseModel, Field
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from services.balance_services import (
+    MAX_BALANCE_QUERY_IDS,
+    calculate_balances_batch_async,
+    calculate_user_balances_async,
+    calculate_all_user_totals_async,
+    group_balances_async,
+    iter_all_user_totals,
+)
+from utils import MAX_PAGE_SIZE, ndjson_response, set_next_cursor
 
 router = APIRouter(tags=["Balances"])
 
+LEDGER_VERSION_HEADER = "X-Ledger-Version"
+
+
+class BalanceQueryRequest(BaseModel):
+    user_ids: list[int] = Field(default_factory=list, max_length=MAX_BALANCE_QUERY_IDS)
+    group_ids: list[int] = Field(default_factory=list, max_length=MAX_BALANCE_QUERY_IDS)
+    simplify: bool = False
+    exact: bool = False
+    since: Optional[datetime] = None
+    as_of: Optional[datetime] = None
+
+
+@router.post("/balances/query")
+async def query_balances(payload: BalanceQueryRequest, db: AsyncSession = Depends(get_async_db)):
+    # Every requested user and group view from a single ledger read; each
+    # entry matches GET /users/{user_id}/balances or /groups/{group_id}/balances.
+    return await calculate_balances_batch_async(
+        db,
+        payload.user_ids,
+        payload.group_ids,
+        simplify=payload.simplify,
+        exact=payload.exact,
+        since=payload.since,
+        as_of=payload.as_of,
+    )
+
 @router.get("/users/all/balances")
-def get_all_user_balances(db: Session = Depends(get_db)):
-    return calculate_all_user_totals(db)
+async def get_all_user_balances(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    stream: bool = False,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        if since is not None or as_of is not None:
+            raise HTTPException(status_code=400, detail="stream does not support since or as_of")
+        return await run_in_threadpool(ndjson_response, iter_all_user_totals)
+    totals = await calculate_all_user_totals_async(db, after, limit, since=since, as_of=as_of)
+    set_next_cursor(response, totals, limit, key="user_id")
+    return totals
 
 @router.get("/groups/{group_id}/balances")
-def get_group_balances(group_id: int, db: Session = Depends(get_db)):
-    return calculate_group_balances(db, group_id)
+async def get_group_balances(
+    group_id: int,
+    response: Response,
+    simplify: bool = False,
+    exact: bool = False,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    # simplify nets each member's position into a near-minimal list of
+    # transfers; exact finds the true minimum for small groups. as_of gives
+    # the balances at that time, since only what changed after it.
+    # X-Ledger-Version is the groups.ledger_version the current balances
+    # reflect, matching the seq of the group's events.
+    version, balances = await group_balances_async(
+        db, group_id, simplify=simplify, exact=exact, since=since, as_of=as_of
+    )
+    if version is not None:
+        response.headers[LEDGER_VERSION_HEADER] = str(version)
+    return balances
 
 @router.get("/users/{user_id}/balances")
-def get_user_balances(user_id: int, db: Session = Depends(get_db)):
-    return calculate_user_balances(db, user_id)
+async def get_user_balances(
+    user_id: int,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await calculate_user_balances_async(db, user_id, since=since, as_of=as_of)
@@ -0,0 +1,86 @@
+import asyncio
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from services.event_services import WS_SEND_TIMEOUT_SECONDS, event_bus
+from services.ledger_services import group_version_query
+
+router = APIRouter(tags=["Events"])
+
+# Close codes: 1008 for an unknown group, 1013 (try again later) when the
+# group is at its subscriber cap or the client fell behind or stopped
+# reading.
+CLOSE_NOT_FOUND = 1008
+CLOSE_TRY_AGAIN = 1013
+
+
+async def _until_disconnect(websocket: WebSocket) -> None:
+    # Clients only listen; anything they send is ignored.
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
+async def _close_slow_client(websocket: WebSocket) -> None:
+    # The close frame can block on a stuck client too, so it gets the same
+    # timeout; past that the connection is simply dropped.
+    try:
+        await asyncio.wait_for(
+            websocket.close(code=CLOSE_TRY_AGAIN, reason="Send timed out; refetch and reconnect"),
+            WS_SEND_TIMEOUT_SECONDS,
+        )
+    except (asyncio.TimeoutError, RuntimeError, WebSocketDisconnect):
+        pass
+
+
+@router.websocket("/ws/groups/{group_id}")
+async def group_events(websocket: WebSocket, group_id: int, db: AsyncSession = Depends(get_async_db)):
+    # Pushes the group's change events as JSON, each with the balance delta
+    # to apply to GET /groups/{group_id}/balances and as seq the group's
+    # ledger_version after it. The subscribed frame carries the version as
+    # of subscribing. Clients fetch the balances (X-Ledger-Version), then
+    # apply the deltas of events with a greater seq; after a gap in seq or
+    # a 1013 close they refetch and reconnect.
+    #
+    # Subscribing before the version is read means every write committed
+    # after that read is delivered.
+    subscription = event_bus.subscribe(group_id)
+    disconnected = None
+    try:
+        seq = (await db.execute(group_version_query(group_id))).scalar()
+        # Don't hold a database connection for the life of the socket.
+        await db.close()
+
+        await websocket.accept()
+        if seq is None:
+            await websocket.close(code=CLOSE_NOT_FOUND, reason="Group not found")
+            return
+        if subscription is None:
+            await websocket.close(code=CLOSE_TRY_AGAIN, reason="Too many subscribers for this group")
+            return
+
+        disconnected = asyncio.create_task(_until_disconnect(websocket))
+        await websocket.send_json({"type": "subscribed", "group_id": group_id, "seq": seq})
+        while True:
+            next_event = asyncio.ensure_future(subscription.queue.get())
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                next_event.cancel()
+                return
+
+            if subscription.overflowed:
+                await websocket.close(code=CLOSE_TRY_AGAIN, reason="Fell behind; refetch and reconnect")
+                return
+            # A client that stops reading would otherwise block here forever.
+            await asyncio.wait_for(websocket.send_json(next_event.result()), WS_SEND_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        await _close_slow_client(websocket)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if subscription is not None:
+            event_bus.unsubscribe(subscription)
+        if disconnected is not None:
+            disconnected.cancel()
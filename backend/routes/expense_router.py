@@ -1,10 +1,20 @@
-from fastapi import APIRouter, Depends
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from database import get_db
-from services.expense_services import add_expense,get_expenses_for_group
-from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, get_async_db
+from services.expense_services import add_expense,add_expense_once,bulk_add_expenses,get_expenses_for_group_async,iter_expenses_for_group
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from models import SplitTypeEnum
+from services.idempotency_services import MAX_IDEMPOTENCY_KEY_LENGTH
+from services.money_services import DEFAULT_CURRENCY
+from utils import MAX_PAGE_SIZE, FastJSONResponse, ndjson_response, set_next_cursor
 
 router = APIRouter(prefix="/groups", tags=["Expenses"])
 
@@ -16,17 +26,42 @@ class SplitInput(BaseModel):
 
 class ExpenseCreateRequest(BaseModel):
     description: str
-    amount: float
+    amount: Decimal = Field(..., decimal_places=2)
+    currency: str = Field(DEFAULT_CURRENCY, pattern="^[A-Z]{3}$")
     paid_by: int
     split_type: SplitTypeEnum
     splits: Optional[List[SplitInput]] = None
 
 
+class SplitResponse(BaseModel):
+    user_id: int
+    amount_owed: float
+    percentage: Optional[float] = None
+
+
+class ExpenseResponse(BaseModel):
+    # An expense as listed under its group (utils.serialize_expense_detail).
+    id: int
+    description: Optional[str] = None
+    amount: float
+    currency: str
+    paid_by: int
+    split_type: SplitTypeEnum
+    created_at: datetime
+    splits: List[SplitResponse]
+
+
 @router.post("/{group_id}/expenses")
 def add_new_expense(
-    group_id: int, payload: ExpenseCreateRequest, db: Session = Depends(get_db)
+    group_id: int,
+    payload: ExpenseCreateRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(
+        None, min_length=1, max_length=MAX_IDEMPOTENCY_KEY_LENGTH
+    ),
+    db: Session = Depends(get_db),
 ):
-    return add_expense(
+    expense = dict(
         session=db,
         group_id=group_id,
         description=payload.description,
@@ -34,8 +69,119 @@ def add_new_expense(
         paid_by=payload.paid_by,
         split_type=payload.split_type,
         splits=[s.dict() for s in payload.splits] if payload.splits else [],
+        currency=payload.currency,
+    )
+    if idempotency_key is None:
+        return add_expense(**expense)
+
+    created, replayed = add_expense_once(idempotency_key=idempotency_key, **expense)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return created
+
+def _parse_csv_splits(value: str) -> list[dict]:
+    # "user_id:percentage;user_id:percentage", only used for percentage splits
+    splits = []
+    for part in filter(None, (p.strip() for p in value.split(";"))):
+        user_id, _, percentage = part.partition(":")
+        splits.append({"user_id": user_id, "percentage": percentage or None})
+    return splits
+
+
+def _read_bulk_rows(body: bytes, content_type: str) -> list[dict]:
+    try:
+        if content_type.startswith("text/csv"):
+            rows = []
+            for row in csv.DictReader(io.StringIO(body.decode("utf-8-sig"))):
+                row["splits"] = _parse_csv_splits(row.get("splits") or "")
+                rows.append(row)
+            return rows
+
+        data = json.loads(body)
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse body: {e}")
+
+    if isinstance(data, dict):
+        data = data.get("expenses")
+    if not isinstance(data, list):
+        raise HTTPException(
+            status_code=400,
+            detail="Expected a list of expenses or {\"expenses\": [...]}",
+        )
+    return data
+
+
+def _describe_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+    )
+
+
+@router.post("/{group_id}/expenses/bulk")
+async def add_bulk_expenses(
+    group_id: int, request: Request, db: Session = Depends(get_db)
+):
+    # Accepts a JSON list of expenses (same shape as POST /expenses) or a
+    # CSV with description,amount,paid_by,split_type,splits columns (and an
+    # optional currency column).
+    raw_rows = _read_bulk_rows(
+        await request.body(), request.headers.get("content-type", "")
     )
 
-@router.get("/{group_id}/expenses")
-def read_group_expenses(group_id: int, db: Session = Depends(get_db)):
-    return get_expenses_for_group(db, group_id)
\ No newline at end of file
+    rows = []
+    errors = []
+    for position, raw in enumerate(raw_rows):
+        if not isinstance(raw, dict):
+            errors.append({"row": position, "error": "Expected an object"})
+            continue
+        # csv.DictReader files fields beyond the header under a None key.
+        if None in raw:
+            errors.append({"row": position, "error": "Row has more fields than the header"})
+            continue
+        try:
+            payload = ExpenseCreateRequest(**raw)
+        except ValidationError as e:
+            errors.append({"row": position, "error": _describe_validation_error(e)})
+            continue
+        except TypeError as e:
+            errors.append({"row": position, "error": str(e)})
+            continue
+
+        rows.append(
+            (
+                position,
+                {
+                    "description": payload.description,
+                    "amount": payload.amount,
+                    "currency": payload.currency,
+                    "paid_by": payload.paid_by,
+                    "split_type": payload.split_type,
+                    "splits": [s.dict() for s in payload.splits] if payload.splits else [],
+                },
+            )
+        )
+
+    result = await run_in_threadpool(bulk_add_expenses, db, group_id, rows)
+    errors = sorted(errors + result["errors"], key=lambda e: e["row"])
+
+    return {
+        "created": len(result["expense_ids"]),
+        "failed": len(errors),
+        "expense_ids": result["expense_ids"],
+        "errors": errors,
+    }
+
+@router.get("/{group_id}/expenses", response_model=List[ExpenseResponse])
+async def read_group_expenses(
+    group_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return await run_in_threadpool(ndjson_response, iter_expenses_for_group, group_id)
+    expenses = await get_expenses_for_group_async(db, group_id, after, limit)
+    response = FastJSONResponse(expenses)
+    set_next_cursor(response, expenses, limit)
+    return response
\ No newline at end of file
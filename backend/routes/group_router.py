@@ -1,8 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from database import get_db
-from services.group_services import create_group, get_group_details,get_all_groups
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, get_async_db
+from services.group_services import (
+    create_group,
+    get_group_details,
+    get_all_groups_async,
+    iter_all_groups,
+    get_group_summary,
+    get_group_summaries,
+    DEFAULT_LATEST_EXPENSES,
+    MAX_LATEST_EXPENSES,
+    MAX_SUMMARY_GROUPS,
+)
+from utils import MAX_PAGE_SIZE, FastJSONResponse, ndjson_response, set_next_cursor
 
 router = APIRouter(prefix="/groups", tags=["Groups"])
 
@@ -30,10 +44,43 @@ class GroupResponse(BaseModel):
 def create_new_group(payload: GroupCreateRequest, db: Session = Depends(get_db)):
     return create_group(db, payload.name, payload.user_ids)
 
+# Declared before /{group_id} so "summary" isn't parsed as a group ID.
+@router.get("/summary")
+def read_group_summaries(
+    ids: list[str] = Query(..., description="Group IDs, comma-separated or repeated"),
+    latest: int = Query(DEFAULT_LATEST_EXPENSES, ge=0, le=MAX_LATEST_EXPENSES),
+    db: Session = Depends(get_db),
+):
+    try:
+        group_ids = [int(part) for value in ids for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be integers")
+    if len(group_ids) > MAX_SUMMARY_GROUPS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SUMMARY_GROUPS} groups per request")
+    return FastJSONResponse(get_group_summaries(db, group_ids, latest))
+
+@router.get("/{group_id}/summary")
+def read_group_summary(
+    group_id: int,
+    latest: int = Query(DEFAULT_LATEST_EXPENSES, ge=0, le=MAX_LATEST_EXPENSES),
+    db: Session = Depends(get_db),
+):
+    return FastJSONResponse(get_group_summary(db, group_id, latest))
+
 @router.get("/{group_id}", response_model=GroupResponse)
 def read_group(group_id: int, db: Session = Depends(get_db)):
-    return get_group_details(db, group_id)
+    return FastJSONResponse(get_group_details(db, group_id))
 
 @router.get("/", response_model=list[GroupResponse])
-def read_all_groups(db: Session = Depends(get_db)):
-    return get_all_groups(db)
\ No newline at end of file
+async def read_all_groups(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return await run_in_threadpool(ndjson_response, iter_all_groups)
+    groups = await get_all_groups_async(db, after, limit)
+    response = FastJSONResponse(groups)
+    set_next_cursor(response, groups, limit)
+    return response
\ No newline at end of file
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from instrumentation import request_metrics
+from services.event_services import event_bus
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    # Prometheus text exposition format.
+    return PlainTextResponse(
+        request_metrics.render() + event_bus.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from database import get_db
-from services.user_services import create_user, get_all_users,get_user_by_id
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, get_async_db
+from services.user_services import create_user, get_all_users_async,get_user_by_id,iter_all_users
+from utils import MAX_PAGE_SIZE, FastJSONResponse, ndjson_response, set_next_cursor
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -23,8 +27,18 @@ def create_new_user(payload: UserCreateRequest, db: Session = Depends(get_db)):
     return create_user(db, payload.name)
 
 @router.get("/", response_model=list[UserResponse])
-def list_users(db: Session = Depends(get_db)):
-    return get_all_users(db)
+async def list_users(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if stream:
+        return await run_in_threadpool(ndjson_response, iter_all_users)
+    users = await get_all_users_async(db, after, limit)
+    response = FastJSONResponse(users)
+    set_next_cursor(response, users, limit)
+    return response
 
 @router.get("/{user_id}", response_model=UserResponse)
 def get_user(user_id: int, db: Session = Depends(get_db)):
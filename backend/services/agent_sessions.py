@@ -0,0 +1,81 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from fastapi import HTTPException
+
+AGENT_MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "1000"))
+AGENT_SESSION_TTL_SECONDS = float(os.getenv("AGENT_SESSION_TTL_SECONDS", "1800"))
+AGENT_MEMORY_TOKEN_LIMIT = int(os.getenv("AGENT_MEMORY_TOKEN_LIMIT", "4000"))
+
+
+class AgentSession:
+    __slots__ = ("session_id", "memory", "lock", "last_used")
+
+    def __init__(self, session_id: str, memory: Any):
+        self.session_id = session_id
+        self.memory = memory
+        # Turns of one conversation run one at a time so their messages
+        # don't interleave in the memory buffer.
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class AgentSessionStore:
+    # Conversations keyed by session ID, least recently used first. Idle
+    # sessions expire after the TTL and the oldest is evicted when full.
+
+    def __init__(self, max_sessions: int, idle_ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.evicted = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used < self.idle_ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def get_or_create(
+        self, session_id: Optional[str], make_memory: Callable[[], Any]
+    ) -> AgentSession:
+        # IDs are only ever generated here, so clients can't pick them or
+        # fill the store with sessions of their own naming. An ID that was
+        # never issued, or has expired or been evicted, is a 404.
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+
+            if session_id is not None:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    raise HTTPException(status_code=404, detail="Agent session not found")
+            else:
+                session = AgentSession(uuid.uuid4().hex, make_memory())
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+
+            session.last_used = now
+            self._sessions.move_to_end(session.session_id)
+            return session
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "live_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "evicted": self.evicted,
+            }
+
+
+agent_sessions = AgentSessionStore(AGENT_MAX_SESSIONS, AGENT_SESSION_TTL_SECONDS)
@@ -0,0 +1,65 @@
+import json
+from typing import Any, AsyncIterator
+
+MAX_FUNCTION_CALLS = 5
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_agent_turn(
+    llm, tools: list, memory, system_prompt: str, query: str
+) -> AsyncIterator[tuple[str, dict]]:
+    # FunctionCallingAgentWorker has no streaming step, so this drives the
+    # same loop by hand on the LLM's streaming chat API: stream a reply,
+    # run any tool calls it asks for, and repeat until it answers in text.
+    # Messages go into the conversation memory the same way the worker
+    # would record them.
+    from llama_index.core.base.llms.types import ChatMessage, MessageRole
+    from llama_index.core.tools.calling import acall_tool_with_selection
+
+    memory.put(ChatMessage(role=MessageRole.USER, content=query))
+    prefix = [ChatMessage(role=MessageRole.SYSTEM, content=system_prompt)]
+
+    for _ in range(MAX_FUNCTION_CALLS + 1):
+        stream = await llm.astream_chat_with_tools(
+            tools, chat_history=prefix + memory.get(), allow_parallel_tool_calls=True
+        )
+
+        last = None
+        async for chunk in stream:
+            last = chunk
+            if chunk.delta:
+                yield "token", {"delta": chunk.delta}
+        if last is None:
+            break
+
+        memory.put(last.message)
+        tool_calls = llm.get_tool_calls_from_response(last, error_on_no_tool_call=False)
+        if not tool_calls:
+            yield "done", {"response": last.message.content or ""}
+            return
+
+        for call in tool_calls:
+            yield "tool_call_start", {
+                "id": call.tool_id,
+                "tool": call.tool_name,
+                "arguments": call.tool_kwargs,
+            }
+            output = await acall_tool_with_selection(call, tools)
+            memory.put(
+                ChatMessage(
+                    role=MessageRole.TOOL,
+                    content=str(output),
+                    additional_kwargs={"name": call.tool_name, "tool_call_id": call.tool_id},
+                )
+            )
+            yield "tool_call_end", {
+                "id": call.tool_id,
+                "tool": call.tool_name,
+                "is_error": output.is_error,
+                "output": str(output),
+            }
+
+    yield "error", {"detail": "Agent stopped without a final answer"}
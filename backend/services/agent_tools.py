@@ -0,0 +1,181 @@
+import threading
+from typing import Any, Callable, Hashable
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from services.user_services import get_all_users
+from services.group_services import get_all_groups
+from services.expense_services import get_expenses_for_group
+from services.balance_services import (
+    calculate_group_balances,
+    calculate_group_settlements,
+    calculate_all_user_totals,
+    calculate_user_balances,
+)
+from services.cache_services import DATA_GROUPS, DATA_USERS, agent_tool_cache, read_data_version
+from services.ledger_services import group_version_query, ledgers_version_query
+from services.search_services import find_users_by_name, find_groups_by_name
+
+
+# What each cached tool result depends on, read in the turn's snapshot.
+# Expense and balance results follow groups.ledger_version, which the
+# write already bumps on the group's own row, so a write in one group
+# leaves other groups' entries valid and no write takes a shared lock.
+
+def _users_version(session: Session) -> Hashable:
+    return read_data_version(session, DATA_USERS)
+
+
+def _groups_version(session: Session) -> Hashable:
+    # Group listings include each group's expense total.
+    return read_data_version(session, DATA_GROUPS), session.execute(ledgers_version_query()).scalar_one()
+
+
+def _group_version(session: Session, group_id: int) -> Hashable:
+    return session.execute(group_version_query(group_id)).scalar()
+
+
+def _ledgers_version(session: Session, *args: Any) -> Hashable:
+    return session.execute(ledgers_version_query()).scalar_one()
+
+
+class AgentToolContext:
+    # One session, and on PostgreSQL one REPEATABLE READ snapshot, shared by
+    # every tool call of a single agent turn. The agent may run tool calls
+    # in parallel worker threads, so access to the session is serialized.
+
+    def __init__(self):
+        self.session = SessionLocal()
+        self._lock = threading.Lock()
+        self._snapshot_started = False
+
+    def _start_snapshot(self) -> None:
+        if self.session.get_bind().dialect.name == "postgresql":
+            self.session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+        self._snapshot_started = True
+
+    def cached(
+        self,
+        name: str,
+        version: Callable[..., Hashable],
+        fn: Callable[..., Any],
+        *args: Any,
+    ) -> Any:
+        # Results are shared across turns, and across workers' writes, until
+        # what version(session, *args) reads changes. It is read before fn
+        # runs, so a result is never cached under a newer version than the
+        # data it was computed from.
+        return agent_tool_cache.get_or_compute(
+            (name, *args), self.run(version, *args), lambda: self.run(fn, *args)
+        )
+
+    def _ensure_snapshot(self) -> None:
+        if not self._snapshot_started:
+            self._start_snapshot()
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self._ensure_snapshot()
+            try:
+                return fn(self.session, *args)
+            except SQLAlchemyError:
+                self.session.rollback()
+                self._snapshot_started = False
+                raise
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "AgentToolContext":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def build_agent_tools(ctx: AgentToolContext) -> list:
+    from llama_index.core.tools import FunctionTool
+
+    def find_user_by_name_tool_func(name: str, limit: int = 5) -> list[dict]:
+        return ctx.run(find_users_by_name, name, limit)
+
+    def find_group_by_name_tool_func(name: str, limit: int = 5) -> list[dict]:
+        return ctx.run(find_groups_by_name, name, limit)
+
+    def get_all_users_tool_func() -> list[dict]:
+        return ctx.cached("get_all_users", _users_version, get_all_users)
+
+    def get_all_groups_tool_func() -> list[dict]:
+        return ctx.cached("get_all_groups", _groups_version, get_all_groups)
+
+    def get_expenses_group_tool_func(group_id: int) -> list[dict]:
+        return ctx.cached("get_expenses_per_group", _group_version, get_expenses_for_group, group_id)
+
+    def group_balances_tool_func(group_id: int, simplify: bool = False) -> list[dict]:
+        if simplify:
+            return ctx.cached(
+                "calculate_group_settlements", _group_version, calculate_group_settlements, group_id
+            )
+        return ctx.cached("calculate_group_balances", _group_version, calculate_group_balances, group_id)
+
+    def all_user_totals_tool_func() -> list[dict]:
+        return ctx.cached("calculate_all_user_totals", _ledgers_version, calculate_all_user_totals)
+
+    def user_balances_tool_func(user_id: int) -> dict:
+        # A user's balances can span any group, so any ledger write counts.
+        return ctx.cached("calculate_user_balances", _ledgers_version, calculate_user_balances, user_id)
+
+    return [
+        FunctionTool.from_defaults(
+            fn=find_user_by_name_tool_func,
+            name="find_user_by_name",
+            description=(
+                "Fuzzy, case-insensitive search for users by name. Returns up to `limit` "
+                "candidates as {id, name, score}, best match first."
+            ),
+        ),
+        FunctionTool.from_defaults(
+            fn=find_group_by_name_tool_func,
+            name="find_group_by_name",
+            description=(
+                "Fuzzy, case-insensitive search for groups by name. Returns up to `limit` "
+                "candidates as {id, name, score}, best match first."
+            ),
+        ),
+        FunctionTool.from_defaults(
+            fn=get_all_users_tool_func,
+            name="get_all_users",
+            description="Fetches all users from the database",
+        ),
+        FunctionTool.from_defaults(
+            fn=get_all_groups_tool_func,
+            name="get_all_groups",
+            description="Fetches all the groups from the database",
+        ),
+        FunctionTool.from_defaults(
+            fn=get_expenses_group_tool_func,
+            name="get_expenses_per_group",
+            description="Fetches all expenses for a group using its ID (integer).",
+        ),
+        FunctionTool.from_defaults(
+            fn=group_balances_tool_func,
+            name="calculate_group_balances",
+            description=(
+                "Calculates how much each user in a group owes or is owed, given the group ID. "
+                "Pass simplify=true to get the netted, minimal list of settlement transfers instead."
+            ),
+        ),
+        FunctionTool.from_defaults(
+            fn=all_user_totals_tool_func,
+            name="calculate_all_user_totals",
+            description="Returns each user's total owed and due amount across all groups.",
+        ),
+        FunctionTool.from_defaults(
+            fn=user_balances_tool_func,
+            name="calculate_user_balances",
+            description="Given a user ID, shows who they owe and who owes them.",
+        ),
+    ]
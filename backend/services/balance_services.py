@@ -1,89 +1,446 @@
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from models import Group, User, Expense, Split
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Group, User
 from fastapi import HTTPException
-from collections import defaultdict
+from services.ledger_services import (
+    batch_pairs_query,
+    group_ledger_query,
+    group_version_query,
+    pairwise_debts_query,
+    user_totals_query,
+)
+from services.cache_services import GroupLedger, group_ledger_cache
+from services import columnar_services
+from services.snapshot_services import (
+    windowed_batch,
+    windowed_batch_async,
+    windowed_pairs,
+    windowed_pairs_async,
+)
+from services.settlement_services import (
+    EXACT_SETTLEMENT_MAX_MEMBERS,
+    net_positions,
+    greedy_settlements,
+    exact_settlements,
+)
+from services.money_services import from_cents
+from utils import STREAM_BATCH_SIZE
+
+# "ledger" reads the materialized balances table; "columnar" sums the raw
+# splits with numpy (see columnar_services). Both return the same results.
+BALANCE_ENGINES = ("ledger", "columnar")
+MAX_BALANCE_QUERY_IDS = 1000
+BALANCE_ENGINE = os.getenv("BALANCE_ENGINE", "ledger")
+if BALANCE_ENGINE not in BALANCE_ENGINES:
+    raise RuntimeError(f"BALANCE_ENGINE must be one of {', '.join(BALANCE_ENGINES)}")
+
+
+def _pairs_statement(group_id: Optional[int] = None, user_id: Optional[int] = None):
+    if BALANCE_ENGINE == "columnar":
+        return columnar_services.split_legs_query(group_id, user_id)
+    return pairwise_debts_query(group_id, user_id)
+
+
+def _pairs_from(rows) -> list[tuple[int, int, int]]:
+    if BALANCE_ENGINE == "columnar":
+        return columnar_services.pairwise_debts(rows)
+    return rows
+
+
+def _totals_statement(after: Optional[int], limit: Optional[int]):
+    if BALANCE_ENGINE == "columnar":
+        return columnar_services.split_legs_query()
+    return user_totals_query(after, limit)
+
 
+def _totals_from(rows, after: Optional[int], limit: Optional[int]) -> list[tuple[int, int, int]]:
+    if BALANCE_ENGINE == "columnar":
+        return columnar_services.user_totals(rows, after, limit)
+    return rows
 
-def calculate_group_balances(session: Session, group_id: int) -> list[dict]:
-    group = session.get(Group, group_id)
-    if not group:
+
+def _windowed(since: Optional[datetime], as_of: Optional[datetime]) -> bool:
+    # The ledger only holds the present; a time window is answered from
+    # checkpoints and splits by snapshot_services, whatever the engine.
+    return since is not None or as_of is not None
+
+
+def _batch_statement(group_ids: list[int], user_ids: list[int]):
+    if BALANCE_ENGINE == "columnar":
+        return columnar_services.split_legs_batch_query(group_ids, user_ids)
+    return batch_pairs_query(group_ids, user_ids)
+
+
+def _batch_from(rows) -> list[tuple[int, int, int, int]]:
+    if BALANCE_ENGINE == "columnar":
+        return columnar_services.group_pairwise_debts(rows)
+    return rows
+
+
+def _group_version(version: Optional[int]) -> int:
+    if version is None:
         raise HTTPException(status_code=404, detail="Group not found")
+    return version
 
-    balances = defaultdict(lambda: defaultdict(float))
 
-    for expense in group.expenses:
-        payer_id = expense.paid_by
-        for split in expense.splits:
-            if split.user_id != payer_id:
-                balances[split.user_id][payer_id] += split.amount_owed
+def _load_group_ledger(group_id: int, rows) -> GroupLedger:
+    if not rows:
+        raise HTTPException(status_code=404, detail="Group not found")
+    ledger = GroupLedger.from_pairs(
+        rows[0][0],
+        ((debtor, creditor, amount) for _, debtor, creditor, amount in rows if debtor is not None),
+    )
+    group_ledger_cache.put(group_id, ledger)
+    return ledger
+
 
+def _consistent_version(before: int, after: Optional[int]) -> Optional[int]:
+    # Rows read between two lookups of the same version reflect it; if a
+    # write landed in between, which version they reflect is unknown.
+    return before if after == before else None
+
+
+def _group_pairs(
+    session: Session, group_id: int, version: int
+) -> tuple[Optional[int], list[tuple[int, int, int]]]:
+    # Hot groups are served from group_ledger_cache while their version in
+    # the database still matches; only the version lookup hits the database.
+    # Also returns the ledger_version the pairs reflect.
+    if BALANCE_ENGINE == "columnar":
+        pairs = _pairs_from(session.execute(_pairs_statement(group_id=group_id)).all())
+        after = session.execute(group_version_query(group_id)).scalar()
+        return _consistent_version(version, after), pairs
+    ledger = group_ledger_cache.get(group_id, version)
+    if ledger is None:
+        ledger = _load_group_ledger(group_id, session.execute(group_ledger_query(group_id)).all())
+    return ledger.version, ledger.pairs()
+
+
+async def _group_pairs_async(
+    session: AsyncSession, group_id: int, version: int
+) -> tuple[Optional[int], list[tuple[int, int, int]]]:
+    if BALANCE_ENGINE == "columnar":
+        pairs = _pairs_from((await session.execute(_pairs_statement(group_id=group_id))).all())
+        after = (await session.execute(group_version_query(group_id))).scalar()
+        return _consistent_version(version, after), pairs
+    ledger = group_ledger_cache.get(group_id, version)
+    if ledger is None:
+        rows = (await session.execute(group_ledger_query(group_id))).all()
+        ledger = _load_group_ledger(group_id, rows)
+    return ledger.version, ledger.pairs()
+
+
+def _group_balance_rows(pairs: list[tuple[int, int, int]]) -> list[dict]:
     results = []
-    for debtor, creditors in balances.items():
-        for creditor, amount in creditors.items():
-            if amount > 0:
-                results.append(
-                    {
-                        "from_user": debtor,
-                        "to_user": creditor,
-                        "amount": round(amount, 2),
-                    }
-                )
+    for debtor, creditor, amount in pairs:
+        if amount > 0:
+            results.append(
+                {
+                    "from_user": debtor,
+                    "to_user": creditor,
+                    "amount": from_cents(amount),
+                }
+            )
     return results
 
 
-def calculate_all_user_totals(session: Session) -> list[dict]:
-    expenses = session.query(Expense).all()
-    balances = defaultdict(lambda: defaultdict(float))
+def _check_settlement_options(simplify: bool, exact: bool) -> None:
+    # exact picks the settlement algorithm, so it means nothing without
+    # simplify; reject it rather than silently return raw balances.
+    if exact and not simplify:
+        raise HTTPException(status_code=400, detail="exact requires simplify")
 
-    for expense in expenses:
-        payer_id = expense.paid_by
-        for split in expense.splits:
-            if split.user_id != payer_id:
-                balances[split.user_id][payer_id] += split.amount_owed
 
-    totals = defaultdict(lambda: {"total_owed": 0.0, "total_due": 0.0})
+def _settle(pairs: list[tuple[int, int, int]], exact: bool) -> list[dict]:
+    net = net_positions(pairs)
 
-    for debtor, creditors in balances.items():
-        for creditor, amount in creditors.items():
-            if amount > 0:
-                totals[debtor]["total_owed"] += amount
-                totals[creditor]["total_due"] += amount
+    if exact:
+        if len(net) > EXACT_SETTLEMENT_MAX_MEMBERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Exact settlement supports at most {EXACT_SETTLEMENT_MAX_MEMBERS} unsettled members",
+            )
+        return exact_settlements(net)
 
-    results = []
-    for user_id, total in totals.items():
-        results.append(
-            {
-                "user_id": user_id,
-                "total_owed": round(total["total_owed"], 2),
-                "total_due": round(total["total_due"], 2),
-            }
+    return greedy_settlements(net)
+
+
+def _serialize_user_total(user_id: int, owed: int, due: int) -> dict:
+    return {
+        "user_id": user_id,
+        "total_owed": from_cents(owed),
+        "total_due": from_cents(due),
+    }
+
+
+def _user_balance_view(user_id: int, pairs: list[tuple[int, int, int]]) -> dict:
+    owed = []
+    due = []
+
+    for debtor, creditor, amount in pairs:
+        if debtor == user_id and amount > 0:
+            owed.append({"to_user": creditor, "amount": from_cents(amount)})
+        elif creditor == user_id and amount > 0:
+            due.append({"from_user": debtor, "amount": from_cents(amount)})
+
+    return {"user_id": user_id, "owed": owed, "due": due}
+
+
+def _batch_views(
+    rows: list[tuple[int, int, int, int]],
+    user_ids: list[int],
+    group_ids: list[int],
+    simplify: bool,
+    exact: bool,
+) -> dict:
+    # One pass over the (group, debtor, creditor, cents) rows builds every
+    # requested view, shaped like the single-user and single-group endpoints.
+    group_pairs = {group_id: [] for group_id in group_ids}
+    user_pairs = {user_id: defaultdict(int) for user_id in user_ids}
+    for group_id, debtor, creditor, amount in rows:
+        if group_id in group_pairs:
+            group_pairs[group_id].append((debtor, creditor, amount))
+        if debtor in user_pairs:
+            user_pairs[debtor][(debtor, creditor)] += amount
+        if creditor in user_pairs:
+            user_pairs[creditor][(debtor, creditor)] += amount
+
+    groups = []
+    for group_id, pairs in group_pairs.items():
+        pairs.sort()
+        balances = _settle(pairs, exact) if simplify else _group_balance_rows(pairs)
+        groups.append({"group_id": group_id, "balances": balances})
+
+    users = [
+        _user_balance_view(
+            user_id, [(debtor, creditor, amount) for (debtor, creditor), amount in sorted(pairs.items())]
         )
+        for user_id, pairs in user_pairs.items()
+    ]
+    return {"users": users, "groups": groups}
 
-    return results
+
+def _existing_ids_statements(user_ids: list[int], group_ids: list[int]):
+    return (
+        select(User.id).where(User.id.in_(user_ids)),
+        select(Group.id).where(Group.id.in_(group_ids)),
+    )
+
+
+def calculate_balances_batch(
+    session: Session,
+    user_ids: list[int],
+    group_ids: list[int],
+    simplify: bool = False,
+    exact: bool = False,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> dict:
+    # Unknown ids are left out of the result, like GET /groups/summary.
+    _check_settlement_options(simplify, exact)
+    user_ids = list(dict.fromkeys(user_ids))
+    group_ids = list(dict.fromkeys(group_ids))
+    users_query, groups_query = _existing_ids_statements(user_ids, group_ids)
+    found_users = set(session.scalars(users_query)) if user_ids else set()
+    found_groups = set(session.scalars(groups_query)) if group_ids else set()
+    user_ids = [user_id for user_id in user_ids if user_id in found_users]
+    group_ids = [group_id for group_id in group_ids if group_id in found_groups]
+
+    rows = []
+    if (user_ids or group_ids) and _windowed(since, as_of):
+        rows = windowed_batch(session, group_ids, user_ids, since, as_of)
+    elif user_ids or group_ids:
+        rows = _batch_from(session.execute(_batch_statement(group_ids, user_ids)).all())
+    return _batch_views(rows, user_ids, group_ids, simplify, exact)
+
+
+def calculate_group_balances(
+    session: Session,
+    group_id: int,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[dict]:
+    version = _group_version(session.execute(group_version_query(group_id)).scalar())
+
+    if _windowed(since, as_of):
+        pairs = windowed_pairs(session, group_id=group_id, since=since, as_of=as_of)
+    else:
+        _, pairs = _group_pairs(session, group_id, version)
+    return _group_balance_rows(pairs)
 
 
-def calculate_user_balances(session: Session, user_id: int) -> dict:
+def calculate_group_settlements(
+    session: Session,
+    group_id: int,
+    exact: bool = False,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[dict]:
+    version = _group_version(session.execute(group_version_query(group_id)).scalar())
+
+    if _windowed(since, as_of):
+        pairs = windowed_pairs(session, group_id=group_id, since=since, as_of=as_of)
+    else:
+        _, pairs = _group_pairs(session, group_id, version)
+    return _settle(pairs, exact)
+
+
+def calculate_all_user_totals(
+    session: Session,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[dict]:
+    if _windowed(since, as_of):
+        rows = columnar_services.user_totals(windowed_pairs(session, since=since, as_of=as_of), after, limit)
+    else:
+        rows = _totals_from(session.execute(_totals_statement(after, limit)).all(), after, limit)
+    return [_serialize_user_total(*row) for row in rows]
+
+
+def iter_all_user_totals(session: Session):
+    if BALANCE_ENGINE == "columnar":
+        # Totals need every leg before the first one is known, so there is
+        # nothing to stream from the database.
+        rows = _totals_from(session.execute(_totals_statement(None, None)).all(), None, None)
+    else:
+        rows = session.execute(
+            user_totals_query(), execution_options={"yield_per": STREAM_BATCH_SIZE}
+        )
+    for row in rows:
+        yield _serialize_user_total(*row)
+
+
+def calculate_user_balances(
+    session: Session,
+    user_id: int,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> dict:
     user = session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    expenses = session.query(Expense).all()
-    balances = defaultdict(lambda: defaultdict(float))
+    if _windowed(since, as_of):
+        pairs = windowed_pairs(session, user_id=user_id, since=since, as_of=as_of)
+    else:
+        pairs = _pairs_from(session.execute(_pairs_statement(user_id=user_id)).all())
+    return _user_balance_view(user_id, pairs)
 
-    for expense in expenses:
-        payer_id = expense.paid_by
-        for split in expense.splits:
-            if split.user_id != payer_id:
-                balances[split.user_id][payer_id] += split.amount_owed
 
-    owed = []
-    due = []
+# Async variants for the async routes; same queries, awaited on an AsyncSession.
 
-    for debtor, creditors in balances.items():
-        for creditor, amount in creditors.items():
-            if debtor == user_id and amount > 0:
-                owed.append({"to_user": creditor, "amount": round(amount, 2)})
-            elif creditor == user_id and amount > 0:
-                due.append({"from_user": debtor, "amount": round(amount, 2)})
+async def _group_pairs_in_window_async(
+    session: AsyncSession,
+    group_id: int,
+    since: Optional[datetime],
+    as_of: Optional[datetime],
+) -> tuple[Optional[int], list[tuple[int, int, int]]]:
+    # A time window has no ledger_version to report.
+    version = _group_version((await session.execute(group_version_query(group_id))).scalar())
 
-    return {"user_id": user_id, "owed": owed, "due": due}
+    if _windowed(since, as_of):
+        return None, await windowed_pairs_async(session, group_id=group_id, since=since, as_of=as_of)
+    return await _group_pairs_async(session, group_id, version)
+
+
+async def group_balances_async(
+    session: AsyncSession,
+    group_id: int,
+    simplify: bool = False,
+    exact: bool = False,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> tuple[Optional[int], list[dict]]:
+    # The group's balances, or its settlements with simplify, and the
+    # groups.ledger_version they reflect, when known.
+    _check_settlement_options(simplify, exact)
+    version, pairs = await _group_pairs_in_window_async(session, group_id, since, as_of)
+    return version, _settle(pairs, exact) if simplify else _group_balance_rows(pairs)
+
+
+async def calculate_group_balances_async(
+    session: AsyncSession,
+    group_id: int,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[dict]:
+    _, balances = await group_balances_async(session, group_id, since=since, as_of=as_of)
+    return balances
+
+
+async def calculate_group_settlements_async(
+    session: AsyncSession,
+    group_id: int,
+    exact: bool = False,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[dict]:
+    _, settlements = await group_balances_async(
+        session, group_id, simplify=True, exact=exact, since=since, as_of=as_of
+    )
+    return settlements
+
+
+async def calculate_all_user_totals_async(
+    session: AsyncSession,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[dict]:
+    if _windowed(since, as_of):
+        pairs = await windowed_pairs_async(session, since=since, as_of=as_of)
+        rows = columnar_services.user_totals(pairs, after, limit)
+    else:
+        rows = _totals_from((await session.execute(_totals_statement(after, limit))).all(), after, limit)
+    return [_serialize_user_total(*row) for row in rows]
+
+
+async def calculate_user_balances_async(
+    session: AsyncSession,
+    user_id: int,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> dict:
+    user = await session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if _windowed(since, as_of):
+        pairs = await windowed_pairs_async(session, user_id=user_id, since=since, as_of=as_of)
+    else:
+        pairs = _pairs_from((await session.execute(_pairs_statement(user_id=user_id))).all())
+    return _user_balance_view(user_id, pairs)
+
+
+async def calculate_balances_batch_async(
+    session: AsyncSession,
+    user_ids: list[int],
+    group_ids: list[int],
+    simplify: bool = False,
+    exact: bool = False,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> dict:
+    _check_settlement_options(simplify, exact)
+    user_ids = list(dict.fromkeys(user_ids))
+    group_ids = list(dict.fromkeys(group_ids))
+    users_query, groups_query = _existing_ids_statements(user_ids, group_ids)
+    found_users = set(await session.scalars(users_query)) if user_ids else set()
+    found_groups = set(await session.scalars(groups_query)) if group_ids else set()
+    user_ids = [user_id for user_id in user_ids if user_id in found_users]
+    group_ids = [group_id for group_id in group_ids if group_id in found_groups]
+
+    rows = []
+    if (user_ids or group_ids) and _windowed(since, as_of):
+        rows = await windowed_batch_async(session, group_ids, user_ids, since, as_of)
+    elif user_ids or group_ids:
+        rows = _batch_from((await session.execute(_batch_statement(group_ids, user_ids))).all())
+    return _batch_views(rows, user_ids, group_ids, simplify, exact)
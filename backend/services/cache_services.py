@@ -0,0 +1,238 @@
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import dialect_insert
+from models import DataVersion
+
+AGENT_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_CACHE_MAX_ENTRIES", "256"))
+AGENT_CACHE_TTL_SECONDS = float(os.getenv("AGENT_CACHE_TTL_SECONDS", "300"))
+GROUP_SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("GROUP_SUMMARY_CACHE_MAX_ENTRIES", "1024"))
+GROUP_SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("GROUP_SUMMARY_CACHE_TTL_SECONDS", "300"))
+GROUP_LEDGER_CACHE_MAX_BYTES = int(os.getenv("GROUP_LEDGER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_MISSING = object()
+
+
+# Names of the data_versions counters.
+DATA_USERS = "users"
+DATA_GROUPS = "groups"
+
+
+def data_versions_query(*names: str):
+    # (name, value) for the given counters, or all of them. A counter that
+    # was never bumped has no row, which reads the same as 0.
+    query = select(DataVersion.name, DataVersion.value)
+    if names:
+        query = query.where(DataVersion.name.in_(names))
+    return query.order_by(DataVersion.name)
+
+
+def read_data_version(session: Session, *names: str) -> tuple:
+    return tuple(tuple(row) for row in session.execute(data_versions_query(*names)))
+
+
+def bump_data_version(session: Session, name: str) -> None:
+    # Runs in the writer's transaction, so the new value becomes visible
+    # with the data it describes. Call it last before commit: on PostgreSQL
+    # the counter row stays locked until then.
+    statement = dialect_insert(session.get_bind().dialect.name)(DataVersion).values(name=name, value=1)
+    session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DataVersion.name],
+            set_={"value": DataVersion.value + 1},
+        )
+    )
+
+
+class VersionedLRUCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Any, default: Any = _MISSING) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+        return default
+
+    def put(self, key: Hashable, version: Any, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, version: Any, compute: Callable[[], Any]) -> Any:
+        # The caller reads version no later than the data compute() sees, so
+        # a write that lands in between leaves the entry tagged with the
+        # older version.
+        value = self.get(key, version)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, version, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+agent_tool_cache = VersionedLRUCache(AGENT_CACHE_MAX_ENTRIES, AGENT_CACHE_TTL_SECONDS)
+group_summary_cache = VersionedLRUCache(
+    GROUP_SUMMARY_CACHE_MAX_ENTRIES, GROUP_SUMMARY_CACHE_TTL_SECONDS
+)
+
+
+class GroupLedger:
+    # One group's ledger rows, tagged with the groups.ledger_version they
+    # were read at. Pairs are packed as (debtor << 32) | creditor into a
+    # sorted int64 array, with the cents in a parallel one, so an entry costs
+    # 16 bytes per pair instead of an ORM object or tuple each. Entries are
+    # never mutated: a write produces a new one.
+
+    __slots__ = ("version", "keys", "amounts")
+
+    def __init__(self, version: int, keys: array, amounts: array):
+        self.version = version
+        self.keys = keys
+        self.amounts = amounts
+
+    @classmethod
+    def from_pairs(cls, version: int, pairs: Iterable[tuple[int, int, int]]) -> "GroupLedger":
+        # pairs must be sorted by (debtor, creditor).
+        keys = array("q")
+        amounts = array("q")
+        for debtor, creditor, amount in pairs:
+            keys.append((debtor << 32) | creditor)
+            amounts.append(amount)
+        return cls(version, keys, amounts)
+
+    def pairs(self) -> list[tuple[int, int, int]]:
+        return [(key >> 32, key & 0xFFFFFFFF, amount) for key, amount in zip(self.keys, self.amounts)]
+
+    def with_deltas(self, version: int, deltas: dict[tuple[int, int], int]) -> "GroupLedger":
+        keys = array("q", self.keys)
+        amounts = array("q", self.amounts)
+        for (debtor, creditor), amount in deltas.items():
+            key = (debtor << 32) | creditor
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                amounts[i] += amount
+            else:
+                keys.insert(i, key)
+                amounts.insert(i, amount)
+        return GroupLedger(version, keys, amounts)
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.keys) + sys.getsizeof(self.amounts)
+
+
+class GroupLedgerCache:
+    # Per-group ledgers, least recently used first out once their total size
+    # passes max_bytes (0 disables the cache). Readers pass the version they
+    # just read from the database, so an entry is only served while no
+    # worker has written to the group since it was loaded.
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.write_throughs = 0
+        self._bytes = 0
+        self._entries: OrderedDict[int, GroupLedger] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, group_id: int, version: int) -> Optional[GroupLedger]:
+        with self._lock:
+            ledger = self._entries.get(group_id)
+            if ledger is not None and ledger.version == version:
+                self._entries.move_to_end(group_id)
+                self.hits += 1
+                return ledger
+            self.misses += 1
+        return None
+
+    def put(self, group_id: int, ledger: GroupLedger) -> None:
+        if ledger.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            current = self._entries.get(group_id)
+            if current is not None and current.version > ledger.version:
+                return
+            self._store(group_id, ledger)
+
+    def apply(self, group_id: int, version: int, deltas: dict[tuple[int, int], int]) -> None:
+        # Write-through after a commit that moved the group to `version`.
+        # Only an entry at the version just before it can take the deltas;
+        # anything else means another write came in between, so it goes.
+        with self._lock:
+            current = self._entries.get(group_id)
+            if current is None:
+                return
+            if current.version != version - 1:
+                self._discard(group_id)
+                return
+            self._store(group_id, current.with_deltas(version, deltas))
+            self.write_throughs += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, group_id: int, ledger: GroupLedger) -> None:
+        self._discard(group_id)
+        self._entries[group_id] = ledger
+        self._bytes += ledger.nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _discard(self, group_id: int) -> None:
+        ledger = self._entries.pop(group_id, None)
+        if ledger is not None:
+            self._bytes -= ledger.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "write_throughs": self.write_throughs,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+group_ledger_cache = GroupLedgerCache(GROUP_LEDGER_CACHE_MAX_BYTES)
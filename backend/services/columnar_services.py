@@ -0,0 +1,140 @@
+from datetime import datetime
+from itertools import chain
+from typing import Optional
+from sqlalchemy import select, union_all
+from models import Expense, Split
+
+# Alternative to the balances ledger: balances computed straight from the
+# splits. The (debtor, creditor, cents) legs are loaded as flat int64 arrays
+# and summed with one sort and np.add.reduceat instead of a Python loop.
+# numpy is imported on first use, so the default engine doesn't pay for it.
+
+
+def split_legs_query(
+    group_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+):
+    # since/as_of keep the legs of expenses created in (since, as_of].
+    query = (
+        select(Split.user_id, Expense.paid_by, Split.amount_owed_cents)
+        .join(Expense, Split.expense_id == Expense.id)
+        .where(Split.user_id != Expense.paid_by)
+    )
+    if since is not None:
+        query = query.where(Expense.created_at > since)
+    if as_of is not None:
+        query = query.where(Expense.created_at <= as_of)
+    if group_id is not None:
+        query = query.where(Expense.group_id == group_id)
+    if user_id is not None:
+        # A leg can't have the user on both sides, so the two halves don't
+        # overlap; each can use its own index, which an OR across the join
+        # cannot.
+        return union_all(
+            query.where(Split.user_id == user_id),
+            query.where(Expense.paid_by == user_id),
+        )
+    return query
+
+
+def split_legs_batch_query(
+    group_ids: list[int],
+    user_ids: list[int],
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+):
+    # (group_id, debtor, creditor, cents) for every leg in one of the groups
+    # or touching one of the users. The three parts are disjoint, so no leg
+    # is counted twice, and each has an index to use.
+    query = (
+        select(Expense.group_id, Split.user_id, Expense.paid_by, Split.amount_owed_cents)
+        .join(Expense, Split.expense_id == Expense.id)
+        .where(Split.user_id != Expense.paid_by)
+    )
+    if since is not None:
+        query = query.where(Expense.created_at > since)
+    if as_of is not None:
+        query = query.where(Expense.created_at <= as_of)
+    other_groups = Expense.group_id.not_in(group_ids)
+    return union_all(
+        query.where(Expense.group_id.in_(group_ids)),
+        query.where(other_groups, Split.user_id.in_(user_ids)),
+        query.where(other_groups, Split.user_id.not_in(user_ids), Expense.paid_by.in_(user_ids)),
+    )
+
+
+def _columns(rows: list[tuple[int, int, int]]):
+    import numpy as np
+
+    legs = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=3 * len(rows))
+    legs = legs.reshape(-1, 3)
+    return legs[:, 0], legs[:, 1], legs[:, 2]
+
+
+def _pair_sums(rows: list[tuple[int, int, int]]):
+    # Sorted by (debtor, creditor), like the ledger query.
+    import numpy as np
+
+    debtors, creditors, cents = _columns(rows)
+    if not len(debtors):
+        return debtors, creditors, cents
+
+    # User ids fit in 32 bits, so (debtor, creditor) packs into one int64
+    # key: a single argsort is much cheaper than a two-key lexsort.
+    keys = (debtors << 32) | creditors
+    order = np.argsort(keys, kind="stable")
+    keys, cents = keys[order], cents[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    keys = keys[starts]
+    return keys >> 32, keys & 0xFFFFFFFF, np.add.reduceat(cents, starts)
+
+
+def pairwise_debts(rows: list[tuple[int, int, int]]) -> list[tuple[int, int, int]]:
+    debtors, creditors, sums = _pair_sums(rows)
+    return list(zip(debtors.tolist(), creditors.tolist(), sums.tolist()))
+
+
+def user_totals(
+    rows: list[tuple[int, int, int]], after: Optional[int] = None, limit: Optional[int] = None
+) -> list[tuple[int, int, int]]:
+    # (user_id, owed, due) for every user with a positive pair balance,
+    # ordered by user_id, like user_totals_query.
+    import numpy as np
+
+    debtors, creditors, sums = _pair_sums(rows)
+    positive = sums > 0
+    debtors, creditors, sums = debtors[positive], creditors[positive], sums[positive]
+
+    users, inverse = np.unique(np.concatenate([debtors, creditors]), return_inverse=True)
+    owed = np.zeros(len(users), dtype=np.int64)
+    due = np.zeros(len(users), dtype=np.int64)
+    np.add.at(owed, inverse[:len(debtors)], sums)
+    np.add.at(due, inverse[len(debtors):], sums)
+
+    start = 0 if after is None else int(np.searchsorted(users, after, side="right"))
+    stop = len(users) if limit is None else start + limit
+    return list(zip(users[start:stop].tolist(), owed[start:stop].tolist(), due[start:stop].tolist()))
+
+
+def group_pairwise_debts(rows: list[tuple[int, int, int, int]]) -> list[tuple[int, int, int, int]]:
+    # (group_id, debtor, creditor, cents) summed per group and pair, sorted.
+    import numpy as np
+
+    legs = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=4 * len(rows))
+    groups, debtors, creditors, cents = legs.reshape(-1, 4).T
+    if not len(groups):
+        return []
+
+    pairs = (debtors << 32) | creditors
+    order = np.lexsort((pairs, groups))
+    groups, pairs, cents = groups[order], pairs[order], cents[order]
+    starts = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (pairs[1:] != pairs[:-1])])
+    groups, pairs = groups[starts], pairs[starts]
+    return list(zip(
+        groups.tolist(),
+        (pairs >> 32).tolist(),
+        (pairs & 0xFFFFFFFF).tolist(),
+        np.add.reduceat(cents, starts).tolist(),
+    ))
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from typing import Optional
+from services.money_services import from_cents
+
+WS_MAX_SUBSCRIBERS_PER_GROUP = int(os.getenv("WS_MAX_SUBSCRIBERS_PER_GROUP", "100"))
+WS_MAX_PENDING_EVENTS = int(os.getenv("WS_MAX_PENDING_EVENTS", "100"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+
+
+class Subscription:
+    # Events for one subscriber, queued on the event loop that serves its
+    # socket. The queue is bounded: a subscriber that falls behind is marked
+    # overflowed and dropped rather than buffered without limit, and has to
+    # refetch the full state when it reconnects.
+
+    def __init__(self, group_id: int, max_pending: int):
+        self.group_id = group_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def deliver(self, event: dict) -> None:
+        # Runs on self.loop.
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            event_bus.dropped += 1
+
+
+class EventBus:
+    # In-process fan-out of per-group change events. Writers publish from
+    # worker threads after they commit; each subscriber receives the event
+    # on its own loop. Every event carries as seq the group's
+    # groups.ledger_version once it is applied, so a client can tell it
+    # missed one and which balances it already holds. Only subscribers in
+    # the same process see events.
+
+    def __init__(self, max_subscribers: int, max_pending: int):
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, set[Subscription]] = defaultdict(set)
+        self.published = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def subscribe(self, group_id: int) -> Optional[Subscription]:
+        # Must be called from the event loop that will consume the events.
+        # Returns None once the group has max_subscribers.
+        with self._lock:
+            if len(self._subscribers[group_id]) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            subscription = Subscription(group_id, self.max_pending)
+            self._subscribers[group_id].add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.group_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.group_id]
+
+    def publish(self, group_id: int, seq: int, event: dict) -> None:
+        event = {**event, "group_id": group_id, "seq": seq}
+        with self._lock:
+            subscribers = list(self._subscribers.get(group_id, ()))
+            self.published += 1
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down.
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def render(self) -> str:
+        # Prometheus text, appended to the request metrics.
+        lines = []
+        for name, kind, help_text, value in (
+            ("ws_subscribers", "gauge", "Open group event subscriptions.", self.subscriber_count()),
+            ("ws_events_published_total", "counter", "Group events published.", self.published),
+            ("ws_subscribers_dropped_total", "counter", "Subscribers dropped for falling behind.", self.dropped),
+            ("ws_subscribers_rejected_total", "counter", "Subscriptions refused by the per-group cap.", self.rejected),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+event_bus = EventBus(WS_MAX_SUBSCRIBERS_PER_GROUP, WS_MAX_PENDING_EVENTS)
+
+
+def balance_delta(deltas: dict[tuple[int, int], int]) -> list[dict]:
+    # Ledger deltas as the amounts to add to GET /groups/{group_id}/balances.
+    return [
+        {"from_user": debtor, "to_user": creditor, "amount": from_cents(amount)}
+        for (debtor, creditor), amount in sorted(deltas.items())
+        if amount
+    ]
+
+
+def publish_expense_added(
+    group_id: int, version: int, expense: dict, deltas: dict[tuple[int, int], int]
+) -> None:
+    event_bus.publish(
+        group_id, version, {"type": "expense_added", "expense": expense, "balance_delta": balance_delta(deltas)}
+    )
+
+
+def publish_expenses_added(
+    group_id: int, version: int, expense_ids: list[int], deltas: dict[tuple[int, int], int]
+) -> None:
+    # One event per committed bulk import chunk.
+    event_bus.publish(
+        group_id,
+        version,
+        {"type": "expenses_added", "expense_ids": expense_ids, "balance_delta": balance_delta(deltas)},
+    )
+
+
+def publish_membership_changed(group_id: int, version: int, member_ids: list[int]) -> None:
+    # Balances are unchanged, so the event carries the current version.
+    event_bus.publish(
+        group_id, version, {"type": "membership_changed", "members": member_ids, "balance_delta": []}
+    )
@@ -1,16 +1,107 @@
+from typing import Optional
+from collections import defaultdict
+from fractions import Fraction
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import Expense, Group, User, GroupMember, Split, SplitTypeEnum
 from fastapi import HTTPException
+from services.ledger_services import (
+    apply_ledger_deltas,
+    collect_ledger_deltas,
+)
+from services.event_services import publish_expense_added, publish_expenses_added
+from services.idempotency_services import find_stored_response, request_fingerprint, store_response
+from services.money_services import (
+    DEFAULT_CURRENCY,
+    allocate_cents,
+    as_fraction,
+    to_cents,
+)
+from utils import (
+    keyset_page,
+    serialize_expense,
+    serialize_expense_detail,
+    serialize_splits,
+    STREAM_BATCH_SIZE,
+)
 
-def add_expense(
+BULK_CHUNK_SIZE = 500
+# Percentages are accepted when they add up to 100 within this, so thirds
+# sent as floats (33.333...) still pass; shares are then allocated in
+# proportion to them, which normalizes the small excess or shortfall away.
+PERCENTAGE_TOLERANCE = Fraction(1, 10**6)
+
+
+def _compute_split_rows(
+    amount_cents: int,
+    paid_by: int,
+    split_type: str,
+    splits: list[dict],
+    member_ids: list[int],
+) -> list[dict]:
+    # Shares are allocated over everyone in the split, payer included, so
+    # they add up to the expense amount exactly; the payer's own share is
+    # then recorded as nothing owed.
+    if split_type == "equal":
+        if not member_ids:
+            raise HTTPException(status_code=400, detail="No group members found")
+
+        shares = allocate_cents(amount_cents, [1] * len(member_ids))
+        return [
+            {
+                "user_id": uid,
+                "amount_owed_cents": 0 if uid == paid_by else share,
+                "percentage": None
+            } for uid, share in zip(member_ids, shares)
+        ]
+
+    elif split_type == "percentage":
+        if any(s.get("percentage") is None for s in splits):
+            raise HTTPException(status_code=400, detail="Every split needs a percentage")
+
+        weights = [as_fraction(s["percentage"]) for s in splits]
+        if abs(sum(weights) - 100) > PERCENTAGE_TOLERANCE:
+            raise HTTPException(status_code=400, detail="Total percentage must be 100")
+
+        shares = allocate_cents(amount_cents, weights)
+        return [
+            {
+                "user_id": s["user_id"],
+                "percentage": s["percentage"],
+                "amount_owed_cents": 0 if s["user_id"] == paid_by else share,
+            } for s, share in zip(splits, shares)
+        ]
+
+    else:
+        raise HTTPException(status_code=400, detail="Invalid split type")
+
+
+def _check_currency(currency: str) -> None:
+    # Balances and totals are summed per group without regard to currency,
+    # so until they are kept per currency only the default one is taken.
+    if currency != DEFAULT_CURRENCY:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported currency {currency}; only {DEFAULT_CURRENCY} is accepted",
+        )
+
+
+def _insert_expense(
     session: Session,
     group_id: int,
     description: str,
     amount: float,
     paid_by: int,
     split_type: str,
-    splits: list[dict]
-) -> dict:
+    splits: list[dict],
+    currency: str,
+) -> tuple[dict, dict[tuple[int, int], int], int]:
+    # Validates and flushes the expense and its ledger changes without
+    # committing; returns the response body, the ledger deltas and the
+    # group's new ledger_version.
+    _check_currency(currency)
     group = session.get(Group, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
@@ -19,85 +110,267 @@ def add_expense(
     if not payer:
         raise HTTPException(status_code=404, detail="Payer not found")
 
-    if split_type == "equal":
-        members = [gm.user for gm in group.members]
-        if not members:
-            raise HTTPException(status_code=400, detail="No group members found")
-
-        share = round(amount / len(members), 2)
-        split_records = [
-            Split(
-                user_id=member.id,
-                amount_owed=0.0 if member.id == paid_by else share,
-                percentage=None
-            ) for member in members
-        ]
-
-    elif split_type == "percentage":
-        total_percentage = sum(s["percentage"] for s in splits)
-        if total_percentage != 100:
-            raise HTTPException(status_code=400, detail="Total percentage must be 100")
-
-        split_records = []
-        for s in splits:
-            uid = s["user_id"]
-            perc = s["percentage"]
-            amt = 0.0 if uid == paid_by else round(amount * perc / 100, 2)
-            split_records.append(
-                Split(user_id=uid, percentage=perc, amount_owed=amt)
-            )
-
-    else:
-        raise HTTPException(status_code=400, detail="Invalid split type")
+    member_ids = [gm.user_id for gm in group.members]
+    amount_cents = to_cents(amount)
+    split_rows = _compute_split_rows(amount_cents, paid_by, split_type, splits, member_ids)
+    split_records = [Split(**row) for row in split_rows]
 
     expense = Expense(
         group_id=group_id,
         description=description,
-        amount=amount,
+        amount_cents=amount_cents,
+        currency=currency,
         paid_by=paid_by,
         split_type=SplitTypeEnum(split_type),
         splits=split_records
     )
 
     session.add(expense)
+    session.flush()
+    deltas = collect_ledger_deltas(defaultdict(int), paid_by, split_rows)
+    version = apply_ledger_deltas(session, group_id, deltas)
+
+    return {**serialize_expense(expense), "splits": serialize_splits(expense.splits)}, deltas, version
+
+def add_expense(
+    session: Session,
+    group_id: int,
+    description: str,
+    amount: float,
+    paid_by: int,
+    split_type: str,
+    splits: list[dict],
+    currency: str = DEFAULT_CURRENCY,
+) -> dict:
+    response, deltas, version = _insert_expense(
+        session, group_id, description, amount, paid_by, split_type, splits, currency
+    )
     session.commit()
-    session.refresh(expense)
-
-    return {
-        "id": expense.id,
-        "group_id": expense.group_id,
-        "description": expense.description,
-        "amount": expense.amount,
-        "paid_by": expense.paid_by,
-        "split_type": expense.split_type.value,
-        "splits": [
-            {
-                "user_id": s.user_id,
-                "amount_owed": s.amount_owed,
-                "percentage": s.percentage
-            } for s in expense.splits
-        ]
-    }
+    publish_expense_added(group_id, version, response, deltas)
+    return response
+
+def add_expense_once(
+    session: Session,
+    idempotency_key: str,
+    group_id: int,
+    description: str,
+    amount: float,
+    paid_by: int,
+    split_type: str,
+    splits: list[dict],
+    currency: str = DEFAULT_CURRENCY,
+) -> tuple[dict, bool]:
+    # Returns (response, replayed). A retry with the same key gets the
+    # stored response back without validating or inserting anything.
+    scope = f"POST /groups/{group_id}/expenses"
+    fingerprint = request_fingerprint(
+        {
+            "description": description,
+            "amount_cents": to_cents(amount),
+            "currency": currency,
+            "paid_by": paid_by,
+            "split_type": split_type,
+            "splits": splits,
+        }
+    )
+    stored = find_stored_response(session, idempotency_key, scope, fingerprint)
+    if stored is not None:
+        return stored, True
+
+    response, deltas, version = _insert_expense(
+        session, group_id, description, amount, paid_by, split_type, splits, currency
+    )
+    store_response(session, idempotency_key, scope, fingerprint, response)
+    try:
+        session.commit()
+    except IntegrityError:
+        # A concurrent request with the same key committed first; drop this
+        # expense and answer with that one.
+        session.rollback()
+        stored = find_stored_response(session, idempotency_key, scope, fingerprint)
+        if stored is None:
+            raise
+        return stored, True
+
+    publish_expense_added(group_id, version, response, deltas)
+    return response, False
+
+def _validate_bulk_row(
+    payload: dict, amount_cents: int, member_ids: list[int], members: set[int]
+) -> list[dict]:
+    _check_currency(payload.get("currency", DEFAULT_CURRENCY))
+    if payload["paid_by"] not in members:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Payer {payload['paid_by']} is not a member of the group",
+        )
+
+    outsiders = [s["user_id"] for s in payload["splits"] if s["user_id"] not in members]
+    if outsiders:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Users {outsiders} are not members of the group",
+        )
 
-def get_expenses_for_group(session: Session, group_id: int) -> list[dict]:
+    return _compute_split_rows(
+        amount_cents,
+        payload["paid_by"],
+        payload["split_type"],
+        payload["splits"],
+        member_ids,
+    )
+
+def bulk_add_expenses(
+    session: Session, group_id: int, rows: list[tuple[int, dict]]
+) -> dict:
     group = session.get(Group, group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    return [
-        {
-            "id": e.id,
-            "description": e.description,
-            "amount": e.amount,
-            "paid_by": e.paid_by,
-            "split_type": e.split_type.value,
-            "splits": [
+    # A single membership lookup serves every row in the import.
+    member_ids = [gm.user_id for gm in group.members]
+    members = set(member_ids)
+
+    expense_ids = []
+    errors = []
+
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        positions = []
+        expense_rows = []
+        chunk_splits = []
+
+        for position, payload in rows[start:start + BULK_CHUNK_SIZE]:
+            amount_cents = to_cents(payload["amount"])
+            try:
+                split_rows = _validate_bulk_row(payload, amount_cents, member_ids, members)
+            except HTTPException as e:
+                errors.append({"row": position, "error": e.detail})
+                continue
+
+            positions.append(position)
+            expense_rows.append(
                 {
-                    "user_id": s.user_id,
-                    "amount_owed": s.amount_owed,
-                    "percentage": s.percentage
-                } for s in e.splits
+                    "group_id": group_id,
+                    "description": payload["description"],
+                    "amount_cents": amount_cents,
+                    "currency": payload.get("currency", DEFAULT_CURRENCY),
+                    "paid_by": payload["paid_by"],
+                    "split_type": SplitTypeEnum(payload["split_type"]),
+                }
+            )
+            chunk_splits.append(split_rows)
+
+        if not expense_rows:
+            continue
+
+        # One multi-row INSERT for the expenses and one executemany for
+        # their splits, committed once per chunk.
+        try:
+            ids = session.scalars(
+                insert(Expense).returning(Expense.id, sort_by_parameter_order=True),
+                expense_rows,
+            ).all()
+
+            split_params = [
+                {**split_row, "expense_id": expense_id}
+                for expense_id, split_rows in zip(ids, chunk_splits)
+                for split_row in split_rows
             ]
-        }
-        for e in group.expenses
-    ]
\ No newline at end of file
+            if split_params:
+                session.execute(insert(Split), split_params)
+
+            deltas = defaultdict(int)
+            for expense_row, split_rows in zip(expense_rows, chunk_splits):
+                collect_ledger_deltas(deltas, expense_row["paid_by"], split_rows)
+            version = apply_ledger_deltas(session, group_id, deltas)
+
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            errors.extend(
+                {"row": position, "error": "Database error while saving this row's chunk"}
+                for position in positions
+            )
+            continue
+
+        expense_ids.extend(ids)
+        publish_expenses_added(group_id, version, list(ids), deltas)
+
+    return {"expense_ids": expense_ids, "errors": errors}
+
+def expense_rows_query():
+    # Just the columns an expense listing returns.
+    return select(
+        Expense.id,
+        Expense.description,
+        Expense.amount_cents,
+        Expense.currency,
+        Expense.paid_by,
+        Expense.split_type,
+        Expense.created_at,
+    )
+
+def split_rows_query(expense_ids: list[int]):
+    # Splits in the order they were submitted (by id) within each expense,
+    # as the ORM path listed them.
+    return (
+        select(Split.expense_id, Split.user_id, Split.amount_owed_cents, Split.percentage)
+        .where(Split.expense_id.in_(expense_ids))
+        .order_by(Split.expense_id, Split.id)
+    )
+
+def serialize_expense_rows(expenses, split_rows) -> list[dict]:
+    splits = defaultdict(list)
+    for split in split_rows:
+        splits[split.expense_id].append(split)
+    return [serialize_expense_detail(expense, splits[expense.id]) for expense in expenses]
+
+def _group_expenses_query(session: Session, group_id: int):
+    group = session.get(Group, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    return expense_rows_query().where(Expense.group_id == group_id)
+
+def get_expenses_for_group(
+    session: Session,
+    group_id: int,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> list[dict]:
+    query = _group_expenses_query(session, group_id)
+    expenses = session.execute(keyset_page(query, Expense.id, after, limit)).all()
+    if not expenses:
+        return []
+    split_rows = session.execute(split_rows_query([e.id for e in expenses]))
+    return serialize_expense_rows(expenses, split_rows)
+
+def iter_expenses_for_group(session: Session, group_id: int):
+    query = _group_expenses_query(session, group_id)
+
+    def generate():
+        result = session.execute(
+            query.order_by(Expense.id).execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        for expenses in result.partitions():
+            split_rows = session.execute(split_rows_query([e.id for e in expenses]))
+            yield from serialize_expense_rows(expenses, split_rows)
+
+    return generate()
+
+async def get_expenses_for_group_async(
+    session: AsyncSession,
+    group_id: int,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> list[dict]:
+    group = await session.get(Group, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    query = expense_rows_query().where(Expense.group_id == group_id)
+    expenses = (await session.execute(keyset_page(query, Expense.id, after, limit))).all()
+    if not expenses:
+        return []
+    split_rows = await session.execute(split_rows_query([e.id for e in expenses]))
+    return serialize_expense_rows(expenses, split_rows)
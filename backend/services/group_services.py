@@ -1,6 +1,65 @@
+from typing import Optional
+from collections import defaultdict
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from models import Group, User, GroupMember, Expense
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Balance, Group, User, GroupMember, Expense
 from fastapi import HTTPException
+from services.cache_services import DATA_GROUPS, bump_data_version, group_summary_cache
+from services.event_services import publish_membership_changed
+from services.expense_services import expense_rows_query, serialize_expense_rows, split_rows_query
+from services.money_services import from_cents
+from services.settlement_services import net_positions
+from utils import keyset_page, serialize_group_detail, serialize_user, STREAM_BATCH_SIZE
+
+DEFAULT_LATEST_EXPENSES = 10
+MAX_LATEST_EXPENSES = 50
+MAX_SUMMARY_GROUPS = 100
+
+
+def _groups_query():
+    return select(Group.id, Group.name)
+
+
+def _members_query(group_ids: list[int]):
+    # Members of every group on the page in one SELECT, in primary key order.
+    return (
+        select(GroupMember.group_id, User.id, User.name)
+        .join(User, User.id == GroupMember.user_id)
+        .where(GroupMember.group_id.in_(group_ids))
+        .order_by(GroupMember.group_id, GroupMember.user_id)
+    )
+
+
+def _by_group(member_rows) -> dict[int, list]:
+    members = defaultdict(list)
+    for row in member_rows:
+        members[row.group_id].append(row)
+    return members
+
+
+def _group_totals_query(group_ids: list[int]):
+    return (
+        select(Expense.group_id, func.sum(Expense.amount_cents))
+        .where(Expense.group_id.in_(group_ids))
+        .group_by(Expense.group_id)
+    )
+
+
+def _group_totals(session: Session, group_ids: list[int]) -> dict[int, float]:
+    if not group_ids:
+        return {}
+    rows = session.execute(_group_totals_query(group_ids)).all()
+    return {group_id: from_cents(total or 0) for group_id, total in rows}
+
+
+def _serialize_groups(groups, member_rows, totals: dict[int, float]) -> list[dict]:
+    members = _by_group(member_rows)
+    return [
+        serialize_group_detail(group, members[group.id], totals.get(group.id, 0.0))
+        for group in groups
+    ]
+
 
 def create_group(session: Session, name: str, user_ids: list[int]) -> dict:
     group = Group(name=name)
@@ -14,13 +73,13 @@ def create_group(session: Session, name: str, user_ids: list[int]) -> dict:
             raise HTTPException(status_code=404, detail=f"User {uid} not found")
         session.add(GroupMember(user_id=uid, group_id=group.id))
 
+    session.flush()
+    bump_data_version(session, DATA_GROUPS)
     session.commit()
     session.refresh(group)
 
-    users = [
-        {"id": gm.user.id, "name": gm.user.name}
-        for gm in group.members
-    ]
+    users = [serialize_user(gm.user) for gm in group.members]
+    publish_membership_changed(group.id, group.ledger_version, [user["id"] for user in users])
 
     return {
         "id": group.id,
@@ -30,32 +89,139 @@ def create_group(session: Session, name: str, user_ids: list[int]) -> dict:
     }
 
 def get_group_details(session: Session, group_id: int) -> dict:
-    group = session.get(Group, group_id)
+    group = session.execute(_groups_query().where(Group.id == group_id)).first()
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    users = [
-        {"id": gm.user.id, "name": gm.user.name}
-        for gm in group.members
-    ]
+    member_rows = session.execute(_members_query([group.id]))
+    return _serialize_groups([group], member_rows, _group_totals(session, [group.id]))[0]
 
-    total_expense = sum(e.amount for e in group.expenses)
+def get_all_groups(
+    session: Session, after: Optional[int] = None, limit: Optional[int] = None
+) -> list[dict]:
+    groups = session.execute(keyset_page(_groups_query(), Group.id, after, limit)).all()
+    if not groups:
+        return []
+    group_ids = [group.id for group in groups]
+    member_rows = session.execute(_members_query(group_ids))
+    return _serialize_groups(groups, member_rows, _group_totals(session, group_ids))
 
-    return {
-        "id": group.id,
-        "name": group.name,
-        "users": users,
-        "total_expenses": total_expense
+def iter_all_groups(session: Session):
+    result = session.execute(
+        _groups_query().order_by(Group.id).execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    for groups in result.partitions():
+        group_ids = [group.id for group in groups]
+        member_rows = session.execute(_members_query(group_ids))
+        yield from _serialize_groups(groups, member_rows, _group_totals(session, group_ids))
+
+async def get_all_groups_async(
+    session: AsyncSession, after: Optional[int] = None, limit: Optional[int] = None
+) -> list[dict]:
+    groups = (await session.execute(keyset_page(_groups_query(), Group.id, after, limit))).all()
+    if not groups:
+        return []
+    group_ids = [group.id for group in groups]
+    member_rows = await session.execute(_members_query(group_ids))
+    rows = await session.execute(_group_totals_query(group_ids))
+    totals = {group_id: from_cents(total or 0) for group_id, total in rows}
+    return _serialize_groups(groups, member_rows, totals)
+
+def _build_summaries(session: Session, group_ids: list[int], latest: int) -> dict[int, dict]:
+    # A fixed number of queries however many groups are asked for: groups
+    # (1), members (1), expense totals (1), ledger rows (1) and the latest
+    # expenses with their splits (2).
+    groups = session.execute(_groups_query().where(Group.id.in_(group_ids))).all()
+    if not groups:
+        return {}
+    found_ids = [group.id for group in groups]
+    members = _by_group(session.execute(_members_query(found_ids)))
+
+    totals = {
+        group_id: (from_cents(total or 0), count)
+        for group_id, total, count in session.query(
+            Expense.group_id, func.sum(Expense.amount_cents), func.count(Expense.id)
+        )
+        .filter(Expense.group_id.in_(found_ids))
+        .group_by(Expense.group_id)
     }
 
-def get_all_groups(session: Session) -> list[dict]:
-    groups = session.query(Group).all()
-    return [
-        {
+    pairs = defaultdict(list)
+    for group_id, debtor, creditor, amount in session.query(
+        Balance.group_id, Balance.debtor_id, Balance.creditor_id, Balance.amount_cents
+    ).filter(Balance.group_id.in_(found_ids)):
+        pairs[group_id].append((debtor, creditor, amount))
+
+    ranked = (
+        select(
+            Expense.id,
+            func.row_number()
+            .over(partition_by=Expense.group_id, order_by=Expense.id.desc())
+            .label("position"),
+        )
+        .where(Expense.group_id.in_(found_ids))
+        .subquery()
+    )
+    latest_expenses = defaultdict(list)
+    expense_rows = session.execute(
+        expense_rows_query()
+        .add_columns(Expense.group_id)
+        .join(ranked, ranked.c.id == Expense.id)
+        .where(ranked.c.position <= latest)
+        .order_by(Expense.id.desc())
+    ).all()
+    if expense_rows:
+        split_rows = session.execute(split_rows_query([e.id for e in expense_rows]))
+        for row, expense in zip(expense_rows, serialize_expense_rows(expense_rows, split_rows)):
+            latest_expenses[row.group_id].append(expense)
+
+    summaries = {}
+    for group in groups:
+        net = net_positions(pairs[group.id])
+        total, count = totals.get(group.id, (0.0, 0))
+        summaries[group.id] = {
             "id": group.id,
             "name": group.name,
-            "users": [{"id": gm.user.id, "name": gm.user.name} for gm in group.members],
-            "total_expenses": sum(e.amount for e in group.expenses)
+            "members": [
+                {**serialize_user(member), "net": from_cents(net.get(member.id, 0))}
+                for member in members[group.id]
+            ],
+            "total_expenses": total,
+            "expense_count": count,
+            "latest_expenses": latest_expenses[group.id],
         }
-        for group in groups
-    ]
\ No newline at end of file
+    return summaries
+
+def get_group_summaries(
+    session: Session, group_ids: list[int], latest: int = DEFAULT_LATEST_EXPENSES
+) -> list[dict]:
+    # Summaries are cached per group under its groups.ledger_version, which
+    # every expense write bumps, so a write through any worker invalidates
+    # them. The versions are read before the summaries are built: a write
+    # landing in between leaves the entry under the older version.
+    group_ids = list(dict.fromkeys(group_ids))
+    versions = dict(
+        session.execute(select(Group.id, Group.ledger_version).where(Group.id.in_(group_ids))).all()
+    )
+
+    summaries = {}
+    for group_id in versions:
+        cached = group_summary_cache.get((group_id, latest), versions[group_id], None)
+        if cached is not None:
+            summaries[group_id] = cached
+
+    missing = [group_id for group_id in versions if group_id not in summaries]
+    if missing:
+        for group_id, summary in _build_summaries(session, missing, latest).items():
+            group_summary_cache.put((group_id, latest), versions[group_id], summary)
+            summaries[group_id] = summary
+
+    return [summaries[group_id] for group_id in group_ids if group_id in summaries]
+
+def get_group_summary(
+    session: Session, group_id: int, latest: int = DEFAULT_LATEST_EXPENSES
+) -> dict:
+    summaries = get_group_summaries(session, [group_id], latest)
+    if not summaries:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return summaries[0]
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from models import IdempotencyKey
+
+# A stored response is replayed for this long; after that the key can be
+# used again as if it were new.
+IDEMPOTENCY_KEY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "300"))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+_purge_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def request_fingerprint(payload: dict) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def find_stored_response(
+    session: Session, key: str, scope: str, fingerprint: str
+) -> Optional[dict]:
+    record = session.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.response).where(
+            IdempotencyKey.key == key,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.expires_at > datetime.now(timezone.utc),
+        )
+    ).first()
+    if record is None:
+        return None
+    if record.fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request",
+        )
+    return json.loads(record.response)
+
+
+def store_response(
+    session: Session, key: str, scope: str, fingerprint: str, response: dict
+) -> None:
+    # Added to the caller's transaction, so the key is committed together
+    # with the write it records, or not at all. A concurrent request with
+    # the same key fails on the unique constraint when it commits.
+    now = datetime.now(timezone.utc)
+    _purge_expired(session, now)
+    session.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.key == key,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.expires_at <= now,
+        )
+    )
+    session.add(
+        IdempotencyKey(
+            key=key,
+            scope=scope,
+            fingerprint=fingerprint,
+            response=json.dumps(response),
+            created_at=now,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_KEY_TTL_SECONDS),
+        )
+    )
+
+
+def _purge_expired(session: Session, now: datetime) -> None:
+    # Expired keys are cleared at most once per interval per process.
+    global _last_purge
+    with _purge_lock:
+        if time.monotonic() - _last_purge < IDEMPOTENCY_PURGE_INTERVAL_SECONDS:
+            return
+        _last_purge = time.monotonic()
+    session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))
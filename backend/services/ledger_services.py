@@ -0,0 +1,230 @@
+from typing import Optional
+from sqlalchemy import event, func, or_, update, select, union_all, literal
+from sqlalchemy.orm import Session
+from database import dialect_insert
+from models import Balance, Expense, Group, Split
+from services.cache_services import group_ledger_cache, group_summary_cache
+from services.money_services import from_cents
+
+# session.info key for ledger writes waiting on their transaction's commit.
+PENDING_LEDGER_WRITES = "pending_ledger_writes"
+
+def pairwise_debts_query(group_id: Optional[int] = None, user_id: Optional[int] = None):
+    # Reads the materialized ledger, so the cost depends on the number of
+    # member pairs rather than on the length of the expense history.
+    query = select(
+        Balance.debtor_id,
+        Balance.creditor_id,
+        func.sum(Balance.amount_cents),
+    )
+
+    if group_id is not None:
+        query = query.where(Balance.group_id == group_id)
+    if user_id is not None:
+        query = query.where(
+            or_(Balance.debtor_id == user_id, Balance.creditor_id == user_id)
+        )
+
+    return query.group_by(Balance.debtor_id, Balance.creditor_id).order_by(
+        Balance.debtor_id, Balance.creditor_id
+    )
+
+
+def group_version_query(group_id: int):
+    return select(Group.ledger_version).where(Group.id == group_id)
+
+
+def ledgers_version_query():
+    # Every ledger write bumps one group's ledger_version, so their sum
+    # changes whenever any group's balances do.
+    return select(func.coalesce(func.sum(Group.ledger_version), 0))
+
+
+def group_ledger_query(group_id: int):
+    # The group's ledger version and rows from one statement, so both come
+    # from the same snapshot. A group with no ledger rows still yields its
+    # version, with NULL pair columns.
+    return (
+        select(Group.ledger_version, Balance.debtor_id, Balance.creditor_id, Balance.amount_cents)
+        .select_from(Group)
+        .outerjoin(Balance, Balance.group_id == Group.id)
+        .where(Group.id == group_id)
+        .order_by(Balance.debtor_id, Balance.creditor_id)
+    )
+
+
+def batch_pairs_query(group_ids: list[int], user_ids: list[int]):
+    # Ledger rows (group_id, debtor, creditor, cents) in any of the groups or
+    # with any of the users on either side, for answering many views at once.
+    return select(
+        Balance.group_id,
+        Balance.debtor_id,
+        Balance.creditor_id,
+        Balance.amount_cents,
+    ).where(
+        or_(
+            Balance.group_id.in_(group_ids),
+            Balance.debtor_id.in_(user_ids),
+            Balance.creditor_id.in_(user_ids),
+        )
+    )
+
+
+def user_totals_query(after: Optional[int] = None, limit: Optional[int] = None):
+    # Per-user owed/due totals in SQL, ordered by user id so callers can
+    # page through them with a keyset cursor.
+    pair_amount = func.sum(Balance.amount_cents)
+    pairs = (
+        select(
+            Balance.debtor_id.label("debtor_id"),
+            Balance.creditor_id.label("creditor_id"),
+            pair_amount.label("amount"),
+        )
+        .group_by(Balance.debtor_id, Balance.creditor_id)
+        .having(pair_amount > 0)
+        .subquery()
+    )
+    legs = union_all(
+        select(
+            pairs.c.debtor_id.label("user_id"),
+            pairs.c.amount.label("owed"),
+            literal(0).label("due"),
+        ),
+        select(pairs.c.creditor_id, literal(0), pairs.c.amount),
+    ).subquery()
+
+    query = select(
+        legs.c.user_id, func.sum(legs.c.owed), func.sum(legs.c.due)
+    ).group_by(legs.c.user_id)
+    if after is not None:
+        query = query.where(legs.c.user_id > after)
+    query = query.order_by(legs.c.user_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def compute_ledger_from_splits(session: Session) -> dict[tuple[int, int, int], int]:
+    # Source of truth for the balances table: one grouped query over
+    # splits joined to expenses.
+    rows = (
+        session.query(
+            Expense.group_id,
+            Split.user_id,
+            Expense.paid_by,
+            func.sum(Split.amount_owed_cents),
+        )
+        .join(Expense, Split.expense_id == Expense.id)
+        .filter(Split.user_id != Expense.paid_by)
+        .group_by(Expense.group_id, Split.user_id, Expense.paid_by)
+        .all()
+    )
+    return {
+        (group_id, debtor, creditor): amount
+        for group_id, debtor, creditor, amount in rows
+    }
+
+
+def collect_ledger_deltas(
+    deltas: dict[tuple[int, int], int], paid_by: int, split_rows: list[dict]
+) -> dict[tuple[int, int], int]:
+    for row in split_rows:
+        if row["user_id"] != paid_by and row["amount_owed_cents"]:
+            deltas[(row["user_id"], paid_by)] += row["amount_owed_cents"]
+    return deltas
+
+
+def apply_ledger_deltas(
+    session: Session, group_id: int, deltas: dict[tuple[int, int], int]
+) -> int:
+    # Called inside the caller's transaction; the caller commits. The cached
+    # ledger for the group is updated once the commit succeeds. Returns the
+    # group's new ledger_version.
+    version = session.execute(
+        update(Group)
+        .where(Group.id == group_id)
+        .values(ledger_version=Group.ledger_version + 1)
+        .returning(Group.ledger_version)
+    ).scalar_one()
+    session.info.setdefault(PENDING_LEDGER_WRITES, []).append((group_id, version, dict(deltas)))
+
+    rows = [
+        {"group_id": group_id, "debtor_id": debtor, "creditor_id": creditor, "amount_cents": amount}
+        for (debtor, creditor), amount in sorted(deltas.items())
+    ]
+    if rows:
+        session.execute(_ledger_upsert(session.get_bind().dialect.name), rows)
+    return version
+
+
+def _ledger_upsert(dialect_name: str):
+    # INSERT ... ON CONFLICT DO UPDATE adds to an existing pair or creates
+    # it, so concurrent first writes for a pair both land without a unique
+    # violation. Rows go in key order so concurrent writers lock them in
+    # the same order.
+    statement = dialect_insert(dialect_name)(Balance)
+    return statement.on_conflict_do_update(
+        index_elements=[Balance.group_id, Balance.debtor_id, Balance.creditor_id],
+        set_={"amount_cents": Balance.amount_cents + statement.excluded.amount_cents},
+    )
+
+
+def _write_through(session: Session) -> None:
+    for group_id, version, deltas in session.info.pop(PENDING_LEDGER_WRITES, ()):
+        group_ledger_cache.apply(group_id, version, deltas)
+
+
+def _discard_pending(session: Session) -> None:
+    session.info.pop(PENDING_LEDGER_WRITES, None)
+
+
+event.listen(Session, "after_commit", _write_through)
+event.listen(Session, "after_rollback", _discard_pending)
+
+
+def verify_balances(session: Session) -> list[dict]:
+    expected = compute_ledger_from_splits(session)
+    stored = {
+        (b.group_id, b.debtor_id, b.creditor_id): b.amount_cents
+        for b in session.query(Balance).all()
+    }
+
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, 0)
+        have = stored.get(key, 0)
+        if want != have:
+            group_id, debtor, creditor = key
+            drift.append(
+                {
+                    "group_id": group_id,
+                    "debtor_id": debtor,
+                    "creditor_id": creditor,
+                    "stored": from_cents(have),
+                    "expected": from_cents(want),
+                }
+            )
+    return drift
+
+
+def rebuild_balances(session: Session) -> int:
+    expected = compute_ledger_from_splits(session)
+
+    session.query(Balance).delete()
+    session.add_all(
+        Balance(group_id=group_id, debtor_id=debtor, creditor_id=creditor, amount_cents=amount)
+        for (group_id, debtor, creditor), amount in expected.items()
+    )
+    # Invalidates the ledgers cached by every worker.
+    session.execute(update(Group).values(ledger_version=Group.ledger_version + 1))
+    session.commit()
+    group_summary_cache.clear()
+    group_ledger_cache.clear()
+    return len(expected)
+
+
+def ensure_balances_populated(session: Session) -> None:
+    # Databases created before the balances table existed start with an
+    # empty ledger; backfill it once so reads stay correct.
+    if session.query(Balance).first() is None and session.query(Split).first() is not None:
+        rebuild_balances(session)
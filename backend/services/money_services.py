@@ -0,0 +1,46 @@
+import math
+from decimal import Decimal, ROUND_HALF_UP
+from fractions import Fraction
+from typing import Union
+
+# Amounts are stored as integer minor units (cents) and only converted to
+# decimals at the API boundary.
+DEFAULT_CURRENCY = "USD"
+CENTS_PER_UNIT = 100
+
+Number = Union[int, float, str, Decimal]
+
+
+def to_cents(amount: Number) -> int:
+    # Going through str() keeps a float like 0.1 from picking up its binary
+    # representation error before it is rounded.
+    value = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return int((value * CENTS_PER_UNIT).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> float:
+    return cents / CENTS_PER_UNIT
+
+
+def as_fraction(value: Number) -> Fraction:
+    return value if isinstance(value, Fraction) else Fraction(str(value))
+
+
+def allocate_cents(total: int, weights: list[Fraction]) -> list[int]:
+    # Largest remainder: every share gets the floor of its exact quota, and
+    # the cents left over go to the largest fractional remainders (earliest
+    # position on ties), so the shares always add up to the total.
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise ValueError("Weights must add up to a positive number")
+
+    quotas = [Fraction(total) * weight / weight_sum for weight in weights]
+    shares = [math.floor(quota) for quota in quotas]
+    leftover = total - sum(shares)
+
+    by_remainder = sorted(
+        range(len(weights)), key=lambda i: (shares[i] - quotas[i], i)
+    )
+    for i in by_remainder[:leftover]:
+        shares[i] += 1
+    return shares
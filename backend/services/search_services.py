@@ -0,0 +1,107 @@
+import heapq
+import threading
+from collections import defaultdict
+from typing import Callable
+from sqlalchemy.orm import Session
+from models import Group, User
+from services.cache_services import DATA_GROUPS, DATA_USERS, read_data_version
+
+MIN_SIMILARITY = 0.1
+DEFAULT_MATCH_LIMIT = 5
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _trigrams(text: str) -> set[str]:
+    # pg_trgm style: each word padded with two leading and one trailing space.
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    def __init__(self, entries: list[tuple[int, str]]):
+        self._names = {}
+        self._grams = {}
+        self._postings = defaultdict(set)
+        for entity_id, name in entries:
+            normalized = _normalize(name)
+            grams = _trigrams(normalized)
+            self._names[entity_id] = (name, normalized)
+            self._grams[entity_id] = grams
+            for gram in grams:
+                self._postings[gram].add(entity_id)
+
+    def search(self, query: str, limit: int = DEFAULT_MATCH_LIMIT) -> list[dict]:
+        normalized = _normalize(query)
+        query_grams = _trigrams(normalized)
+        if not query_grams:
+            return []
+
+        # Only entities sharing at least one trigram are scored.
+        candidates = set()
+        for gram in query_grams:
+            candidates |= self._postings.get(gram, set())
+
+        scored = []
+        for entity_id in candidates:
+            name, candidate = self._names[entity_id]
+            grams = self._grams[entity_id]
+            score = len(query_grams & grams) / len(query_grams | grams)
+            if candidate == normalized:
+                score = 1.0
+            elif candidate.startswith(normalized):
+                score = max(score, 0.9)
+            if score >= MIN_SIMILARITY:
+                scored.append((score, -entity_id, name))
+
+        return [
+            {"id": -neg_id, "name": name, "score": round(score, 3)}
+            for score, neg_id, name in heapq.nlargest(limit, scored)
+        ]
+
+
+class NameIndex:
+    # Rebuilt from the table on the first search after its data_versions
+    # counter moves, which any worker's write to the table does. Checking
+    # it costs a primary-key lookup per search.
+
+    def __init__(self, load: Callable[[Session], list[tuple[int, str]]], version_name: str):
+        self._load = load
+        self._version_name = version_name
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, session: Session) -> TrigramIndex:
+        version = read_data_version(session, self._version_name)
+        with self._lock:
+            if self._index is None or self._version != version:
+                self._index = TrigramIndex(self._load(session))
+                self._version = version
+            return self._index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index = None
+            self._version = None
+
+
+user_name_index = NameIndex(lambda session: session.query(User.id, User.name).all(), DATA_USERS)
+group_name_index = NameIndex(lambda session: session.query(Group.id, Group.name).all(), DATA_GROUPS)
+
+
+def find_users_by_name(
+    session: Session, name: str, limit: int = DEFAULT_MATCH_LIMIT
+) -> list[dict]:
+    return user_name_index.get(session).search(name, limit)
+
+
+def find_groups_by_name(
+    session: Session, name: str, limit: int = DEFAULT_MATCH_LIMIT
+) -> list[dict]:
+    return group_name_index.get(session).search(name, limit)
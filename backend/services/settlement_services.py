@@ -0,0 +1,81 @@
+import heapq
+from collections import defaultdict
+from services.money_services import from_cents
+
+# Subset DP is O(2^n * n); beyond this many non-settled members use greedy.
+EXACT_SETTLEMENT_MAX_MEMBERS = 12
+
+
+def net_positions(pairs: list[tuple[int, int, int]]) -> dict[int, int]:
+    # Net position per user in cents: positive means the user is owed money.
+    net = defaultdict(int)
+    for debtor, creditor, cents in pairs:
+        if cents > 0:
+            net[debtor] -= cents
+            net[creditor] += cents
+    return {user_id: cents for user_id, cents in net.items() if cents != 0}
+
+
+def _transfer(debtor: int, creditor: int, cents: int) -> dict:
+    return {"from_user": debtor, "to_user": creditor, "amount": from_cents(cents)}
+
+
+def greedy_settlements(net: dict[int, int]) -> list[dict]:
+    # Repeatedly match the largest creditor with the largest debtor. Every
+    # transfer settles at least one of the two, so there are at most n - 1.
+    creditors = [(-cents, user_id) for user_id, cents in net.items() if cents > 0]
+    debtors = [(cents, user_id) for user_id, cents in net.items() if cents < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debit, debtor = heapq.heappop(debtors)
+        cents = min(-credit, -debit)
+        transfers.append(_transfer(debtor, creditor, cents))
+
+        if -credit > cents:
+            heapq.heappush(creditors, (credit + cents, creditor))
+        if -debit > cents:
+            heapq.heappush(debtors, (debit + cents, debtor))
+
+    return transfers
+
+
+def exact_settlements(net: dict[int, int]) -> list[dict]:
+    # The minimum number of transfers is n minus the largest number of
+    # disjoint zero-sum subsets the members can be partitioned into. Find
+    # that partition with a DP over subsets, then settle each subset greedily.
+    users = sorted(net)
+    amounts = [net[u] for u in users]
+    n = len(users)
+    full = (1 << n) - 1
+
+    subset_sum = [0] * (1 << n)
+    best = [0] * (1 << n)
+    removed = [0] * (1 << n)
+    for mask in range(1, full + 1):
+        low = (mask & -mask).bit_length() - 1
+        subset_sum[mask] = subset_sum[mask & (mask - 1)] + amounts[low]
+
+        for i in range(n):
+            bit = 1 << i
+            if mask & bit and best[mask ^ bit] >= best[mask]:
+                best[mask] = best[mask ^ bit]
+                removed[mask] = i
+        if subset_sum[mask] == 0:
+            best[mask] += 1
+
+    transfers = []
+    group = {}
+    mask = full
+    while mask:
+        i = removed[mask]
+        group[users[i]] = amounts[i]
+        mask ^= 1 << i
+        if subset_sum[mask] == 0:
+            transfers.extend(greedy_settlements(group))
+            group = {}
+
+    return transfers
@@ -0,0 +1,307 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Integer, column, func, insert, literal, or_, select, table, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import BalanceCheckpoint, BalanceCheckpointRow, Expense, Split
+from services.columnar_services import split_legs_batch_query, split_legs_query
+from utils import as_utc
+
+# Balances as of a point in time start from the latest checkpoint at or
+# before it and only fold in the expenses created after the checkpoint, so
+# the cost depends on how recent the checkpoint is, not on the group's age.
+# Expenses are stamped when they are flushed, so a transaction still in
+# flight can commit one a little older than now; checkpoints are only taken
+# this far in the past so they can't miss it.
+CHECKPOINT_SETTLE_SECONDS = float(os.getenv("CHECKPOINT_SETTLE_SECONDS", "60"))
+
+Checkpoint = tuple[int, datetime]
+
+# Migration 5 gave expenses that already existed the time it ran as their
+# created_at, so the history before that moment is unknown.
+EXPENSE_TIMESTAMPS_MIGRATION = 5
+schema_migrations = table(
+    "schema_migrations",
+    column("version", Integer),
+    column("applied_at", DateTime(timezone=True)),
+)
+
+
+def history_start_query():
+    # The backfilled expenses are the ones stamped no later than the
+    # migration was recorded, and they share the oldest created_at. A
+    # database created with timestamps from the start has none, and no row.
+    earliest = select(func.min(Expense.created_at)).scalar_subquery()
+    return select(earliest).where(
+        schema_migrations.c.version == EXPENSE_TIMESTAMPS_MIGRATION,
+        earliest <= schema_migrations.c.applied_at,
+    )
+
+
+def _check_window(history_start, since: Optional[datetime], as_of: Optional[datetime]) -> None:
+    history_start = as_utc(history_start)
+    if history_start is None:
+        return
+    for name, value in (("since", since), ("as_of", as_of)):
+        if value is not None and value < history_start:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"{name} is before {history_start.isoformat()}: expenses older than "
+                    "that were recorded before timestamps were kept"
+                ),
+            )
+
+
+def latest_checkpoint_query(as_of: Optional[datetime] = None):
+    query = select(BalanceCheckpoint.id, BalanceCheckpoint.as_of)
+    if as_of is not None:
+        query = query.where(BalanceCheckpoint.as_of <= as_of)
+    return query.order_by(BalanceCheckpoint.as_of.desc()).limit(1)
+
+
+def _checkpoint(row) -> Optional[Checkpoint]:
+    return None if row is None else (row.id, as_utc(row.as_of))
+
+
+def _combine(parts: list):
+    return (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+
+
+def windowed_pairs_query(
+    group_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+    checkpoint: Optional[Checkpoint] = None,
+):
+    # (debtor, creditor, cents) over the expenses created in (since, as_of],
+    # ordered like pairwise_debts_query. A checkpoint stands in for every
+    # expense up to its own as_of, so it replaces since.
+    if checkpoint is not None:
+        checkpoint_id, since = checkpoint
+
+    legs = split_legs_query(group_id, user_id, since, as_of).subquery()
+    parts = [
+        select(
+            legs.c.user_id.label("debtor_id"),
+            legs.c.paid_by.label("creditor_id"),
+            legs.c.amount_owed_cents.label("amount_cents"),
+        )
+    ]
+    if checkpoint is not None:
+        rows = select(
+            BalanceCheckpointRow.debtor_id,
+            BalanceCheckpointRow.creditor_id,
+            BalanceCheckpointRow.amount_cents,
+        ).where(BalanceCheckpointRow.checkpoint_id == checkpoint_id)
+        if group_id is not None:
+            rows = rows.where(BalanceCheckpointRow.group_id == group_id)
+        if user_id is not None:
+            rows = rows.where(
+                or_(
+                    BalanceCheckpointRow.debtor_id == user_id,
+                    BalanceCheckpointRow.creditor_id == user_id,
+                )
+            )
+        parts.append(rows)
+
+    combined = _combine(parts)
+    return (
+        select(combined.c.debtor_id, combined.c.creditor_id, func.sum(combined.c.amount_cents))
+        .group_by(combined.c.debtor_id, combined.c.creditor_id)
+        .order_by(combined.c.debtor_id, combined.c.creditor_id)
+    )
+
+
+def windowed_batch_query(
+    group_ids: list[int],
+    user_ids: list[int],
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+    checkpoint: Optional[Checkpoint] = None,
+):
+    # (group_id, debtor, creditor, cents) like batch_pairs_query, over the
+    # same window as windowed_pairs_query.
+    if checkpoint is not None:
+        checkpoint_id, since = checkpoint
+
+    legs = split_legs_batch_query(group_ids, user_ids, since, as_of).subquery()
+    parts = [
+        select(
+            legs.c.group_id,
+            legs.c.user_id.label("debtor_id"),
+            legs.c.paid_by.label("creditor_id"),
+            legs.c.amount_owed_cents.label("amount_cents"),
+        )
+    ]
+    if checkpoint is not None:
+        parts.append(
+            select(
+                BalanceCheckpointRow.group_id,
+                BalanceCheckpointRow.debtor_id,
+                BalanceCheckpointRow.creditor_id,
+                BalanceCheckpointRow.amount_cents,
+            ).where(
+                BalanceCheckpointRow.checkpoint_id == checkpoint_id,
+                or_(
+                    BalanceCheckpointRow.group_id.in_(group_ids),
+                    BalanceCheckpointRow.debtor_id.in_(user_ids),
+                    BalanceCheckpointRow.creditor_id.in_(user_ids),
+                ),
+            )
+        )
+
+    combined = _combine(parts)
+    return select(
+        combined.c.group_id,
+        combined.c.debtor_id,
+        combined.c.creditor_id,
+        func.sum(combined.c.amount_cents),
+    ).group_by(combined.c.group_id, combined.c.debtor_id, combined.c.creditor_id)
+
+
+def windowed_pairs(
+    session: Session,
+    group_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[tuple[int, int, int]]:
+    since, as_of = as_utc(since), as_utc(as_of)
+    _check_window(session.execute(history_start_query()).scalar(), since, as_of)
+    checkpoint = None
+    if since is None:
+        checkpoint = _checkpoint(session.execute(latest_checkpoint_query(as_of)).first())
+    return session.execute(windowed_pairs_query(group_id, user_id, since, as_of, checkpoint)).all()
+
+
+def windowed_batch(
+    session: Session,
+    group_ids: list[int],
+    user_ids: list[int],
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[tuple[int, int, int, int]]:
+    since, as_of = as_utc(since), as_utc(as_of)
+    _check_window(session.execute(history_start_query()).scalar(), since, as_of)
+    checkpoint = None
+    if since is None:
+        checkpoint = _checkpoint(session.execute(latest_checkpoint_query(as_of)).first())
+    return session.execute(windowed_batch_query(group_ids, user_ids, since, as_of, checkpoint)).all()
+
+
+def take_balance_checkpoint(session: Session, as_of: Optional[datetime] = None) -> dict:
+    # Built from the previous checkpoint plus the expenses created since,
+    # in one INSERT ... SELECT.
+    now = datetime.now(timezone.utc)
+    latest_allowed = now - timedelta(seconds=CHECKPOINT_SETTLE_SECONDS)
+    as_of = as_utc(as_of) or latest_allowed
+    if as_of > latest_allowed:
+        raise ValueError(
+            f"A checkpoint must be at least {CHECKPOINT_SETTLE_SECONDS:g} seconds in the past"
+        )
+
+    existing = session.execute(
+        select(BalanceCheckpoint.id).where(BalanceCheckpoint.as_of == as_of)
+    ).scalar()
+    if existing is not None:
+        return {"id": existing, "as_of": as_of, "rows": None}
+
+    previous = _checkpoint(session.execute(latest_checkpoint_query(as_of)).first())
+    checkpoint = BalanceCheckpoint(as_of=as_of, created_at=now)
+    session.add(checkpoint)
+    session.flush()
+
+    legs = (
+        select(
+            Expense.group_id,
+            Split.user_id.label("debtor_id"),
+            Expense.paid_by.label("creditor_id"),
+            Split.amount_owed_cents.label("amount_cents"),
+        )
+        .join(Expense, Split.expense_id == Expense.id)
+        .where(Split.user_id != Expense.paid_by, Expense.created_at <= as_of)
+    )
+    parts = [legs]
+    if previous is not None:
+        previous_id, previous_as_of = previous
+        parts[0] = legs.where(Expense.created_at > previous_as_of)
+        parts.append(
+            select(
+                BalanceCheckpointRow.group_id,
+                BalanceCheckpointRow.debtor_id,
+                BalanceCheckpointRow.creditor_id,
+                BalanceCheckpointRow.amount_cents,
+            ).where(BalanceCheckpointRow.checkpoint_id == previous_id)
+        )
+
+    combined = _combine(parts)
+    result = session.execute(
+        insert(BalanceCheckpointRow).from_select(
+            ["checkpoint_id", "group_id", "debtor_id", "creditor_id", "amount_cents"],
+            select(
+                literal(checkpoint.id),
+                combined.c.group_id,
+                combined.c.debtor_id,
+                combined.c.creditor_id,
+                func.sum(combined.c.amount_cents),
+            ).group_by(combined.c.group_id, combined.c.debtor_id, combined.c.creditor_id),
+        )
+    )
+    session.commit()
+    return {"id": checkpoint.id, "as_of": as_of, "rows": result.rowcount}
+
+
+def prune_balance_checkpoints(session: Session, keep: int) -> int:
+    # Deletes all but the newest `keep` checkpoints; returns how many went.
+    stale = list(
+        session.scalars(
+            select(BalanceCheckpoint.id).order_by(BalanceCheckpoint.as_of.desc()).offset(keep)
+        )
+    )
+    if stale:
+        session.execute(
+            BalanceCheckpointRow.__table__.delete().where(BalanceCheckpointRow.checkpoint_id.in_(stale))
+        )
+        session.execute(BalanceCheckpoint.__table__.delete().where(BalanceCheckpoint.id.in_(stale)))
+        session.commit()
+    return len(stale)
+
+
+# Async variants for the async routes.
+
+async def windowed_pairs_async(
+    session: AsyncSession,
+    group_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[tuple[int, int, int]]:
+    since, as_of = as_utc(since), as_utc(as_of)
+    _check_window((await session.execute(history_start_query())).scalar(), since, as_of)
+    checkpoint = None
+    if since is None:
+        checkpoint = _checkpoint((await session.execute(latest_checkpoint_query(as_of))).first())
+    return (
+        await session.execute(windowed_pairs_query(group_id, user_id, since, as_of, checkpoint))
+    ).all()
+
+
+async def windowed_batch_async(
+    session: AsyncSession,
+    group_ids: list[int],
+    user_ids: list[int],
+    since: Optional[datetime] = None,
+    as_of: Optional[datetime] = None,
+) -> list[tuple[int, int, int, int]]:
+    since, as_of = as_utc(since), as_utc(as_of)
+    _check_window((await session.execute(history_start_query())).scalar(), since, as_of)
+    checkpoint = None
+    if since is None:
+        checkpoint = _checkpoint((await session.execute(latest_checkpoint_query(as_of))).first())
+    return (
+        await session.execute(windowed_batch_query(group_ids, user_ids, since, as_of, checkpoint))
+    ).all()
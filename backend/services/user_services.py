@@ -1,6 +1,11 @@
+from typing import Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User
 from fastapi import HTTPException
+from services.cache_services import DATA_USERS, bump_data_version
+from utils import keyset_page, serialize_user, STREAM_BATCH_SIZE
 
 def create_user(session: Session, name: str) -> User:
     existing = session.query(User).filter_by(name=name).first()
@@ -9,6 +14,8 @@ def create_user(session: Session, name: str) -> User:
 
     user = User(name=name)
     session.add(user)
+    session.flush()
+    bump_data_version(session, DATA_USERS)
     session.commit()
     session.refresh(user)
     return user
@@ -19,7 +26,24 @@ def get_user_by_id(session: Session, user_id: int) -> User:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-def get_all_users(session: Session):
-    return session.query(User).all()
+def _users_query():
+    return select(User.id, User.name)
 
+def get_all_users(
+    session: Session, after: Optional[int] = None, limit: Optional[int] = None
+) -> list[dict]:
+    rows = session.execute(keyset_page(_users_query(), User.id, after, limit))
+    return [serialize_user(row) for row in rows]
 
+def iter_all_users(session: Session):
+    rows = session.execute(
+        _users_query().order_by(User.id).execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    for row in rows:
+        yield serialize_user(row)
+
+async def get_all_users_async(
+    session: AsyncSession, after: Optional[int] = None, limit: Optional[int] = None
+) -> list[dict]:
+    rows = await session.execute(keyset_page(_users_query(), User.id, after, limit))
+    return [serialize_user(row) for row in rows]
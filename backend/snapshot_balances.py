@@ -0,0 +1,48 @@
+import argparse
+import sys
+from datetime import datetime
+from database import engine, SessionLocal
+from migrations import upgrade
+from services.snapshot_services import prune_balance_checkpoints, take_balance_checkpoint
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Record a balance checkpoint for as_of queries; run periodically, e.g. daily."
+    )
+    parser.add_argument(
+        "--as-of",
+        type=datetime.fromisoformat,
+        help="checkpoint time, ISO 8601 (default: now minus CHECKPOINT_SETTLE_SECONDS; naive means UTC)",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        help="afterwards, delete all but the newest KEEP checkpoints",
+    )
+    args = parser.parse_args()
+
+    upgrade(engine)
+
+    with SessionLocal() as session:
+        try:
+            checkpoint = take_balance_checkpoint(session, args.as_of)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+        if checkpoint["rows"] is None:
+            print(f"checkpoint {checkpoint['id']} at {checkpoint['as_of'].isoformat()} already exists")
+        else:
+            print(
+                f"checkpoint {checkpoint['id']} at {checkpoint['as_of'].isoformat()}: "
+                f"{checkpoint['rows']} ledger rows"
+            )
+
+        if args.keep is not None:
+            print(f"pruned {prune_balance_checkpoints(session, args.keep)} checkpoints")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# database.py reads the URL at import, so it is set before anything from the
+# app is imported. Every run gets its own throwaway SQLite file.
+_DB_DIR = tempfile.mkdtemp(prefix="expense-manager-tests-")
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+import models  # noqa: E402
+from database import engine  # noqa: E402
+from migrations import upgrade  # noqa: E402
+from services.cache_services import agent_tool_cache, group_ledger_cache, group_summary_cache  # noqa: E402
+from services.search_services import group_name_index, user_name_index  # noqa: E402
+from support import create_group, create_users, seed_expenses  # noqa: E402
+
+upgrade(engine)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    engine.dispose()
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    # Every test starts from empty tables and cold caches.
+    with engine.begin() as connection:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    for cache in (agent_tool_cache, group_ledger_cache, group_summary_cache, user_name_index, group_name_index):
+        cache.clear()
+    yield
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def dataset(client) -> dict:
+    users = create_users(client, [f"user {i}" for i in range(8)])
+    groups = [
+        create_group(client, "trip", users[:4]),
+        create_group(client, "flat", users[2:7]),
+        create_group(client, "empty", users[5:8]),
+    ]
+    seed_expenses(client, groups[0], users[:4], 12)
+    seed_expenses(client, groups[1], users[2:7], 9)
+    return {"users": users, "groups": groups}
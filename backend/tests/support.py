@@ -0,0 +1,45 @@
+import re
+
+SERVER_TIMING_STATEMENTS = re.compile(r'db;dur=[0-9.]+;desc="(\d+) statements"')
+
+
+def statement_count(response) -> int:
+    # From the Server-Timing header InstrumentationMiddleware adds.
+    match = SERVER_TIMING_STATEMENTS.search(response.headers["server-timing"])
+    return int(match.group(1))
+
+
+def create_users(client, names: list[str]) -> list[int]:
+    return [client.post("/users/", json={"name": name}).json()["id"] for name in names]
+
+
+def create_group(client, name: str, user_ids: list[int]) -> int:
+    return client.post("/groups/", json={"name": name, "user_ids": user_ids}).json()["id"]
+
+
+def add_expense(client, group_id: int, paid_by: int, amount: float, splits=None, **extra) -> dict:
+    body = {
+        "description": f"expense {amount}",
+        "amount": amount,
+        "paid_by": paid_by,
+        "split_type": "percentage" if splits else "equal",
+        **extra,
+    }
+    if splits:
+        body["splits"] = [{"user_id": user_id, "percentage": share} for user_id, share in splits]
+    response = client.post(f"/groups/{group_id}/expenses", json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def seed_expenses(client, group_id: int, member_ids: list[int], count: int, start: int = 0) -> None:
+    # A deterministic mix of equal and percentage splits, with the splits
+    # listed in descending user order so response order is exercised.
+    for i in range(start, start + count):
+        payer = member_ids[i % len(member_ids)]
+        amount = round(10 + i * 3.17, 2)
+        if i % 3 == 0 and len(member_ids) >= 2:
+            first, second = sorted(member_ids[:2], reverse=True)
+            add_expense(client, group_id, payer, amount, splits=[(first, 60), (second, 40)])
+        else:
+            add_expense(client, group_id, payer, amount)
@@ -0,0 +1,88 @@
+from database import SessionLocal
+from models import User
+from services.agent_tools import AgentToolContext, _group_version, _ledgers_version, _users_version
+from services.balance_services import calculate_all_user_totals
+from services.cache_services import DATA_USERS, agent_tool_cache, bump_data_version, read_data_version
+from services.expense_services import get_expenses_for_group
+from services.user_services import get_all_users
+from support import add_expense
+
+
+def _all_users() -> list[dict]:
+    with AgentToolContext() as ctx:
+        return ctx.cached("get_all_users", _users_version, get_all_users)
+
+
+def _expenses(group_id: int) -> list[dict]:
+    with AgentToolContext() as ctx:
+        return ctx.cached("get_expenses_per_group", _group_version, get_expenses_for_group, group_id)
+
+
+def _totals() -> list[dict]:
+    with AgentToolContext() as ctx:
+        return ctx.cached("calculate_all_user_totals", _ledgers_version, calculate_all_user_totals)
+
+
+def _counts() -> tuple[int, int]:
+    stats = agent_tool_cache.stats()
+    return stats["hits"], stats["misses"]
+
+
+def test_results_are_cached_until_a_write(client, dataset):
+    hits, misses = _counts()
+    first = _all_users()
+    assert _all_users() == first
+    assert _counts() == (hits + 1, misses + 1)
+
+    client.post("/users/", json={"name": "newcomer"})
+    assert _all_users()[-1]["name"] == "newcomer"
+    assert _counts() == (hits + 1, misses + 2)
+
+
+def test_expense_write_only_invalidates_its_group(client, dataset):
+    written, untouched = dataset["groups"][0], dataset["groups"][1]
+    users, before, totals = _all_users(), _expenses(untouched), _totals()
+    written_before = _expenses(written)
+    with SessionLocal() as session:
+        counters = read_data_version(session)
+
+    add_expense(client, written, dataset["users"][0], 10)
+    # Expense writes lock only their group's row, not a shared counter.
+    with SessionLocal() as session:
+        assert read_data_version(session) == counters
+
+    hits, misses = _counts()
+    assert _all_users() == users
+    assert _expenses(untouched) == before
+    assert _counts() == (hits + 2, misses)
+
+    assert len(_expenses(written)) == len(written_before) + 1
+    assert _totals() != totals
+    assert _counts() == (hits + 2, misses + 2)
+
+
+def test_write_from_another_worker_invalidates(client, dataset):
+    before = _all_users()
+    # What another process does: a write and its counter bump in one
+    # transaction, with nothing happening to this process's memory.
+    with SessionLocal() as session:
+        session.add(User(name="from elsewhere"))
+        session.flush()
+        bump_data_version(session, DATA_USERS)
+        session.commit()
+
+    after = _all_users()
+    assert [user["name"] for user in after] == [user["name"] for user in before] + ["from elsewhere"]
+
+
+def test_late_write_is_not_served_from_an_older_entry(client, dataset):
+    group_id = dataset["groups"][0]
+    with AgentToolContext() as ctx:
+        ctx.run(_group_version, group_id)
+        # A write after the turn started: whatever the turn caches must not
+        # be served once the write is visible.
+        add_expense(client, group_id, dataset["users"][0], 10)
+        ctx.cached("get_expenses_per_group", _group_version, get_expenses_for_group, group_id)
+
+    with SessionLocal() as session:
+        assert _expenses(group_id) == get_expenses_for_group(session, group_id)
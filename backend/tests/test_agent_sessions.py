@@ -0,0 +1,75 @@
+import pytest
+from fastapi import HTTPException
+
+from services import agent_sessions as sessions_module
+from services.agent_sessions import AgentSessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions_module, "time", clock)
+    return clock
+
+
+def _new(store: AgentSessionStore):
+    return store.get_or_create(None, object)
+
+
+def _missing(store: AgentSessionStore, session_id: str) -> bool:
+    try:
+        store.get_or_create(session_id, object)
+    except HTTPException as e:
+        assert e.status_code == 404
+        return True
+    return False
+
+
+def test_sessions_are_issued_by_the_server(clock):
+    store = AgentSessionStore(max_sessions=10, idle_ttl_seconds=60)
+    first, second = _new(store), _new(store)
+    assert first.session_id != second.session_id
+
+    again = store.get_or_create(first.session_id, object)
+    assert again is first and again.memory is first.memory
+    assert _missing(store, "chosen-by-client")
+    assert store.stats()["live_sessions"] == 2
+
+
+def test_idle_sessions_expire(clock):
+    store = AgentSessionStore(max_sessions=10, idle_ttl_seconds=60)
+    kept, idle = _new(store), _new(store)
+
+    clock.now += 45
+    store.get_or_create(kept.session_id, object)
+    clock.now += 30
+
+    assert _missing(store, idle.session_id)
+    assert store.get_or_create(kept.session_id, object) is kept
+    assert store.stats()["evicted"] == 1
+
+
+def test_least_recently_used_is_evicted_at_the_cap(clock):
+    store = AgentSessionStore(max_sessions=2, idle_ttl_seconds=60)
+    first, second = _new(store), _new(store)
+    clock.now += 1
+    store.get_or_create(first.session_id, object)
+
+    third = _new(store)
+    assert _missing(store, second.session_id)
+    assert store.get_or_create(first.session_id, object) is first
+    assert store.get_or_create(third.session_id, object) is third
+    assert store.stats() == {
+        "live_sessions": 2,
+        "max_sessions": 2,
+        "idle_ttl_seconds": 60,
+        "evicted": 1,
+    }
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from routes import agent_router
+from stub_llm import ANSWER, StubLLM
+
+
+class FailingLLM(StubLLM):
+    async def astream_chat_with_tools(self, *args, **kwargs):
+        raise RuntimeError("model unavailable")
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    llm = StubLLM(group_name="trip")
+    monkeypatch.setattr(agent_router, "llm", llm)
+    return llm
+
+
+def _stream(client, body: dict) -> list[tuple[str, dict]]:
+    # Reads the whole response, so it only returns once the stream ends.
+    response = client.post("/agent/query/stream", json=body)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.split("\n\n"):
+        if not block:
+            continue
+        event_line, data_line = block.split("\n")
+        assert event_line.startswith("event: ") and data_line.startswith("data: ")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def test_events_arrive_in_order(client, dataset, stub_llm):
+    events = _stream(client, {"query": "What are the balances in trip?"})
+    names = [name for name, _ in events]
+
+    assert names[0] == "session"
+    assert names[1:5] == ["tool_call_start", "tool_call_end", "tool_call_start", "tool_call_end"]
+    assert set(names[5:-1]) == {"token"}
+    assert names[-1] == "done"
+
+    find_start, find_end, balances_start, balances_end = (data for _, data in events[1:5])
+    assert find_start["tool"] == find_end["tool"] == "find_group_by_name"
+    assert find_start["arguments"] == {"name": "trip"}
+    assert find_start["id"] == find_end["id"]
+    assert balances_start["tool"] == balances_end["tool"] == "calculate_group_balances"
+    assert balances_start["arguments"] == {"group_id": dataset["groups"][0]}
+    assert not find_end["is_error"] and not balances_end["is_error"]
+
+    tokens = "".join(data["delta"] for name, data in events if name == "token")
+    assert tokens == events[-1][1]["response"] == ANSWER
+
+
+def test_session_is_reused(client, dataset, stub_llm):
+    session_id = _stream(client, {"query": "trip?"})[0][1]["session_id"]
+    events = _stream(client, {"query": "and again?", "session_id": session_id})
+    assert events[0] == ("session", {"session_id": session_id})
+    assert events[-1][0] == "done"
+
+
+def test_unknown_session_is_rejected(client, dataset, stub_llm):
+    for path in ("/agent/query/stream", "/agent/query"):
+        response = client.post(path, json={"query": "trip?", "session_id": "picked-by-client"})
+        assert response.status_code == 404
+
+
+def test_stream_ends_with_an_error_event(client, dataset, monkeypatch):
+    monkeypatch.setattr(agent_router, "llm", FailingLLM())
+    events = _stream(client, {"query": "trip?"})
+    assert [name for name, _ in events] == ["session", "error"]
+    assert "model unavailable" in events[-1][1]["detail"]
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from database import SessionLocal, get_async_db, get_async_engine
+from services import balance_services
+from services.expense_services import get_expenses_for_group, get_expenses_for_group_async
+from services.group_services import get_all_groups, get_all_groups_async
+from services.user_services import get_all_users, get_all_users_async
+
+
+def run_async(call):
+    # Drives get_async_db the way FastAPI does, on aiosqlite.
+    async def main():
+        sessions = get_async_db()
+        db = await sessions.__anext__()
+        try:
+            return await call(db)
+        finally:
+            await sessions.aclose()
+            await get_async_engine().dispose()
+
+    return asyncio.run(main())
+
+
+def run_sync(call):
+    with SessionLocal() as session:
+        return call(session)
+
+
+def both(sync_fn, async_fn, *args, **kwargs):
+    return (
+        run_sync(lambda session: sync_fn(session, *args, **kwargs)),
+        run_async(lambda db: async_fn(db, *args, **kwargs)),
+    )
+
+
+def test_async_session_uses_aiosqlite():
+    assert get_async_engine().dialect.driver == "aiosqlite"
+
+
+@pytest.mark.parametrize("after, limit", [(None, None), (None, 3), (2, 3)])
+def test_listings_match(client, dataset, after, limit):
+    group_id = dataset["groups"][0]
+    for sync_fn, async_fn, args in (
+        (get_all_users, get_all_users_async, ()),
+        (get_all_groups, get_all_groups_async, ()),
+        (get_expenses_for_group, get_expenses_for_group_async, (group_id,)),
+    ):
+        sync_result, async_result = both(sync_fn, async_fn, *args, after=after, limit=limit)
+        assert sync_result
+        assert async_result == sync_result
+
+
+@pytest.mark.parametrize("engine_name", balance_services.BALANCE_ENGINES)
+def test_balances_match(client, dataset, monkeypatch, engine_name):
+    monkeypatch.setattr(balance_services, "BALANCE_ENGINE", engine_name)
+    users, groups = dataset["users"], dataset["groups"]
+
+    for group_id in groups:
+        sync_result, async_result = both(
+            balance_services.calculate_group_balances,
+            balance_services.calculate_group_balances_async,
+            group_id,
+        )
+        assert async_result == sync_result
+        sync_result, async_result = both(
+            balance_services.calculate_group_settlements,
+            balance_services.calculate_group_settlements_async,
+            group_id,
+            exact=True,
+        )
+        assert async_result == sync_result
+
+    for user_id in users:
+        sync_result, async_result = both(
+            balance_services.calculate_user_balances,
+            balance_services.calculate_user_balances_async,
+            user_id,
+        )
+        assert async_result == sync_result
+
+    sync_result, async_result = both(
+        balance_services.calculate_all_user_totals,
+        balance_services.calculate_all_user_totals_async,
+    )
+    assert sync_result and async_result == sync_result
+
+    sync_result, async_result = both(
+        balance_services.calculate_balances_batch,
+        balance_services.calculate_balances_batch_async,
+        users[:3],
+        groups,
+        simplify=True,
+    )
+    assert async_result == sync_result
+
+
+def test_missing_group_raises_the_same_error(client, dataset):
+    for sync_fn, async_fn in (
+        (get_expenses_for_group, get_expenses_for_group_async),
+        (balance_services.calculate_group_balances, balance_services.calculate_group_balances_async),
+    ):
+        with pytest.raises(HTTPException) as sync_error:
+            run_sync(lambda session: sync_fn(session, 999))
+        with pytest.raises(HTTPException) as async_error:
+            run_async(lambda db: async_fn(db, 999))
+        assert (async_error.value.status_code, async_error.value.detail) == (
+            sync_error.value.status_code,
+            sync_error.value.detail,
+        )
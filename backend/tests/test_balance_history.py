@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from database import SessionLocal, engine
+from models import Expense
+from services import snapshot_services
+from services.ledger_services import compute_ledger_from_splits
+from services.snapshot_services import (
+    EXPENSE_TIMESTAMPS_MIGRATION,
+    schema_migrations,
+    take_balance_checkpoint,
+    windowed_pairs,
+)
+from support import seed_expenses
+
+
+def _group_ledger(ledger: dict, group_id: int) -> dict:
+    return {(debtor, creditor): cents for (g, debtor, creditor), cents in ledger.items() if g == group_id}
+
+
+def _windowed(session, group_id: int, **window) -> dict:
+    return {(debtor, creditor): cents for debtor, creditor, cents in windowed_pairs(session, group_id=group_id, **window)}
+
+
+def test_checkpoint_and_newer_expenses_match_the_ledger(client, dataset, monkeypatch):
+    monkeypatch.setattr(snapshot_services, "CHECKPOINT_SETTLE_SECONDS", 0)
+    users, groups = dataset["users"], dataset["groups"]
+    checkpoint_at = datetime.now(timezone.utc)
+    with SessionLocal() as session:
+        checkpoint = take_balance_checkpoint(session, checkpoint_at)
+        assert checkpoint["rows"]
+        before = compute_ledger_from_splits(session)
+
+    seed_expenses(client, groups[0], users[:4], 7, start=50)
+    seed_expenses(client, groups[2], users[5:8], 4, start=80)
+
+    with SessionLocal() as session:
+        after = compute_ledger_from_splits(session)
+        now = datetime.now(timezone.utc)
+        for group_id in groups:
+            assert _windowed(session, group_id, as_of=now) == _group_ledger(after, group_id)
+            assert _windowed(session, group_id, as_of=checkpoint_at) == _group_ledger(before, group_id)
+            changed = {
+                pair: cents - _group_ledger(before, group_id).get(pair, 0)
+                for pair, cents in _group_ledger(after, group_id).items()
+            }
+            since = _windowed(session, group_id, since=checkpoint_at, as_of=now)
+            assert {pair: cents for pair, cents in changed.items() if cents} == since
+
+
+def test_window_before_the_timestamp_backfill_is_rejected(client, dataset):
+    # What migration 5 leaves behind on an existing database: old expenses
+    # stamped with the time it ran, just before it was recorded.
+    backfilled_at = datetime.now(timezone.utc) - timedelta(days=1)
+    with engine.begin() as connection:
+        connection.execute(update(Expense).values(created_at=backfilled_at))
+        connection.execute(
+            update(schema_migrations)
+            .where(schema_migrations.c.version == EXPENSE_TIMESTAMPS_MIGRATION)
+            .values(applied_at=backfilled_at + timedelta(seconds=1))
+        )
+
+    group_id, user_id = dataset["groups"][0], dataset["users"][0]
+    earlier = (backfilled_at - timedelta(hours=1)).isoformat()
+    for path in (f"/groups/{group_id}/balances", f"/users/{user_id}/balances", "/users/all/balances"):
+        for window in ("as_of", "since"):
+            response = client.get(path, params={window: earlier})
+            assert response.status_code == 400, (path, window)
+            assert "before timestamps were kept" in response.json()["detail"]
+
+    current = client.get(f"/groups/{group_id}/balances").json()
+    later = (backfilled_at + timedelta(seconds=2)).isoformat()
+    assert client.get(f"/groups/{group_id}/balances", params={"as_of": later}).json() == current
+
+
+def test_fresh_database_has_no_history_limit(client, dataset):
+    long_ago = datetime(2000, 1, 1, tzinfo=timezone.utc).isoformat()
+    response = client.get(f"/groups/{dataset['groups'][0]}/balances", params={"as_of": long_ago})
+    assert response.status_code == 200
+    assert response.json() == []
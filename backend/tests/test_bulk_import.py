@@ -0,0 +1,142 @@
+from sqlalchemy import event
+
+from database import SessionLocal, engine
+from services import expense_services
+from services.ledger_services import verify_balances
+from support import add_expense, create_group
+
+
+def _bulk(client, group_id: int, **kwargs) -> dict:
+    response = client.post(f"/groups/{group_id}/expenses/bulk", **kwargs)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _csv(client, group_id: int, text: str) -> dict:
+    return _bulk(client, group_id, content=text.encode(), headers={"Content-Type": "text/csv"})
+
+
+def _row(paid_by: int, amount=30, **extra) -> dict:
+    return {"description": f"row {amount}", "amount": amount, "paid_by": paid_by, "split_type": "equal", **extra}
+
+
+def test_json_list_and_wrapped_object(client, dataset):
+    group_id, users = dataset["groups"][0], dataset["users"]
+    result = _bulk(client, group_id, json=[_row(users[0]), _row(users[1], 12.5)])
+    assert (result["created"], result["failed"]) == (2, 0)
+
+    result = _bulk(client, group_id, json={"expenses": [_row(users[2])]})
+    assert result["created"] == 1
+
+    listed = {expense["id"] for expense in client.get(f"/groups/{group_id}/expenses").json()}
+    assert set(result["expense_ids"]) <= listed
+
+
+def test_csv_rows_with_percentage_splits(client, dataset):
+    group_id, users = dataset["groups"][0], dataset["users"]
+    result = _csv(
+        client,
+        group_id,
+        "description,amount,paid_by,split_type,splits\n"
+        f"Dinner,60,{users[0]},percentage,{users[0]}:50;{users[1]}:50\n"
+        f"Taxi,9,{users[2]},equal,\n",
+    )
+    assert (result["created"], result["errors"]) == (2, [])
+
+    dinner, taxi = [
+        expense for expense in client.get(f"/groups/{group_id}/expenses").json()
+        if expense["id"] in result["expense_ids"]
+    ]
+    assert [(s["user_id"], s["amount_owed"]) for s in dinner["splits"]] == [(users[0], 0), (users[1], 30)]
+    assert taxi["split_type"] == "equal" and len(taxi["splits"]) == 4
+
+
+def test_unparseable_body_is_rejected(client, dataset):
+    group_id = dataset["groups"][0]
+    response = client.post(
+        f"/groups/{group_id}/expenses/bulk", content=b"not json", headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 400
+    response = client.post(f"/groups/{group_id}/expenses/bulk", json={"rows": []})
+    assert response.status_code == 400
+
+
+def test_invalid_rows_are_reported_per_row(client, dataset):
+    group_id, users = dataset["groups"][0], dataset["users"]
+    outsider = dataset["users"][7]
+    result = _bulk(
+        client,
+        group_id,
+        json=[
+            _row(users[0]),
+            "not an object",
+            _row(users[0], amount="lots"),
+            _row(outsider),
+            _row(users[0], split_type="percentage", splits=[{"user_id": users[0], "percentage": 40}]),
+            _row(users[1]),
+        ],
+    )
+    assert result["created"] == 2
+    assert [error["row"] for error in result["errors"]] == [1, 2, 3, 4]
+    assert "amount" in result["errors"][1]["error"]
+    assert "not a member" in result["errors"][2]["error"]
+    assert result["errors"][3]["error"] == "Total percentage must be 100"
+
+
+def test_csv_row_with_extra_fields_is_a_row_error(client, dataset):
+    group_id, users = dataset["groups"][0], dataset["users"]
+    result = _csv(
+        client,
+        group_id,
+        "description,amount,paid_by,split_type,splits\n"
+        f"Dinner,60,{users[0]},equal,,surplus\n"
+        f"Taxi,9,{users[2]},equal,\n",
+    )
+    assert result["created"] == 1
+    assert result["errors"] == [{"row": 0, "error": "Row has more fields than the header"}]
+
+
+def test_one_commit_per_chunk(client, dataset, monkeypatch):
+    monkeypatch.setattr(expense_services, "BULK_CHUNK_SIZE", 3)
+    group_id, users = dataset["groups"][0], dataset["users"]
+    commits = []
+
+    def count_commit(connection):
+        commits.append(connection)
+
+    event.listen(engine, "commit", count_commit)
+    try:
+        result = _bulk(client, group_id, json=[_row(users[i % 4], 10 + i) for i in range(7)])
+    finally:
+        event.remove(engine, "commit", count_commit)
+
+    assert result["created"] == 7
+    assert len(commits) == 3
+
+
+def test_ledger_matches_expenses_added_one_by_one(client, dataset):
+    # The same expenses, imported into one group and posted one at a time
+    # into another with the same members, leave the same balances.
+    users = dataset["users"][:4]
+    imported, posted = dataset["groups"][0], create_group(client, "twin", users)
+    for expense in client.get(f"/groups/{imported}/expenses").json():
+        add_expense(client, posted, expense["paid_by"], expense["amount"], splits=[
+            (split["user_id"], split["percentage"]) for split in expense["splits"]
+        ] if expense["split_type"] == "percentage" else None)
+
+    rows = [
+        _row(users[0], 100),
+        _row(users[1], 45.5, split_type="percentage", splits=[
+            {"user_id": users[1], "percentage": 25}, {"user_id": users[3], "percentage": 75},
+        ]),
+        _row(users[2], 0.01),
+    ]
+    assert _bulk(client, imported, json=rows)["created"] == 3
+    for row in rows:
+        add_expense(client, posted, row["paid_by"], row["amount"], splits=[
+            (split["user_id"], split["percentage"]) for split in row.get("splits", [])
+        ])
+
+    assert client.get(f"/groups/{imported}/balances").json() == client.get(f"/groups/{posted}/balances").json()
+    with SessionLocal() as session:
+        assert verify_balances(session) == []
@@ -0,0 +1,31 @@
+# The frontend runs on another origin (:3001 calling :5000), so it can only
+# read the response headers CORS exposes.
+FRONTEND_ORIGIN = "http://localhost:3001"
+
+
+def _exposed(response) -> set[str]:
+    header = response.headers.get("access-control-expose-headers", "")
+    return {name.strip().lower() for name in header.split(",") if name.strip()}
+
+
+def test_next_cursor_is_exposed(client, dataset):
+    response = client.get("/users/?limit=2", headers={"Origin": FRONTEND_ORIGIN})
+    assert response.status_code == 200
+    assert "X-Next-Cursor" in response.headers
+    assert "x-next-cursor" in _exposed(response)
+
+
+def test_idempotent_replayed_is_exposed(client, dataset):
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    body = {"description": "cors", "amount": 10, "paid_by": payer, "split_type": "equal"}
+    headers = {"Origin": FRONTEND_ORIGIN, "Idempotency-Key": "cors"}
+    client.post(f"/groups/{group_id}/expenses", json=body, headers=headers)
+    response = client.post(f"/groups/{group_id}/expenses", json=body, headers=headers)
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert "idempotent-replayed" in _exposed(response)
+
+
+def test_ledger_version_is_exposed(client, dataset):
+    response = client.get(f"/groups/{dataset['groups'][0]}/balances", headers={"Origin": FRONTEND_ORIGIN})
+    assert "X-Ledger-Version" in response.headers
+    assert "x-ledger-version" in _exposed(response)
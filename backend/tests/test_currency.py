@@ -0,0 +1,38 @@
+from support import add_expense
+
+
+def _body(paid_by: int, **extra) -> dict:
+    return {"description": "dinner", "amount": 30, "paid_by": paid_by, "split_type": "equal", **extra}
+
+
+def test_default_currency_is_accepted(client, dataset):
+    expense = add_expense(client, dataset["groups"][0], dataset["users"][0], 30, currency="USD")
+    assert expense["currency"] == "USD"
+
+
+def test_other_currencies_are_rejected(client, dataset):
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    balances = client.get(f"/groups/{group_id}/balances").json()
+
+    response = client.post(f"/groups/{group_id}/expenses", json=_body(payer, currency="EUR"))
+    assert response.status_code == 400
+    assert "EUR" in response.json()["detail"]
+
+    response = client.post(
+        f"/groups/{group_id}/expenses", json=_body(payer, currency="EUR"), headers={"Idempotency-Key": "eur"}
+    )
+    assert response.status_code == 400
+    assert client.get(f"/groups/{group_id}/balances").json() == balances
+
+
+def test_bulk_rejects_rows_in_other_currencies(client, dataset):
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    response = client.post(
+        f"/groups/{group_id}/expenses/bulk",
+        json=[_body(payer), _body(payer, currency="GBP"), _body(payer, currency="USD")],
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["created"] == 2
+    assert [error["row"] for error in result["errors"]] == [1]
+    assert "GBP" in result["errors"][0]["error"]
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from routes import event_router
+from services import balance_services
+from services.event_services import event_bus
+from support import add_expense
+
+
+def _balances(client, group_id: int) -> tuple[int, dict]:
+    response = client.get(f"/groups/{group_id}/balances")
+    assert response.status_code == 200, response.text
+    balances = {(row["from_user"], row["to_user"]): row["amount"] for row in response.json()}
+    return int(response.headers["X-Ledger-Version"]), balances
+
+
+def _apply(balances: dict, delta: list[dict]) -> dict:
+    result = dict(balances)
+    for row in delta:
+        pair = (row["from_user"], row["to_user"])
+        result[pair] = round(result.get(pair, 0) + row["amount"], 2)
+    return result
+
+
+def _close_code(websocket) -> int:
+    with pytest.raises(WebSocketDisconnect) as closed:
+        while True:
+            websocket.receive_json()
+    return closed.value.code
+
+
+def test_subscribed_frame_and_events_carry_the_ledger_version(client, dataset):
+    group_id, users = dataset["groups"][0], dataset["users"]
+    with client.websocket_connect(f"/ws/groups/{group_id}") as websocket:
+        hello = websocket.receive_json()
+        version, balances = _balances(client, group_id)
+        assert hello == {"type": "subscribed", "group_id": group_id, "seq": version}
+
+        add_expense(client, group_id, users[1], 40)
+        add_expense(client, group_id, users[2], 25, splits=[(users[0], 50), (users[2], 50)])
+        events = [websocket.receive_json(), websocket.receive_json()]
+
+    assert [event["seq"] for event in events] == [version + 1, version + 2]
+    for event in events:
+        balances = _apply(balances, event["balance_delta"])
+    latest, current = _balances(client, group_id)
+    assert latest == version + 2
+    assert {pair: amount for pair, amount in balances.items() if amount} == current
+
+
+def test_unknown_group_is_closed(client, dataset):
+    with client.websocket_connect("/ws/groups/999") as websocket:
+        assert _close_code(websocket) == event_router.CLOSE_NOT_FOUND
+    assert event_bus.subscriber_count() == 0
+
+
+def test_subscriber_cap(client, dataset, monkeypatch):
+    monkeypatch.setattr(event_bus, "max_subscribers", 1)
+    group_id = dataset["groups"][0]
+    rejected = event_bus.rejected
+    with client.websocket_connect(f"/ws/groups/{group_id}") as first:
+        first.receive_json()
+        with client.websocket_connect(f"/ws/groups/{group_id}") as second:
+            assert _close_code(second) == event_router.CLOSE_TRY_AGAIN
+        assert event_bus.rejected == rejected + 1
+        # Other groups have their own cap.
+        with client.websocket_connect(f"/ws/groups/{dataset['groups'][1]}") as other:
+            assert other.receive_json()["type"] == "subscribed"
+
+
+def test_subscriber_that_falls_behind_is_dropped(client, dataset, monkeypatch):
+    monkeypatch.setattr(event_bus, "max_pending", 2)
+    group_id = dataset["groups"][0]
+    dropped = event_bus.dropped
+    with client.websocket_connect(f"/ws/groups/{group_id}") as websocket:
+        hello = websocket.receive_json()
+
+        def publish_burst():
+            # On the socket's event loop, so every delivery is queued before
+            # the socket task gets to run.
+            for seq in range(hello["seq"] + 1, hello["seq"] + 6):
+                event_bus.publish(group_id, seq, {"type": "expenses_added", "expense_ids": [], "balance_delta": []})
+
+        websocket.portal.call(publish_burst)
+        assert _close_code(websocket) == event_router.CLOSE_TRY_AGAIN
+    assert event_bus.dropped == dropped + 1
+    assert event_bus.subscriber_count() == 0
+
+
+def test_client_that_stops_reading_is_closed(client, dataset, monkeypatch):
+    monkeypatch.setattr(event_router, "WS_SEND_TIMEOUT_SECONDS", 0.05)
+    send_json = WebSocket.send_json
+
+    async def stuck_send_json(self, data, mode="text"):
+        # Delivers the subscribed frame, then blocks like a client whose
+        # receive window is full.
+        if data.get("type") == "subscribed":
+            return await send_json(self, data, mode)
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(WebSocket, "send_json", stuck_send_json)
+    group_id = dataset["groups"][0]
+    with client.websocket_connect(f"/ws/groups/{group_id}") as websocket:
+        websocket.receive_json()
+        add_expense(client, group_id, dataset["users"][0], 10)
+        assert _close_code(websocket) == event_router.CLOSE_TRY_AGAIN
+    assert event_bus.subscriber_count() == 0
+
+
+@pytest.mark.parametrize("engine_name", balance_services.BALANCE_ENGINES)
+def test_balances_report_their_ledger_version(client, dataset, monkeypatch, engine_name):
+    monkeypatch.setattr(balance_services, "BALANCE_ENGINE", engine_name)
+    group_id = dataset["groups"][0]
+    version, _ = _balances(client, group_id)
+    add_expense(client, group_id, dataset["users"][0], 10)
+    assert _balances(client, group_id)[0] == version + 1
+
+    simplified = client.get(f"/groups/{group_id}/balances", params={"simplify": True})
+    assert simplified.headers["X-Ledger-Version"] == str(version + 1)
+    windowed = client.get(f"/groups/{group_id}/balances", params={"since": "2000-01-01T00:00:00Z"})
+    assert windowed.status_code == 200
+    assert "X-Ledger-Version" not in windowed.headers
@@ -0,0 +1,122 @@
+from sqlalchemy import text
+
+from database import SessionLocal, engine
+from models import Balance
+from services.cache_services import GroupLedger, GroupLedgerCache, group_ledger_cache
+from services.ledger_services import PENDING_LEDGER_WRITES, apply_ledger_deltas, group_version_query
+from support import add_expense
+
+
+def _version(group_id: int) -> int:
+    with SessionLocal() as session:
+        return session.execute(group_version_query(group_id)).scalar_one()
+
+
+def _stored_pairs(group_id: int) -> list[tuple[int, int, int]]:
+    with SessionLocal() as session:
+        rows = session.query(Balance.debtor_id, Balance.creditor_id, Balance.amount_cents).filter(
+            Balance.group_id == group_id
+        )
+        return sorted(tuple(row) for row in rows)
+
+
+def _load(client, group_id: int) -> list[dict]:
+    response = client.get(f"/groups/{group_id}/balances")
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_committed_writes_go_through_to_the_cache(client, dataset):
+    group_id = dataset["groups"][0]
+    _load(client, group_id)
+    before = group_ledger_cache.stats()
+
+    add_expense(client, group_id, dataset["users"][1], 25)
+
+    cached = group_ledger_cache.get(group_id, _version(group_id))
+    assert cached is not None
+    assert cached.pairs() == _stored_pairs(group_id)
+    assert group_ledger_cache.stats()["write_throughs"] == before["write_throughs"] + 1
+
+
+def test_rolled_back_writes_are_dropped(client, dataset):
+    group_id, users = dataset["groups"][0], dataset["users"]
+    _load(client, group_id)
+    version = _version(group_id)
+    before = group_ledger_cache.stats()
+
+    with SessionLocal() as session:
+        apply_ledger_deltas(session, group_id, {(users[0], users[1]): 999})
+        assert session.info[PENDING_LEDGER_WRITES]
+        session.rollback()
+        assert PENDING_LEDGER_WRITES not in session.info
+
+    cached = group_ledger_cache.get(group_id, version)
+    assert cached is not None and cached.pairs() == _stored_pairs(group_id)
+    assert group_ledger_cache.stats()["write_throughs"] == before["write_throughs"]
+
+
+def test_write_by_another_worker_invalidates(client, dataset):
+    # Another process commits straight to the database, so nothing reaches
+    # this process's cache; the bumped version alone must retire the entry.
+    group_id, users = dataset["groups"][0], dataset["users"]
+    stale = _load(client, group_id)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "UPDATE balances SET amount_cents = amount_cents + 500 "
+                "WHERE group_id = :group_id AND debtor_id = :debtor AND creditor_id = :creditor"
+            ),
+            {"group_id": group_id, "debtor": users[1], "creditor": users[0]},
+        )
+        connection.execute(
+            text("UPDATE groups SET ledger_version = ledger_version + 1 WHERE id = :group_id"),
+            {"group_id": group_id},
+        )
+
+    misses = group_ledger_cache.stats()["misses"]
+    fresh = _load(client, group_id)
+    assert fresh != stale
+    assert group_ledger_cache.stats()["misses"] == misses + 1
+    assert group_ledger_cache.get(group_id, _version(group_id)).pairs() == _stored_pairs(group_id)
+
+
+def _ledger(version: int, pairs: int) -> GroupLedger:
+    return GroupLedger.from_pairs(version, [(1, creditor, 100) for creditor in range(2, 2 + pairs)])
+
+
+def test_least_recently_used_ledgers_are_evicted_by_size():
+    size = _ledger(1, 10).nbytes
+    cache = GroupLedgerCache(max_bytes=2 * size)
+    cache.put(1, _ledger(1, 10))
+    cache.put(2, _ledger(1, 10))
+    assert cache.get(1, 1) is not None
+
+    cache.put(3, _ledger(1, 10))
+    assert cache.get(2, 1) is None
+    assert cache.get(1, 1) is not None and cache.get(3, 1) is not None
+    assert cache.stats()["bytes"] == 2 * size <= cache.max_bytes
+
+    cache.put(4, _ledger(1, 1000))
+    assert cache.get(4, 1) is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_versions_only_move_forward():
+    cache = GroupLedgerCache(max_bytes=1 << 20)
+    cache.put(1, _ledger(5, 2))
+    cache.put(1, _ledger(4, 3))
+    assert len(cache.get(1, 5).pairs()) == 2
+
+    cache.apply(1, 6, {(1, 2): 50, (7, 1): 10})
+    assert cache.get(1, 6).pairs() == [(1, 2, 150), (1, 3, 100), (7, 1, 10)]
+
+    # A write that skipped a version means one was missed.
+    cache.apply(1, 8, {(1, 2): 1})
+    assert cache.stats()["entries"] == 0
+
+
+def test_zero_bytes_disables_the_cache():
+    cache = GroupLedgerCache(max_bytes=0)
+    cache.put(1, _ledger(1, 1))
+    assert cache.get(1, 1) is None
@@ -0,0 +1,42 @@
+from services.cache_services import group_summary_cache
+from support import add_expense, statement_count
+
+
+def _summary(client, group_id: int):
+    response = client.get(f"/groups/{group_id}/summary")
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_summary_is_served_from_cache(client, dataset):
+    group_id = dataset["groups"][0]
+    first = _summary(client, group_id)
+    hits = group_summary_cache.stats()["hits"]
+    second = _summary(client, group_id)
+
+    assert second.json() == first.json()
+    assert group_summary_cache.stats()["hits"] == hits + 1
+    # Only the groups.ledger_version lookup.
+    assert statement_count(second) == 1
+
+
+def test_new_expense_invalidates_only_its_group(client, dataset):
+    trip, flat = dataset["groups"][:2]
+    before = {group_id: _summary(client, group_id).json() for group_id in (trip, flat)}
+
+    add_expense(client, trip, dataset["users"][0], 42)
+
+    after = _summary(client, trip).json()
+    assert after["expense_count"] == before[trip]["expense_count"] + 1
+    assert after["latest_expenses"][0]["amount"] == 42
+    hits = group_summary_cache.stats()["hits"]
+    assert _summary(client, flat).json() == before[flat]
+    assert group_summary_cache.stats()["hits"] == hits + 1
+
+
+def test_unknown_groups_are_skipped(client, dataset):
+    trip = dataset["groups"][0]
+    response = client.get(f"/groups/summary?ids={trip},999")
+    assert response.status_code == 200, response.text
+    assert [summary["id"] for summary in response.json()] == [trip]
+    assert client.get("/groups/999/summary").status_code == 404
@@ -0,0 +1,128 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+
+from database import SessionLocal
+from models import Expense, IdempotencyKey
+from services import expense_services
+from services.ledger_services import verify_balances
+
+
+def _body(paid_by: int, amount=30) -> dict:
+    return {"description": "dinner", "amount": amount, "paid_by": paid_by, "split_type": "equal"}
+
+
+def _post(client, group_id: int, body: dict, key: str):
+    return client.post(f"/groups/{group_id}/expenses", json=body, headers={"Idempotency-Key": key})
+
+
+def _expense_count() -> int:
+    with SessionLocal() as session:
+        return session.scalar(select(func.count()).select_from(Expense))
+
+
+def test_retry_replays_the_stored_response(client, dataset):
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    before = _expense_count()
+
+    first = _post(client, group_id, _body(payer), "retry")
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+
+    retry = _post(client, group_id, _body(payer), "retry")
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert _expense_count() == before + 1
+
+
+def test_key_reused_for_another_body_is_rejected(client, dataset):
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    assert _post(client, group_id, _body(payer), "reused").status_code == 200
+    before = _expense_count()
+
+    response = _post(client, group_id, _body(payer, amount=31), "reused")
+    assert response.status_code == 422
+    assert _expense_count() == before
+
+
+def test_expired_key_is_accepted_as_new(client, dataset):
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    first = _post(client, group_id, _body(payer), "expiring").json()
+    with SessionLocal() as session:
+        session.execute(
+            update(IdempotencyKey).values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        )
+        session.commit()
+
+    response = _post(client, group_id, _body(payer, amount=31), "expiring")
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert response.json()["id"] != first["id"]
+    assert _post(client, group_id, _body(payer, amount=31), "expiring").json() == response.json()
+
+
+def _add_once(group_id: int, payer: int, key: str) -> tuple[dict, bool]:
+    with SessionLocal() as session:
+        return expense_services.add_expense_once(
+            session, key, group_id, "dinner", 30, payer, "equal", [],
+        )
+
+
+def test_concurrent_posts_create_one_expense(client, dataset, monkeypatch):
+    # Both requests look the key up before either commits, so the second
+    # one to commit hits the unique constraint and answers with the first.
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    before = _expense_count()
+    both_looked_up = threading.Barrier(2, timeout=10)
+    lookup = expense_services.find_stored_response
+    waited = set()
+
+    def racing_lookup(session, *args):
+        stored = lookup(session, *args)
+        if threading.get_ident() not in waited:
+            waited.add(threading.get_ident())
+            both_looked_up.wait()
+        return stored
+
+    monkeypatch.setattr(expense_services, "find_stored_response", racing_lookup)
+    results = [None, None]
+
+    def post(i: int) -> None:
+        results[i] = _add_once(group_id, payer, "race")
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    (first, first_replayed), (second, second_replayed) = results
+    assert first == second
+    assert sorted([first_replayed, second_replayed]) == [False, True]
+    assert _expense_count() == before + 1
+    with SessionLocal() as session:
+        assert verify_balances(session) == []
+
+
+def test_commit_conflict_answers_with_the_stored_expense(client, dataset, monkeypatch):
+    # The IntegrityError path on its own: the lookup misses a key that was
+    # committed in the meantime.
+    group_id, payer = dataset["groups"][0], dataset["users"][0]
+    stored, _ = _add_once(group_id, payer, "late")
+    before = _expense_count()
+
+    lookup = expense_services.find_stored_response
+    calls = []
+
+    def stale_lookup(session, *args):
+        calls.append(args)
+        return None if len(calls) == 1 else lookup(session, *args)
+
+    monkeypatch.setattr(expense_services, "find_stored_response", stale_lookup)
+    assert _add_once(group_id, payer, "late") == (stored, True)
+    assert len(calls) == 2
+    assert _expense_count() == before
+    with SessionLocal() as session:
+        assert verify_balances(session) == []
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import instrumentation
+from database import engine
+from instrumentation import InstrumentationMiddleware, RequestStats, current_request
+from support import statement_count
+
+
+def test_failed_statements_leave_no_timer_behind():
+    stats = RequestStats()
+    token = current_request.set(stats)
+    try:
+        with engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute(text("SELECT * FROM no_such_table"))
+            connection.execute(text("SELECT 1"))
+            assert connection.info.get("query_started") == []
+    finally:
+        current_request.reset(token)
+    # Failed statements still reached the database, so they are counted.
+    assert stats.statements == 4
+
+
+def test_server_timing_counts_statements(client, dataset):
+    assert statement_count(client.get(f"/groups/{dataset['groups'][0]}")) >= 1
+
+
+def test_slow_request_profile_is_written_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(instrumentation, "PROFILE_SLOW_REQUESTS_MS", 1.0)
+    written = []
+
+    async def slow_app(scope, receive, send):
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = InstrumentationMiddleware(slow_app)
+
+    def dump(started, finished, thread_ids, name):
+        written.append(threading.get_ident())
+        return "profile.folded"
+
+    monkeypatch.setattr(middleware.profiler, "dump", dump)
+
+    async def request():
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            pass
+
+        await middleware({"type": "http", "method": "GET", "path": "/slow"}, receive, send)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(request())
+    assert len(written) == 1
+    assert written[0] != loop_thread
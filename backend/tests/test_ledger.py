@@ -0,0 +1,28 @@
+from database import SessionLocal
+from models import Balance
+from services.ledger_services import apply_ledger_deltas, compute_ledger_from_splits, verify_balances
+
+
+def test_ledger_matches_splits(client, dataset):
+    with SessionLocal() as session:
+        assert verify_balances(session) == []
+        stored = {
+            (b.group_id, b.debtor_id, b.creditor_id): b.amount_cents
+            for b in session.query(Balance)
+        }
+        assert stored == compute_ledger_from_splits(session)
+
+
+def test_new_pair_is_upserted(client, dataset):
+    # The second write to a pair that didn't exist when the transaction
+    # started adds to it instead of violating the primary key.
+    group_id = dataset["groups"][2]
+    debtor, creditor = dataset["users"][5], dataset["users"][6]
+    with SessionLocal() as session:
+        apply_ledger_deltas(session, group_id, {(debtor, creditor): 150})
+        apply_ledger_deltas(session, group_id, {(debtor, creditor): 250, (creditor, debtor): 5})
+        session.commit()
+
+    with SessionLocal() as session:
+        assert session.get(Balance, (group_id, debtor, creditor)).amount_cents == 400
+        assert session.get(Balance, (group_id, creditor, debtor)).amount_cents == 5
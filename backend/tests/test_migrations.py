@@ -0,0 +1,98 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+import models
+from migrations import BASELINE_TABLES, MIGRATIONS, pending_migrations, upgrade
+from models import Balance, Expense
+from services.ledger_services import compute_ledger_from_splits
+
+# The schema before migrations existed, with amounts as floats.
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL)",
+    "CREATE TABLE groups (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL)",
+    "CREATE TABLE group_members (group_id INTEGER REFERENCES groups (id), "
+    "user_id INTEGER REFERENCES users (id), PRIMARY KEY (group_id, user_id))",
+    "CREATE TABLE expenses (id INTEGER PRIMARY KEY, group_id INTEGER REFERENCES groups (id), "
+    "description VARCHAR, amount FLOAT, paid_by INTEGER REFERENCES users (id), split_type VARCHAR(10))",
+    "CREATE TABLE splits (id INTEGER PRIMARY KEY, expense_id INTEGER REFERENCES expenses (id), "
+    "user_id INTEGER REFERENCES users (id), percentage FLOAT, amount_owed FLOAT NOT NULL)",
+]
+
+LEGACY_ROWS = [
+    "INSERT INTO users (id, name) VALUES (1, 'a'), (2, 'b'), (3, 'c')",
+    "INSERT INTO groups (id, name) VALUES (1, 'trip')",
+    "INSERT INTO group_members (group_id, user_id) VALUES (1, 1), (1, 2), (1, 3)",
+    "INSERT INTO expenses (id, group_id, description, amount, paid_by, split_type) VALUES "
+    "(1, 1, 'dinner', 100.0, 1, 'equal'), (2, 1, 'taxi', 10.1, 2, 'percentage')",
+    "INSERT INTO splits (id, expense_id, user_id, percentage, amount_owed) VALUES "
+    "(1, 1, 1, NULL, 33.34), (2, 1, 2, NULL, 33.33), (3, 1, 3, NULL, 33.33), "
+    "(4, 2, 1, 50, 5.05), (5, 2, 2, 30, 3.03), (6, 2, 3, 20, 2.02)",
+]
+
+
+def test_legacy_database_is_upgraded(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    try:
+        with legacy.begin() as connection:
+            for statement in LEGACY_SCHEMA + LEGACY_ROWS:
+                connection.execute(text(statement))
+
+        assert upgrade(legacy) == [version for version, _, _ in MIGRATIONS]
+        assert pending_migrations(legacy) == []
+        assert upgrade(legacy) == []
+
+        columns = {column["name"] for column in inspect(legacy).get_columns("splits")}
+        assert "amount_owed_cents" in columns and "amount_owed" not in columns
+        with Session(legacy) as session:
+            stored = {
+                (b.group_id, b.debtor_id, b.creditor_id): b.amount_cents
+                for b in session.query(Balance)
+            }
+            assert stored == compute_ledger_from_splits(session)
+            assert stored == {(1, 2, 1): 3333, (1, 3, 1): 3333, (1, 1, 2): 505, (1, 3, 2): 202}
+            assert all(expense.created_at is not None for expense in session.query(Expense))
+    finally:
+        legacy.dispose()
+
+
+def _schema(bind) -> dict:
+    # Tables with their columns, primary keys, indexes and unique constraints.
+    inspector = inspect(bind)
+    schema = {}
+    for table in inspector.get_table_names():
+        if table == "schema_migrations":
+            continue
+        schema[table] = (
+            sorted(column["name"] for column in inspector.get_columns(table)),
+            inspector.get_pk_constraint(table)["constrained_columns"],
+            sorted((index["name"], tuple(index["column_names"]), bool(index["unique"]))
+                   for index in inspector.get_indexes(table)),
+            sorted(tuple(constraint["column_names"]) for constraint in inspector.get_unique_constraints(table)),
+        )
+    return schema
+
+
+def test_steps_build_the_schema_the_models_declare(tmp_path):
+    # A database migrated step by step from nothing ends up where a fresh
+    # one created from the models starts, so every model change needs a step.
+    stepped = create_engine(f"sqlite:///{tmp_path / 'stepped.db'}")
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    try:
+        for _, _, step in MIGRATIONS:
+            step(stepped)
+        models.Base.metadata.create_all(bind=fresh)
+        assert _schema(stepped) == _schema(fresh)
+    finally:
+        stepped.dispose()
+        fresh.dispose()
+
+
+def test_initial_step_only_creates_the_baseline(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    try:
+        MIGRATIONS[0][2](legacy)
+        assert set(inspect(legacy).get_table_names()) == set(BASELINE_TABLES)
+        columns = {column["name"] for column in inspect(legacy).get_columns("expenses")}
+        assert "amount" in columns and "amount_cents" not in columns
+    finally:
+        legacy.dispose()
@@ -0,0 +1,73 @@
+from fractions import Fraction
+
+import pytest
+
+from services.money_services import allocate_cents, as_fraction, to_cents
+from support import create_group, create_users
+
+
+@pytest.mark.parametrize("total, weights, shares", [
+    (10000, [1, 1, 1], [3334, 3333, 3333]),
+    (10000, [50, 25, 25], [5000, 2500, 2500]),
+    (1, [1, 1, 1], [1, 0, 0]),
+    (200, [1, 1, 1], [67, 67, 66]),
+    (999, [Fraction(100, 3)] * 3, [333, 333, 333]),
+    (10000, [as_fraction(33.333333333333336)] * 2 + [as_fraction(33.33333333333333)], [3334, 3333, 3333]),
+])
+def test_largest_remainder_shares_add_up(total, weights, shares):
+    assert allocate_cents(total, weights) == shares
+    assert sum(shares) == total
+
+
+def test_shares_add_up_for_any_weights():
+    for total in range(0, 1000, 7):
+        for weights in ([1] * 7, [3, 1, 1], [Fraction(1, 3), Fraction(2, 3)], [60, 40]):
+            assert sum(allocate_cents(total, weights)) == total
+
+
+def test_amounts_round_to_the_nearest_cent():
+    assert to_cents(0.1) == 10
+    assert to_cents("19.99") == 1999
+    assert to_cents(0.005) == 1
+
+
+def _post(client, group_id: int, payer: int, shares: list[float], users: list[int]):
+    return client.post(f"/groups/{group_id}/expenses", json={
+        "description": "thirds",
+        "amount": 100,
+        "paid_by": payer,
+        "split_type": "percentage",
+        "splits": [{"user_id": user_id, "percentage": share} for user_id, share in zip(users, shares)],
+    })
+
+
+@pytest.fixture
+def foursome(client):
+    users = create_users(client, ["ann", "bob", "cat", "dan"])
+    return create_group(client, "four", users), users
+
+
+def test_split_shares_add_up_to_the_amount(client, foursome):
+    # The payer is outside the split, so everything is owed to them.
+    group_id, users = foursome
+    for shares in ([100 / 3] * 3, [50, 30, 20], [12.5, 12.5, 75]):
+        response = _post(client, group_id, users[3], shares, users[:3])
+        assert response.status_code == 200, response.text
+        owed = [round(split["amount_owed"] * 100) for split in response.json()["splits"]]
+        assert sum(owed) == 10000
+
+    response = client.post(f"/groups/{group_id}/expenses", json={
+        "description": "equal", "amount": 100, "paid_by": users[0], "split_type": "equal",
+    })
+    owed = sorted(split["amount_owed"] for split in response.json()["splits"])
+    assert owed == [0, 25, 25, 25]
+
+
+def test_percentages_must_add_up_to_100(client, foursome):
+    group_id, users = foursome
+    # Float thirds are within PERCENTAGE_TOLERANCE of 100; 99.99 is not.
+    thirds = [33.333333333333336, 33.333333333333336, 33.33333333333333]
+    assert _post(client, group_id, users[3], thirds, users[:3]).status_code == 200
+    response = _post(client, group_id, users[3], [33.33] * 3, users[:3])
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Total percentage must be 100"
@@ -0,0 +1,61 @@
+import pytest
+
+from support import create_group, create_users, seed_expenses, statement_count
+
+# Statements per request, whatever the number of rows: listings load each
+# relationship with one extra SELECT ... IN, never one query per row.
+MAX_STATEMENTS = {
+    # groups page, members, expense totals
+    "group listing": 3,
+    # group, members, expense totals
+    "group detail": 3,
+    # group check, expenses page, splits
+    "expense listing": 3,
+}
+
+
+def _paths(dataset: dict) -> dict:
+    group_id = dataset["groups"][0]
+    return {
+        "group listing": "/groups/",
+        "group detail": f"/groups/{group_id}",
+        "expense listing": f"/groups/{group_id}/expenses",
+    }
+
+
+def _counts(client, paths: dict) -> dict:
+    counts = {}
+    for name, path in paths.items():
+        response = client.get(path)
+        assert response.status_code == 200, response.text
+        counts[name] = statement_count(response)
+    return counts
+
+
+@pytest.mark.parametrize("name", sorted(MAX_STATEMENTS))
+def test_statements_per_request_are_bounded(client, dataset, name):
+    counts = _counts(client, _paths(dataset))
+    assert counts[name] <= MAX_STATEMENTS[name]
+
+
+def test_statement_count_does_not_grow_with_rows(client, dataset):
+    paths = _paths(dataset)
+    before = _counts(client, paths)
+
+    users = create_users(client, [f"extra {i}" for i in range(6)])
+    for i in range(4):
+        create_group(client, f"extra group {i}", users)
+    seed_expenses(client, dataset["groups"][0], dataset["users"][:4], 30, start=100)
+
+    assert _counts(client, paths) == before
+
+
+def test_paged_listings_are_bounded(client, dataset):
+    group_id = dataset["groups"][0]
+    for name, path in (
+        ("group listing", "/groups/?limit=2"),
+        ("expense listing", f"/groups/{group_id}/expenses?limit=5&after=2"),
+    ):
+        response = client.get(path)
+        assert response.status_code == 200, response.text
+        assert statement_count(response) <= MAX_STATEMENTS[name]
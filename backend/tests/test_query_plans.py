@@ -0,0 +1,38 @@
+from sqlalchemy import inspect, text
+
+import models
+from database import engine
+from datagen import generate
+from migrations import FOREIGN_KEY_INDEXES
+from query_plans import explain, hot_queries
+
+
+def _expected_indexes() -> dict[str, set[str]]:
+    expected = {}
+    for table in models.Base.metadata.sorted_tables:
+        expected[table.name] = {index.name for index in table.indexes}
+    for name, table, _ in FOREIGN_KEY_INDEXES:
+        expected[table].add(name)
+    return expected
+
+
+def test_indexes_exist():
+    inspector = inspect(engine)
+    missing = {
+        table: sorted(names - {index["name"] for index in inspector.get_indexes(table)})
+        for table, names in _expected_indexes().items()
+    }
+    assert {table: names for table, names in missing.items() if names} == {}
+
+
+def test_hot_queries_use_indexes():
+    # Enough rows that the planner prefers an index wherever one applies.
+    generate(engine, users=300, groups=60, members=(2, 8), expenses=3000)
+    with engine.connect() as connection:
+        connection.execute(text("ANALYZE"))
+        plans = {
+            name: explain(connection, statement)
+            for name, statement in hot_queries(1, 1, list(range(1, 51))).items()
+        }
+    full_scans = {name: lines for name, (lines, scans) in plans.items() if scans}
+    assert full_scans == {}
@@ -0,0 +1,72 @@
+import typing
+
+import pytest
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+
+from routes import expense_router, group_router, user_router
+
+# These routes return FastJSONResponse, so FastAPI never checks their
+# bodies against response_model; this does.
+LISTINGS = ["/users/", "/groups/", "/groups/{group_id}", "/groups/{group_id}/expenses"]
+
+
+def _response_model(path: str):
+    for router in (user_router.router, group_router.router, expense_router.router):
+        for route in router.routes:
+            if isinstance(route, APIRoute) and route.path == path and "GET" in route.methods:
+                return route.response_model
+    raise AssertionError(f"No GET route for {path}")
+
+
+def _model_of(annotation):
+    # The BaseModel inside Optional[...] / list[...], if any.
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in typing.get_args(annotation):
+        model = _model_of(arg)
+        if model is not None:
+            return model
+    return None
+
+
+def _assert_same_fields(value, annotation, where: str) -> None:
+    # Validation ignores extra keys, so also check that every body has
+    # exactly the fields its model declares.
+    model = _model_of(annotation)
+    if model is None:
+        return
+    if isinstance(value, list):
+        for i, item in enumerate(value):
+            _assert_same_fields(item, model, f"{where}[{i}]")
+        return
+    assert set(value) == set(model.model_fields), where
+    for name, field in model.model_fields.items():
+        if value[name] is not None:
+            _assert_same_fields(value[name], field.annotation, f"{where}.{name}")
+
+
+@pytest.mark.parametrize("route_path", LISTINGS)
+def test_listing_matches_its_response_model(client, dataset, route_path):
+    model = _response_model(route_path)
+    assert model is not None
+    path = route_path.format(group_id=dataset["groups"][0])
+    for query in ("", "?limit=2"):
+        if route_path == "/groups/{group_id}" and query:
+            continue
+        response = client.get(path + query)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        TypeAdapter(model).validate_python(body)
+        _assert_same_fields(body, model, path + query)
+
+
+def test_splits_are_listed_in_submitted_order(client, dataset):
+    # seed_expenses submits every third expense's splits in descending
+    # user order.
+    expenses = client.get(f"/groups/{dataset['groups'][0]}/expenses").json()
+    percentage = [expense for expense in expenses if expense["split_type"] == "percentage"]
+    assert percentage
+    for expense in percentage:
+        user_ids = [split["user_id"] for split in expense["splits"]]
+        assert user_ids == sorted(user_ids, reverse=True)
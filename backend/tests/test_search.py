@@ -0,0 +1,39 @@
+from database import SessionLocal
+from models import Group
+from services.cache_services import DATA_GROUPS, bump_data_version
+from services.search_services import find_groups_by_name, find_users_by_name, group_name_index, user_name_index
+from support import add_expense
+
+
+def test_index_survives_unrelated_writes(client, dataset):
+    with SessionLocal() as session:
+        index = user_name_index.get(session)
+    add_expense(client, dataset["groups"][0], dataset["users"][0], 25)
+    client.post("/groups/", json={"name": "another", "user_ids": dataset["users"][:2]})
+    with SessionLocal() as session:
+        assert user_name_index.get(session) is index
+
+
+def test_write_from_another_worker_rebuilds_the_index(client, dataset):
+    with SessionLocal() as session:
+        assert find_groups_by_name(session, "holiday") == []
+        index = group_name_index.get(session)
+
+    # Another process's write: only the database sees it.
+    with SessionLocal() as session:
+        session.add(Group(name="holiday"))
+        session.flush()
+        bump_data_version(session, DATA_GROUPS)
+        session.commit()
+
+    with SessionLocal() as session:
+        assert group_name_index.get(session) is not index
+        assert [match["name"] for match in find_groups_by_name(session, "holiday")] == ["holiday"]
+
+
+def test_new_user_is_found(client, dataset):
+    with SessionLocal() as session:
+        assert find_users_by_name(session, "zelda") == []
+    client.post("/users/", json={"name": "zelda"})
+    with SessionLocal() as session:
+        assert [match["name"] for match in find_users_by_name(session, "zelda")] == ["zelda"]
@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from services.settlement_services import (
+    EXACT_SETTLEMENT_MAX_MEMBERS,
+    exact_settlements,
+    greedy_settlements,
+)
+from support import add_expense, create_group, create_users
+
+
+def _settled(net: dict[int, int], transfers: list[dict]) -> dict[int, int]:
+    # What each member's position is once the transfers are made.
+    remaining = dict(net)
+    for transfer in transfers:
+        cents = round(transfer["amount"] * 100)
+        assert cents > 0
+        remaining[transfer["from_user"]] += cents
+        remaining[transfer["to_user"]] -= cents
+    return {user_id: cents for user_id, cents in remaining.items() if cents}
+
+
+def _fewest_transfers(amounts: list[int]) -> int:
+    # n minus the most disjoint zero-sum groups the amounts split into,
+    # found by trying every partition.
+    def most_groups(rest: list[int]) -> int:
+        if not rest:
+            return 0
+        first, others = rest[0], rest[1:]
+        best = -1
+        for mask in range(1 << len(others)):
+            chosen = [others[i] for i in range(len(others)) if mask >> i & 1]
+            if first + sum(chosen) == 0:
+                left = [others[i] for i in range(len(others)) if not mask >> i & 1]
+                best = max(best, 1 + most_groups(left))
+        return best
+
+    return len(amounts) - most_groups(amounts)
+
+
+def _random_nets(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        amounts = [rng.choice((-1, 1)) * rng.randint(1, 9) * 100 for _ in range(rng.randint(1, 6))]
+        amounts.append(-sum(amounts))
+        if 0 not in amounts:
+            yield {user_id: cents for user_id, cents in enumerate(amounts, start=1)}
+
+
+def test_settlements_conserve_amounts():
+    for net in _random_nets(200):
+        for settle in (greedy_settlements, exact_settlements):
+            assert _settled(net, settle(net)) == {}
+
+
+def test_greedy_uses_at_most_n_minus_one_transfers():
+    for net in _random_nets(200):
+        assert len(greedy_settlements(net)) <= len(net) - 1
+
+
+def test_exact_finds_the_fewest_transfers():
+    for net in _random_nets(200):
+        assert len(exact_settlements(net)) == _fewest_transfers(list(net.values()))
+
+
+def test_exact_beats_greedy_when_subgroups_cancel():
+    # {2, 4} and {1, 3, 5} each net to zero: 3 transfers instead of 4.
+    net = {1: -300, 2: 500, 3: -300, 4: -500, 5: 600}
+    assert len(greedy_settlements(net)) == 4
+    assert len(exact_settlements(net)) == 3
+    assert _settled(net, exact_settlements(net)) == {}
+
+
+def _group_with_members(client, count: int) -> tuple[int, list[int]]:
+    # One equal expense leaves every member with a nonzero position.
+    users = create_users(client, [f"member {count}.{i}" for i in range(count)])
+    group_id = create_group(client, f"group of {count}", users)
+    add_expense(client, group_id, users[0], count * 10.0)
+    return group_id, users
+
+
+def test_simplified_balances_settle_the_group(client, dataset):
+    group_id = dataset["groups"][1]
+    raw = client.get(f"/groups/{group_id}/balances").json()
+    net = {}
+    for row in raw:
+        cents = round(row["amount"] * 100)
+        net[row["from_user"]] = net.get(row["from_user"], 0) - cents
+        net[row["to_user"]] = net.get(row["to_user"], 0) + cents
+
+    for query in ("simplify=true", "simplify=true&exact=true"):
+        response = client.get(f"/groups/{group_id}/balances?{query}")
+        assert response.status_code == 200, response.text
+        transfers = response.json()
+        assert _settled(net, transfers) == {}
+        assert len(transfers) <= len([cents for cents in net.values() if cents]) - 1
+
+
+def test_exact_is_limited_to_small_groups(client):
+    group_id, _ = _group_with_members(client, EXACT_SETTLEMENT_MAX_MEMBERS)
+    response = client.get(f"/groups/{group_id}/balances?simplify=true&exact=true")
+    assert response.status_code == 200
+    assert len(response.json()) == EXACT_SETTLEMENT_MAX_MEMBERS - 1
+
+    group_id, _ = _group_with_members(client, EXACT_SETTLEMENT_MAX_MEMBERS + 1)
+    response = client.get(f"/groups/{group_id}/balances?simplify=true&exact=true")
+    assert response.status_code == 400
+    assert client.get(f"/groups/{group_id}/balances?simplify=true").status_code == 200
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("get", "/groups/{group_id}/balances?exact=true", None),
+    ("post", "/balances/query", {"exact": True}),
+])
+def test_exact_requires_simplify(client, dataset, method, path, body):
+    group_id = dataset["groups"][0]
+    if body is not None:
+        body = {**body, "group_ids": [group_id]}
+    response = client.request(method.upper(), path.format(group_id=group_id), json=body)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "exact requires simplify"
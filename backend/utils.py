@@ -1,7 +1,15 @@
+from datetime import datetime, timezone
 from models import *
-from typing import Callable, List,Optional,Any
+from typing import Callable, Iterable, List,Optional,Any
+import orjson
 from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from database import get_db, SessionLocal
+from services.money_services import from_cents
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
 
 
 def wrapped_get_all_entities(
@@ -23,6 +31,67 @@ def wrapped_get_all_entities(
         db.close()
 
 
+def keyset_page(query, key_column, after: Optional[int] = None, limit: Optional[int] = None):
+    # Keyset pagination on an increasing id: cost stays flat however deep
+    # the page is, unlike OFFSET.
+    query = query.order_by(key_column)
+    if after is not None:
+        query = query.filter(key_column > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+class FastJSONResponse(JSONResponse):
+    # Listing routes build plain dicts from column rows and return this
+    # directly, so FastAPI skips response_model validation and
+    # jsonable_encoder and the body is encoded once, straight to bytes.
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def set_next_cursor(response: Response, items: List[Any], limit: Optional[int], key: str = "id") -> None:
+    if limit is not None and items and len(items) == limit:
+        last = items[-1]
+        cursor = last[key] if isinstance(last, dict) else getattr(last, key)
+        response.headers["X-Next-Cursor"] = str(cursor)
+
+
+def ndjson_response(producer: Callable[..., Iterable[dict]], *args) -> StreamingResponse:
+    # The request-scoped session may be closed before the body is sent, so
+    # the stream owns its own session. Producers validate eagerly and return
+    # a generator, so a 404 still surfaces as a normal error response.
+    db = SessionLocal()
+    try:
+        items = producer(db, *args)
+    except Exception:
+        db.close()
+        raise
+
+    def generate():
+        try:
+            for item in items:
+                yield orjson.dumps(item) + b"\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Naive values are taken as UTC. SQLite keeps timestamps without an
+    # offset, so everything compared against created_at is converted first.
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+# Serializers read attributes only, so they take ORM objects and column rows
+# (select(User.id, User.name) and the like) alike. Listings select just the
+# columns they return and map the rows here.
 
 def serialize_user(user: User) -> dict:
     return {"id": user.id, "name": user.name}
@@ -32,6 +101,15 @@ def serialize_group(group: Group) -> dict:
     return {"id": group.id, "name": group.name}
 
 
+def serialize_group_detail(group: Group, members: list, total_expenses: float) -> dict:
+    return {
+        "id": group.id,
+        "name": group.name,
+        "users": [serialize_user(member) for member in members],
+        "total_expenses": total_expenses,
+    }
+
+
 def serialize_group_member(member: GroupMember) -> dict:
     return {"group_id": member.group_id, "user_id": member.user_id}
 
@@ -41,9 +119,25 @@ def serialize_expense(expense: Expense) -> dict:
         "id": expense.id,
         "group_id": expense.group_id,
         "description": expense.description,
-        "amount": expense.amount,
+        "amount": from_cents(expense.amount_cents),
+        "currency": expense.currency,
+        "paid_by": expense.paid_by,
+        "split_type": expense.split_type.value,
+        "created_at": as_utc(expense.created_at).isoformat(),
+    }
+
+
+def serialize_expense_detail(expense: Expense, splits: list) -> dict:
+    # An expense as listed under its group: without group_id, with its splits.
+    return {
+        "id": expense.id,
+        "description": expense.description,
+        "amount": from_cents(expense.amount_cents),
+        "currency": expense.currency,
         "paid_by": expense.paid_by,
-        "split_type": expense.split_type,
+        "split_type": expense.split_type.value,
+        "created_at": as_utc(expense.created_at).isoformat(),
+        "splits": serialize_splits(splits),
     }
 
 
@@ -53,5 +147,15 @@ def serialize_split(split: Split) -> dict:
         "expense_id": split.expense_id,
         "user_id": split.user_id,
         "percentage": split.percentage,
-        "amount_owed": split.amount_owed,
+        "amount_owed": from_cents(split.amount_owed_cents),
     }
+
+
+def serialize_splits(splits: list) -> list[dict]:
+    return [
+        {
+            "user_id": s.user_id,
+            "amount_owed": from_cents(s.amount_owed_cents),
+            "percentage": s.percentage
+        } for s in splits
+    ]
@@ -60,11 +60,18 @@ export async function postNewExpense(group_id,obj){
     }
 }
 
+// Keeps follow-up questions in the same agent conversation.
+let agentSessionId = null;
+
 export async function queryAgent(prompt){
     try{
         const response = await apiPost(`/agent/query`,{
-            "query":prompt
+            "query":prompt,
+            "session_id":agentSessionId
         });
+        if (response && response.session_id) {
+            agentSessionId = response.session_id;
+        }
         return response;
     }catch(error){
         console.log(error.message);